@@ -83,6 +83,10 @@ from bitdust.crypt import my_keys
 
 #------------------------------------------------------------------------------
 
+_BinaryMagic = b'\x00BEB'
+
+#------------------------------------------------------------------------------
+
 
 class Block(object):
 
@@ -149,6 +153,8 @@ class Block(object):
         else:
             self.Length = len(Data)
             self.EncryptedData = key.EncryptWithSessionKey(SessionKey, Data, session_key_type=self.SessionKeyType)
+        # cached hash value, see `GenerateHash()`
+        self._hash = None
         if Signature:
             self.Signature = Signature
         else:
@@ -178,34 +184,52 @@ class Block(object):
             return my_keys.decrypt(strng.to_text(self.DecryptKey), self.EncryptedSessionKey)
         return key.DecryptLocalPrivateKey(self.EncryptedSessionKey)
 
+    def GenerateHashParts(self):
+        """
+        Returns a list of strings with all data fields and separators, used to create a hash
+        for that ``encrypted_block``.
+        """
+        sep = b'::::'
+        return [
+            self.CreatorID.to_original(),
+            sep,
+            strng.to_bin(self.BackupID),
+            sep,
+            strng.to_bin(str(self.BlockNumber)),
+            sep,
+            strng.to_bin(self.SessionKeyType),
+            sep,
+            strng.to_bin(self.EncryptedSessionKey),
+            sep,
+            strng.to_bin(str(self.Length)),
+            sep,
+            strng.to_bin(str(self.LastBlock)),
+            sep,
+            strng.to_bin(self.EncryptedData),
+        ]
+
     def GenerateHashBase(self):
         """
         Generate a single string with all data fields, used to create a hash
         for that ``encrypted_block``.
         """
-        sep = b'::::'
-        StringToHash = b''
-        StringToHash += self.CreatorID.to_original()
-        StringToHash += sep + strng.to_bin(self.BackupID)
-        StringToHash += sep + strng.to_bin(str(self.BlockNumber))
-        StringToHash += sep + strng.to_bin(self.SessionKeyType)
-        StringToHash += sep + strng.to_bin(self.EncryptedSessionKey)
-        StringToHash += sep + strng.to_bin(str(self.Length))
-        StringToHash += sep + strng.to_bin(str(self.LastBlock))
-        StringToHash += sep + strng.to_bin(self.EncryptedData)
-        return StringToHash
+        return b''.join(self.GenerateHashParts())
 
     def GenerateHash(self):
         """
-        Create a hash for that ``encrypted_block`` using ``crypt.key.Hash()``.
+        Create a hash for that ``encrypted_block`` using ``crypt.key.HashParts()``.
+        The result is cached, so ``EncryptedData`` is hashed only once.
         """
-        return key.Hash(self.GenerateHashBase())
+        if self._hash is None:
+            self._hash = key.HashParts(self.GenerateHashParts())
+        return self._hash
 
     def Sign(self, signing_key):
         """
         Generate digital signature for that ``encrypted_block``.
         """
         # usually just done at packet creation
+        self._hash = None
         self.Signature = self.GenerateSignature(signing_key)
         return self
 
@@ -248,11 +272,24 @@ class Block(object):
         ClearLongData = key.DecryptWithSessionKey(SessionKey, self.EncryptedData, session_key_type=self.SessionKeyType)
         return ClearLongData[0:self.Length]  # remove padding
 
-    def Serialize(self):
+    def Serialize(self, binary=False):
         """
         Create a string that stores all data fields of that ``encrypted.Block``
         object.
+        If `binary` is True the more compact binary format is used, see `serialization.FieldsToBytes()`.
         """
+        if binary:
+            return serialization.FieldsToBytes(_BinaryMagic, [
+                self.CreatorID.to_original(),
+                strng.to_bin(self.BackupID),
+                strng.to_bin(str(self.BlockNumber)),
+                b'1' if self.LastBlock else b'0',
+                strng.to_bin(self.EncryptedSessionKey),
+                strng.to_bin(self.SessionKeyType),
+                strng.to_bin(str(self.Length)),
+                strng.to_bin(self.EncryptedData),
+                strng.to_bin(self.Signature),
+            ])
         dct = {
             'c': self.CreatorID.to_text(),
             'b': self.BackupID,
@@ -275,7 +312,10 @@ class Block(object):
 def Unserialize(data, decrypt_key=None):
     """
     A method to create a ``encrypted.Block`` instance from input string.
+    Both JSON and binary formats are accepted, the format is detected automatically.
     """
+    if serialization.IsBinaryFormat(_BinaryMagic, data):
+        return _UnserializeBinary(data, decrypt_key=decrypt_key)
     dct = serialization.BytesToDict(data, keys_to_text=True, encoding='utf-8')
     if _Debug:
         lg.out(_DebugLevel, 'encrypted.Unserialize %s' % repr(dct)[:100])
@@ -317,3 +357,24 @@ def Unserialize(data, decrypt_key=None):
         lg.exc()
         return None
     return newobject
+
+
+def _UnserializeBinary(data, decrypt_key=None):
+    try:
+        _c, _b, _n, _e, _k, _t, _l, _p, _s = serialization.BytesToFields(_BinaryMagic, data)
+        newobject = Block(
+            CreatorID=id_url.field(_c),
+            BackupID=strng.to_text(_b),
+            BlockNumber=int(_n),
+            LastBlock=(_e == b'1'),
+            EncryptedSessionKey=_k,
+            SessionKeyType=strng.to_text(_t),
+            Length=int(_l),
+            EncryptedData=_p,
+            Signature=_s,
+            DecryptKey=decrypt_key,
+        )
+    except:
+        lg.exc()
+        return None
+    return newobject
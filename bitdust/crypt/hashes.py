@@ -91,6 +91,25 @@ def sha1(inp, hexdigest=False, return_object=False):
     return h.digest()
 
 
+def sha1_parts(parts, hexdigest=False):
+    """
+    Calculates SHA1 hash of the concatenation of all byte strings from `parts` iterable.
+    Every part is fed into the hash object one by one, so the input is never copied into a single string.
+    Produces exactly same result as `sha1(b''.join(parts))`.
+    """
+    h = SHA1.new()
+    for part in parts:
+        if not strng.is_bin(part):
+            raise ValueError('input must by byte string')
+        h.update(part)
+    if _Debug:
+        if _CryptoLog:
+            lg.args(_DebugLevel, hexdigest=h.hexdigest())
+    if hexdigest:
+        return strng.to_bin(h.hexdigest())
+    return h.digest()
+
+
 def sha256(inp, hexdigest=False, return_object=False):
     global _CryptoLog
     # if _CryptoLog is None:
@@ -48,6 +48,9 @@ import os
 import sys
 import gc
 import tempfile
+import threading
+
+from collections import OrderedDict
 
 #------------------------------------------------------------------------------
 
@@ -59,6 +62,8 @@ if __name__ == '__main__':
 
 from bitdust.logs import lg
 
+from bitdust.lib import strng
+
 from bitdust.system import bpio
 from bitdust.system import local_fs
 
@@ -72,6 +77,12 @@ from bitdust.crypt import cipher
 
 _MyKeyObject = None
 
+_PublicKeysCache = OrderedDict()
+_PublicKeysCacheLock = threading.Lock()
+_PublicKeysCacheMaxSize = 1000
+_PublicKeysCacheHits = 0
+_PublicKeysCacheMisses = 0
+
 #------------------------------------------------------------------------------
 
 
@@ -247,8 +258,7 @@ def VerifySignature(pubkeystring, hashcode, signature):
 
     Return True if signature is correct, otherwise False.
     """
-    pub_key = rsa_key.RSAKey()
-    pub_key.fromString(pubkeystring)
+    pub_key = PublicKeyObject(pubkeystring)
     result = pub_key.verify(signature, hashcode, context='crypt.key.VerifySignature')
     return result
 
@@ -267,6 +277,54 @@ def Verify(ConIdentity, hashcode, signature):
 #------------------------------------------------------------------------------
 
 
+def PublicKeyObject(pubkeystring):
+    """
+    Returns ``rsa_key.RSAKey`` object for given Public Key in openssh format.
+
+    Parsed objects are kept in a LRU cache with a digest of the key string used as a key,
+    so the same public key is not imported again for every incoming packet.
+    Can be called from multiple threads.
+    """
+    global _PublicKeysCacheHits
+    global _PublicKeysCacheMisses
+    digest = hashes.sha1(strng.to_bin(pubkeystring))
+    with _PublicKeysCacheLock:
+        pub_key = _PublicKeysCache.get(digest)
+        if pub_key is not None:
+            _PublicKeysCache.move_to_end(digest)
+            _PublicKeysCacheHits += 1
+            return pub_key
+        _PublicKeysCacheMisses += 1
+    pub_key = rsa_key.RSAKey()
+    pub_key.fromString(pubkeystring)
+    with _PublicKeysCacheLock:
+        _PublicKeysCache[digest] = pub_key
+        while len(_PublicKeysCache) > _PublicKeysCacheMaxSize:
+            _PublicKeysCache.popitem(last=False)
+    return pub_key
+
+
+def PublicKeysCacheInfo():
+    return {
+        'size': len(_PublicKeysCache),
+        'max_size': _PublicKeysCacheMaxSize,
+        'hits': _PublicKeysCacheHits,
+        'misses': _PublicKeysCacheMisses,
+    }
+
+
+def ClearPublicKeysCache():
+    global _PublicKeysCacheHits
+    global _PublicKeysCacheMisses
+    with _PublicKeysCacheLock:
+        _PublicKeysCache.clear()
+        _PublicKeysCacheHits = 0
+        _PublicKeysCacheMisses = 0
+
+
+#------------------------------------------------------------------------------
+
+
 def HashMD5(inp, hexdigest=False):
     """
     Use MD5 method to calculate the hash of ``inp`` string.
@@ -296,6 +354,14 @@ def Hash(inp, hexdigest=False):
     return HashSHA(inp, hexdigest=hexdigest)
 
 
+def HashParts(parts, hexdigest=False):
+    """
+    Same as ``Hash()`` but takes a list of strings and calculates the hash incrementally.
+    The result is equal to ``Hash(b''.join(parts))``.
+    """
+    return hashes.sha1_parts(parts, hexdigest=hexdigest)
+
+
 #------------------------------------------------------------------------------
 
 
@@ -346,8 +412,7 @@ def EncryptOpenSSHPublicKey(pubkeystring, inp):
     """
     Encrypt ``inp`` string with given Public Key.
     """
-    pub_key = rsa_key.RSAKey()
-    pub_key.fromString(pubkeystring)
+    pub_key = PublicKeyObject(pubkeystring)
     result = pub_key.encrypt(inp)
     return result
 
@@ -0,0 +1,300 @@
+#!/usr/bin/python
+# signature_verifier.py
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (signature_verifier.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+#
+#
+#
+#
+"""
+..
+
+module:: signature_verifier
+
+Verifies signatures of incoming packets in a pool of child processes.
+
+When "services/gateway/verify-child-processes-enabled" option is enabled and a lot of packets are arriving,
+signatures are collected into batches and verified in child processes using multiple CPU cores.
+When only few packets are arriving signatures are still verified right away in the main thread.
+
+Results are always delivered in the same order as packets were received from every remote peer.
+"""
+
+#------------------------------------------------------------------------------
+
+from __future__ import absolute_import
+
+#------------------------------------------------------------------------------
+
+_Debug = False
+_DebugLevel = 10
+
+#------------------------------------------------------------------------------
+
+import time
+import multiprocessing
+
+from collections import deque
+from concurrent import futures
+
+#------------------------------------------------------------------------------
+
+from twisted.internet import reactor  # @UnresolvedImport
+from twisted.internet.defer import Deferred
+
+#------------------------------------------------------------------------------
+
+from bitdust.logs import lg
+
+from bitdust.system import bpio
+
+from bitdust.main import config
+
+from bitdust.p2p import commands
+
+from bitdust.contacts import contactsdb
+
+from bitdust.crypt import key
+
+from bitdust.userid import id_url
+
+#------------------------------------------------------------------------------
+
+_Pool = None
+_PoolSize = 0
+_PendingItems = []
+_PeersQueues = {}
+_BatchesInFlight = 0
+_SubmitTask = None
+_MaxBatchSize = 50
+_InlineRateLimit = 200
+_RateWindowStarted = 0
+_RateCounter = 0
+_Counters = {
+    'inline': 0,
+    'offloaded': 0,
+    'batches': 0,
+}
+
+#------------------------------------------------------------------------------
+
+
+def init(ncpus=None):
+    global _Pool
+    global _PoolSize
+    if ncpus is None:
+        ncpus = get_ncpus()
+    if ncpus <= 0:
+        return False
+    if _Pool:
+        lg.warn('pool of child processes already started')
+        return True
+    try:
+        # child processes must not inherit running reactor and threads of the main process
+        _Pool = futures.ProcessPoolExecutor(max_workers=ncpus, mp_context=multiprocessing.get_context('spawn'))
+    except:
+        lg.exc()
+        _Pool = None
+        return False
+    _PoolSize = ncpus
+    lg.info('started %d child processes to verify signatures of incoming packets' % ncpus)
+    return True
+
+
+def shutdown():
+    global _Pool
+    global _PoolSize
+    global _SubmitTask
+    if _SubmitTask and _SubmitTask.active():
+        _SubmitTask.cancel()
+    _SubmitTask = None
+    if _Pool:
+        _Pool.shutdown(wait=False)
+        _Pool = None
+        _PoolSize = 0
+    # those were not yet sent to child processes
+    pending = list(_PendingItems)
+    del _PendingItems[:]
+    _on_batch_verified([_verify_inline(params) for _, _, params in pending], pending)
+
+
+def get_ncpus():
+    """
+    Returns number of child processes to be used to verify signatures or 0 if all must be verified in the main thread.
+    """
+    if bpio.Android():
+        return 0
+    if not config.conf() or not config.conf().getBool('services/gateway/verify-child-processes-enabled', False):
+        return 0
+    ncpus = config.conf().getInt('services/gateway/verify-child-processes-ncpus', 0)
+    if ncpus <= 0:
+        # keep one CPU core for the main process
+        ncpus = max(1, bpio.detect_number_of_cpu_cores() - 1)
+    return ncpus
+
+
+def is_active():
+    return _Pool is not None
+
+
+def counters():
+    return dict(_Counters)
+
+
+#------------------------------------------------------------------------------
+
+
+def verify(newpacket):
+    """
+    Returns Deferred object to be fired with True or False after signature of the incoming packet is verified.
+    Packets from the same creator are always reported in the same order as they were passed here.
+    """
+    params = None
+    if newpacket.Ready() and commands.IsCommand(newpacket.Command):
+        creator_identity = contactsdb.get_contact_identity(newpacket.CreatorID)
+        if creator_identity is None:
+            lg.err('could not get Identity for %r so returning False' % newpacket.CreatorID)
+        else:
+            params = (creator_identity.publickey, newpacket.GenerateHash(), newpacket.Signature)
+    return verify_signature(id_url.to_bin(newpacket.CreatorID), params)
+
+
+def verify_signature(peer, params):
+    """
+    The ``params`` is a tuple (public_key, hashcode, signature) or None if the packet is already known as not valid.
+    Returns Deferred object.
+    """
+    d = Deferred()
+    entry = [d, False, None]
+    if peer not in _PeersQueues:
+        _PeersQueues[peer] = deque()
+    queue = _PeersQueues[peer]
+    queue.append(entry)
+    if params is None:
+        entry[1] = True
+        entry[2] = False
+        _deliver(peer)
+        return d
+    if _Pool is None or (len(queue) == 1 and not _is_busy()):
+        _Counters['inline'] += 1
+        entry[1] = True
+        entry[2] = _verify_inline(params)
+        _deliver(peer)
+        return d
+    _Counters['offloaded'] += 1
+    _PendingItems.append((peer, entry, params))
+    _schedule_submit()
+    return d
+
+
+#------------------------------------------------------------------------------
+
+
+def _is_busy():
+    global _RateWindowStarted
+    global _RateCounter
+    now = time.time()
+    if now - _RateWindowStarted > 1.0:
+        _RateWindowStarted = now
+        _RateCounter = 0
+    _RateCounter += 1
+    return _RateCounter > _InlineRateLimit or bool(_PendingItems) or _BatchesInFlight > 0
+
+
+def _verify_inline(params):
+    try:
+        return key.VerifySignature(*params)
+    except:
+        lg.exc()
+    return False
+
+
+def _deliver(peer):
+    queue = _PeersQueues.get(peer)
+    while queue and queue[0][1]:
+        d, _, result = queue.popleft()
+        d.callback(result)
+    if not queue and _PeersQueues.get(peer) is queue:
+        _PeersQueues.pop(peer, None)
+
+
+def _schedule_submit():
+    global _SubmitTask
+    if _SubmitTask is None or not _SubmitTask.active():
+        # all packets received during current reactor iteration are collected into one batch
+        _SubmitTask = reactor.callLater(0, _submit)  # @UndefinedVariable
+
+
+def _submit():
+    global _BatchesInFlight
+    while _Pool and _PendingItems and _BatchesInFlight < _PoolSize*2:
+        batch = _PendingItems[:_MaxBatchSize]
+        del _PendingItems[:_MaxBatchSize]
+        try:
+            future = _Pool.submit(verify_batch, [params for _, _, params in batch])
+        except:
+            lg.exc()
+            _on_batch_verified([_verify_inline(params) for _, _, params in batch], batch)
+            continue
+        _BatchesInFlight += 1
+        _Counters['batches'] += 1
+        future.add_done_callback(lambda f, batch=batch: reactor.callFromThread(_on_batch_done, f, batch))  # @UndefinedVariable
+        if _Debug:
+            lg.args(_DebugLevel, batch=len(batch), pending=len(_PendingItems), in_flight=_BatchesInFlight)
+
+
+def _on_batch_done(future, batch):
+    global _BatchesInFlight
+    _BatchesInFlight -= 1
+    try:
+        results = future.result()
+    except:
+        lg.exc()
+        results = [_verify_inline(params) for _, _, params in batch]
+    _on_batch_verified(results, batch)
+    if _PendingItems:
+        _submit()
+
+
+def _on_batch_verified(results, batch):
+    peers = set()
+    for i in range(len(batch)):
+        peer, entry, _ = batch[i]
+        entry[1] = True
+        entry[2] = results[i]
+        peers.add(peer)
+    for peer in peers:
+        _deliver(peer)
+
+
+#------------------------------------------------------------------------------
+
+
+def verify_batch(items):
+    """
+    Executed in a child process, returns list of results in the same order.
+    """
+    results = []
+    for pubkeystring, hashcode, signature in items:
+        try:
+            results.append(key.VerifySignature(pubkeystring, hashcode, signature))
+        except:
+            results.append(False)
+    return results
@@ -80,6 +80,10 @@ from bitdust.userid import id_url
 
 #------------------------------------------------------------------------------
 
+_BinaryMagic = b'\x00BSP'
+
+#------------------------------------------------------------------------------
+
 
 class Packet(object):
 
@@ -131,6 +135,11 @@ class Packet(object):
         self.RemoteID = id_url.field(RemoteID)
         # which private key to use to generate signature
         self.KeyID = strng.to_text(KeyID or my_id.getGlobalID(key_alias='master'))
+        # cached values, calculated only once, see `GenerateHash()` and `__len__()`
+        self._hash = None
+        self._length = None
+        # bytes the packet was unserialized from, see `SerializedSource()`
+        self._raw = None
         if Signature:
             self.Signature = Signature
         else:
@@ -153,36 +162,49 @@ class Packet(object):
         Call ``GenerateSignature`` and save the result.
         Usually just done at packet creation.
         """
+        self._hash = None
+        self._length = None
+        self._raw = None
         self.Signature = self.GenerateSignature()
         return self
 
-    def GenerateHashBase(self):
+    def GenerateHashParts(self):
         """
-        This make a long string containing all needed fields of ``packet``
-        (without Signature).
-        Just to be able to generate a hash of the whole packet .
+        Returns a list of strings containing all needed fields of ``packet``
+        (without Signature) in the right order with separators.
+        The whole ``Payload`` is not copied here.
         """
         sep = b'-'
-        stufftosum = b''
         try:
-            stufftosum += strng.to_bin(self.Command)
-            stufftosum += sep
-            stufftosum += self.OwnerID.original()
-            stufftosum += sep
-            stufftosum += self.CreatorID.original()
-            stufftosum += sep
-            stufftosum += strng.to_bin(self.PacketID)
-            stufftosum += sep
-            stufftosum += strng.to_bin(self.Date)
-            stufftosum += sep
-            stufftosum += strng.to_bin(self.Payload)
-            stufftosum += sep
-            stufftosum += self.RemoteID.original()
-            stufftosum += sep
-            stufftosum += strng.to_bin(self.KeyID)
+            parts = [
+                strng.to_bin(self.Command),
+                sep,
+                self.OwnerID.original(),
+                sep,
+                self.CreatorID.original(),
+                sep,
+                strng.to_bin(self.PacketID),
+                sep,
+                strng.to_bin(self.Date),
+                sep,
+                strng.to_bin(self.Payload),
+                sep,
+                self.RemoteID.original(),
+                sep,
+                strng.to_bin(self.KeyID),
+            ]
         except Exception as exc:
             lg.exc()
             raise exc
+        return parts
+
+    def GenerateHashBase(self):
+        """
+        This make a long string containing all needed fields of ``packet``
+        (without Signature).
+        Just to be able to generate a hash of the whole packet .
+        """
+        stufftosum = b''.join(self.GenerateHashParts())
 #         if _Debug:
 #             if _LogSignVerify:
 #                 try:
@@ -194,9 +216,13 @@ class Packet(object):
 
     def GenerateHash(self):
         """
-        Call ``crypt.key.Hash`` to create a hash code for that ``packet``.
+        Call ``crypt.key.HashParts`` to create a hash code for that ``packet``.
+        Fields are fed into the hash one by one and the result is cached,
+        so signature creation and verification do not hash the payload again.
         """
-        return key.Hash(self.GenerateHashBase())
+        if self._hash is None:
+            self._hash = key.HashParts(self.GenerateHashParts())
+        return self._hash
 
     def GenerateSignature(self):
         """
@@ -327,11 +353,25 @@ class Packet(object):
         """
         return packetid.SupplierNumber(self.PacketID)
 
-    def Serialize(self):
+    def Serialize(self, binary=False):
         """
         Create a string from packet object.
         This is useful when need to save the packet on disk or send via network.
+        If `binary` is True the more compact binary format is used, see `serialization.FieldsToBytes()`,
+        remote node must support it - use `IsBinaryFormatSupported()` to check.
         """
+        if binary:
+            return serialization.FieldsToBytes(_BinaryMagic, [
+                strng.to_bin(self.Command),
+                self.OwnerID.to_original(),
+                self.CreatorID.to_original(),
+                strng.to_bin(self.PacketID),
+                strng.to_bin(self.Date),
+                self.Payload,
+                self.RemoteID.to_original(),
+                strng.to_bin(self.KeyID),
+                strng.to_bin(self.Signature),
+            ])
         dct = {
             'm': self.Command,
             'o': self.OwnerID.original(),
@@ -350,11 +390,30 @@ class Packet(object):
         #         nameurl.GetName(self.CreatorID), nameurl.GetName(self.RemoteID), self.KeyID, dct['s']))
         return src
 
+    def SerializedSource(self, binary=True, release=False):
+        """
+        Returns exactly the same bytes the packet was received as, so it can be saved on disk
+        without serializing it again. Only kept for incoming ``Data()`` packets,
+        for all other packets ``Serialize()`` is called.
+        If `binary` is False and the packet was received in binary format it is serialized again in JSON.
+        If `release` is True the packet does not keep those bytes anymore, call it when they are consumed.
+        """
+        raw = self._raw
+        if release:
+            self._raw = None
+        if raw is None:
+            return self.Serialize()
+        if not binary and serialization.IsBinaryFormat(_BinaryMagic, raw):
+            return self.Serialize()
+        return raw
+
     def __len__(self):
         """
         Return a length of serialized packet .
         """
-        return len(self.Serialize())
+        if self._length is None:
+            self._length = len(self.Serialize())
+        return self._length
 
 
 def Unserialize(data):
@@ -362,28 +421,41 @@ def Unserialize(data):
     We expect here a string containing a whole packet object in text form.
     Will return a real object in the memory from given string.
     All class fields are loaded, signature can be verified to be sure - it was truly original string.
+    Both JSON and binary formats are accepted, the format is detected automatically.
     """
     if data is None:
         return None
 
-    dct = serialization.BytesToDict(data, keys_to_text=True, encoding='latin1')
+    if serialization.IsBinaryFormat(_BinaryMagic, data):
+        try:
+            Command, OwnerID, CreatorID, PacketID, Date, Payload, RemoteID, KeyID, Signature = serialization.BytesToFields(_BinaryMagic, data)
+        except:
+            lg.exc()
+            return None
+    else:
+        dct = serialization.BytesToDict(data, keys_to_text=True, encoding='latin1')
 
-    # if _Debug:
-    #     lg.out(_DebugLevel, 'signed.Unserialize %d bytes : %r' % (len(data), dct['s']))
+        # if _Debug:
+        #     lg.out(_DebugLevel, 'signed.Unserialize %d bytes : %r' % (len(data), dct['s']))
 
-    try:
-        Command = strng.to_text(dct['m'])
-        OwnerID = dct['o']
-        CreatorID = dct['c']
-        PacketID = strng.to_text(dct['i'])
-        Date = strng.to_text(dct['d'])
-        Payload = dct['p']
-        RemoteID = dct['r']
-        KeyID = strng.to_text(dct['k'])
-        Signature = dct['s']
-    except:
-        lg.exc()
-        return None
+        try:
+            Command = dct['m']
+            OwnerID = dct['o']
+            CreatorID = dct['c']
+            PacketID = dct['i']
+            Date = dct['d']
+            Payload = dct['p']
+            RemoteID = dct['r']
+            KeyID = dct['k']
+            Signature = dct['s']
+        except:
+            lg.exc()
+            return None
+
+    Command = strng.to_text(Command)
+    PacketID = strng.to_text(PacketID)
+    Date = strng.to_text(Date)
+    KeyID = strng.to_text(KeyID)
 
     try:
         newobject = Packet(
@@ -417,9 +489,22 @@ def Unserialize(data):
     # if _Debug:
     #     lg.args(_DebugLevel, Command=Command, PacketID=PacketID, OwnerID=OwnerID, CreatorID=CreatorID, RemoteID=RemoteID)
 
+    if Command == commands.Data():
+        # supplier will store that packet on disk exactly as it was received
+        newobject._raw = strng.to_bin(data)
+
     return newobject
 
 
+def IsBinaryFormatSupported(remote_identity):
+    """
+    Returns True if remote node announced in the identity "version" field that it is able to read binary packets.
+    """
+    if not remote_identity:
+        return False
+    return serialization.BINARY_FORMAT_FEATURE in remote_identity.getVersionStr().split(' ')
+
+
 def MakePacket(Command, OwnerID, CreatorID, PacketID, Payload, RemoteID):
     """
     Just calls the constructor of packet class.
@@ -294,12 +294,14 @@ class ListFilesOrator(automat.Automat):
         """
         Action method.
         """
+        from bitdust.storage import backup_matrix
         supplier_idurl = args[0]
         if _Debug:
             lg.out(_DebugLevel, 'list_files_orator.doRequestFilesOneSupplier from %s' % supplier_idurl)
         outpacket = p2p_service.SendListFiles(
             target_supplier=supplier_idurl,
             customer_idurl=self.target_customer_idurl,
+            revision=backup_matrix.GetListFilesRevision(supplier_idurl, customer_idurl=self.target_customer_idurl),
             timeout=settings.P2PTimeOut(),
         )
         if outpacket:
@@ -309,6 +311,7 @@ class ListFilesOrator(automat.Automat):
 
     def _do_request(self, x=None):
         from bitdust.raid import eccmap
+        from bitdust.storage import backup_matrix
         self.received_lf_counter = 0
         self.requested_lf_packet_ids.clear()
         known_suppliers = contactsdb.suppliers(customer_idurl=self.target_customer_idurl)
@@ -325,6 +328,7 @@ class ListFilesOrator(automat.Automat):
                     outpacket = p2p_service.SendListFiles(
                         target_supplier=idurl,
                         customer_idurl=self.target_customer_idurl,
+                        revision=backup_matrix.GetListFilesRevision(idurl, customer_idurl=self.target_customer_idurl),
                         timeout=settings.P2PTimeOut(),
                     )
                     if outpacket:
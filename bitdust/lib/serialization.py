@@ -26,11 +26,26 @@ from __future__ import absolute_import
 
 #------------------------------------------------------------------------------
 
+import struct
+
+#------------------------------------------------------------------------------
+
 from bitdust.lib import jsn
 from bitdust.lib import strng
 
 #------------------------------------------------------------------------------
 
+# current version of the binary format, see `FieldsToBytes()`
+BINARY_FORMAT_VERSION = 1
+
+# this token is placed into the identity "version" field to let other nodes know
+# that binary format is supported by our software
+BINARY_FORMAT_FEATURE = 'binser%d' % BINARY_FORMAT_VERSION
+
+_FieldLength = struct.Struct('>I')
+
+#------------------------------------------------------------------------------
+
 
 def DictToBytes(dct, encoding='latin1', errors='strict', keys_to_text=False, values_to_text=False, pack_types=False, indent=None, to_text=False):
     """
@@ -80,3 +95,56 @@ def BytesToDict(inp, encoding='latin1', errors='strict', keys_to_text=False, val
     if keys_to_text:
         return jsn.dict_keys_to_text(jsn.loads(_t, encoding=encoding))
     return jsn.loads(_t, encoding=encoding)
+
+
+def FieldsToBytes(magic, fields):
+    """
+    Builds binary output from a list of fields, every field must be a bytes-like object.
+    Output starts with `magic` prefix and `BINARY_FORMAT_VERSION` byte,
+    then every field is written with 4 bytes length prefix.
+    Binary values are written "as is" without any escaping, so output is only slightly longer than the input.
+    """
+    parts = [magic, struct.pack('>B', BINARY_FORMAT_VERSION)]
+    for field in fields:
+        parts.append(_FieldLength.pack(len(field)))
+        parts.append(field)
+    return b''.join(parts)
+
+
+def BytesToFields(magic, inp):
+    """
+    Opposite method to `FieldsToBytes()`, returns a list of binary fields.
+    Raises `ValueError` if input is not valid or was built with an unknown version of the format.
+    """
+    inp = memoryview(inp)
+    pos = len(magic)
+    if inp[:pos] != magic:
+        raise ValueError('wrong binary format prefix')
+    if len(inp) < pos + 1:
+        raise ValueError('binary input is too short')
+    version = inp[pos]
+    if version != BINARY_FORMAT_VERSION:
+        raise ValueError('unknown binary format version %r' % version)
+    pos += 1
+    total = len(inp)
+    fields = []
+    while pos < total:
+        if pos + _FieldLength.size > total:
+            raise ValueError('binary input is truncated')
+        field_length = _FieldLength.unpack_from(inp, pos)[0]
+        pos += _FieldLength.size
+        if pos + field_length > total:
+            raise ValueError('binary input is truncated')
+        fields.append(inp[pos:pos + field_length].tobytes())
+        pos += field_length
+    return fields
+
+
+def IsBinaryFormat(magic, inp):
+    """
+    Returns True if input bytes were built with `FieldsToBytes()` and given `magic` prefix.
+    JSON output of `DictToBytes()` always starts with "{" so there is no ambiguity.
+    """
+    if not inp:
+        return False
+    return bytes(inp[:len(magic)]) == magic
@@ -49,6 +49,7 @@ import os
 import sys
 import time
 from io import open
+from concurrent import futures
 
 #------------------------------------------------------------------------------
 
@@ -124,6 +125,7 @@ from bitdust.logs import lg
 from bitdust.system import bpio
 
 from bitdust.lib import misc
+from bitdust.lib import jsn
 
 from bitdust.crypt import signed
 
@@ -131,12 +133,34 @@ from bitdust.storage import accounting
 
 from bitdust.main import settings
 
+from bitdust.supplier import files_index
+from bitdust.supplier import data_writer
+from bitdust.supplier import list_files
+
 from bitdust.userid import global_id
 from bitdust.userid import id_url
+from bitdust.userid import id_verified
 
 #-------------------------------------------------------------------------------
 
 
+def _journal_removed(path):
+    """
+    Customer requesting only recent changes with ListFiles() must also know about files removed here.
+    """
+    customer, key_alias, subpath = files_index.split_filename(path)
+    if not customer:
+        return
+    customer_idurl = global_id.GlobalUserToIDURL(customer)
+    if not customer_idurl:
+        return
+    if not subpath:
+        # the whole folder was removed, customer will have to request the full list of files
+        list_files.journal_erase(customer_idurl)
+        return
+    list_files.journal_record(customer_idurl, '-', key_alias, subpath)
+
+
 def SpaceTime():
     """
     Test all packets for each customer.
@@ -157,7 +181,8 @@ def SpaceTime():
             printlog('SpaceTime ERROR customers folder not exist: %r' % customers_dir)
         return False
     remove_list = {}
-    used_space = accounting.read_customers_usage()
+    used_space = accounting.start_customers_usage_scan()
+    indexed = files_index.is_ready()
     for customer_filename in os.listdir(customers_dir):
         onecustdir = os.path.join(customers_dir, customer_filename)
         if not os.path.isdir(onecustdir):
@@ -183,15 +208,20 @@ def SpaceTime():
         def cb(path, subpath, name):
             if not os.path.isfile(path):
                 return True
+            if data_writer.is_temp_file(name):
+                return False
             stats = os.stat(path)
             timedict[path] = stats.st_ctime
             sizedict[path] = stats.st_size
             return False
 
+        currentV = 0
         for key_alias in os.listdir(onecustdir):
             if not misc.ValidKeyAlias(key_alias):
                 remove_list[onecustdir] = 'invalid key alias'
                 continue
+            if indexed:
+                continue
             okekeydir = os.path.join(onecustdir, key_alias)
             bpio.traverse_dir_recursive(cb, okekeydir)
             currentV = 0
@@ -202,6 +232,7 @@ def SpaceTime():
                     continue
                 try:
                     os.remove(path)
+                    _journal_removed(path)
                     if _Debug:
                         printlog('SpaceTime %r file removed (cur:%s, max: %s)' % (path, str(currentV), str(maxspaceV)))
                 except:
@@ -209,6 +240,24 @@ def SpaceTime():
                         printlog('SpaceTime ERROR removing %r' % path)
                 # time.sleep(0.01)
 
+        if indexed:
+            # sizes and creation times of all stored files are taken from the index, starting from the most recent
+            for key_alias, path, filesize, _ in files_index.customer_files(customer_filename):
+                currentV += filesize
+                if currentV < maxspaceV:
+                    continue
+                filepath = files_index.local_filename(customer_filename, key_alias, path)
+                try:
+                    os.remove(filepath)
+                    if _Debug:
+                        printlog('SpaceTime %r file removed (cur:%s, max: %s)' % (filepath, str(currentV), str(maxspaceV)))
+                except:
+                    if _Debug:
+                        printlog('SpaceTime ERROR removing %r' % filepath)
+                if not os.path.exists(filepath):
+                    files_index.remove_path(filepath)
+                    _journal_removed(filepath)
+
         used_space[idurl.to_bin()] = str(currentV)
         timedict.clear()
         sizedict.clear()
@@ -230,6 +279,8 @@ def SpaceTime():
         if os.path.isdir(path):
             try:
                 bpio._dir_remove(path)
+                files_index.remove_path(path)
+                _journal_removed(path)
                 if _Debug:
                     printlog('SpaceTime %r dir removed (%s)' % (path, remove_list[path]))
             except:
@@ -295,6 +346,8 @@ def UpdateCustomers():
         if os.path.isdir(path):
             try:
                 bpio._dir_remove(path)
+                files_index.remove_path(path)
+                _journal_removed(path)
                 if _Debug:
                     printlog('UpdateCustomers %r folder removed (%s)' % (
                         path,
@@ -327,65 +380,151 @@ def UpdateCustomers():
 #------------------------------------------------------------------------------
 
 
-def Validate():
+def _verify_packet(packetsrc):
     """
-    Check all packets to be valid.
+    Executed in the thread pool, returns the reason why stored packet is not valid or None.
     """
-    if _Debug:
-        printlog('Validate %r' % time.strftime('%a, %d %b %Y %H:%M:%S +0000'))
-    customers_dir = settings.getCustomersFilesDir()
-    if not os.path.exists(customers_dir):
-        return False
+    try:
+        p = signed.Unserialize(packetsrc)
+    except:
+        p = None
+    if p is None:
+        return 'unserialize error'
+    if not p.Valid():
+        return 'invalid packet'
+    return None
 
+
+def _customers_files(customers_dir, indexed):
+    """
+    Yields full paths of all files stored for all customers.
+    """
     for customer_filename in os.listdir(customers_dir):
         onecustdir = os.path.join(customers_dir, customer_filename)
         if not os.path.isdir(onecustdir):
             continue
+        if indexed:
+            # only files known to the index are checked, folders are not traversed at all
+            for key_alias, path, _, _ in files_index.customer_files(customer_filename, oldest_first=True):
+                yield files_index.local_filename(customer_filename, key_alias, path)
+            continue
         for key_alias_filename in os.listdir(onecustdir):
             onekeydir = os.path.join(onecustdir, key_alias_filename)
             if not os.path.isdir(onekeydir):
                 continue
+            found_files = []
 
             def cb(path, subpath, name):
                 if not os.path.isfile(path):
                     return True
-                packetsrc = bpio.ReadBinaryFile(path)
-                if not packetsrc:
-                    try:
-                        os.remove(path)  # if is is no good it is of no use to anyone
-                        if _Debug:
-                            printlog('Validate %r removed (empty file)' % path)
-                    except:
-                        if _Debug:
-                            printlog('Validate ERROR removing %r' % path)
-                        return False
-                p = signed.Unserialize(packetsrc)
-                if p is None:
-                    try:
-                        os.remove(path)  # if is is no good it is of no use to anyone
-                        if _Debug:
-                            printlog('Validate %r removed (unserialize error)' % path)
-                    except:
-                        if _Debug:
-                            printlog('Validate ERROR removing %r')
-                        return False
-                result = p.Valid()
-                packetsrc = ''
-                del p
-                if not result:
-                    try:
-                        os.remove(path)  # if is is no good it is of no use to anyone
-                        if _Debug:
-                            printlog('Validate %r removed (invalid packet)' % path)
-                    except:
-                        if _Debug:
-                            printlog('Validate ERROR removing %r' % path)
-                        return False
-                time.sleep(0.1)
+                if data_writer.is_temp_file(name):
+                    return False
+                found_files.append(path)
                 return False
 
             bpio.traverse_dir_recursive(cb, onekeydir)
+            for path in found_files:
+                yield path
+
+
+def Validate():
+    """
+    Check all packets to be valid.
+
+    Signatures are verified in a pool of threads, reading from disk is limited by
+    ``settings.getSupplierValidateFilesPerSecond()`` and ``settings.getSupplierValidateBytesPerSecond()``.
+    Every successfully validated file is remembered in ``files_index`` together with its size and modification time,
+    so it is not checked again until it is changed - interrupted check continues from the same place next time.
+    """
+    if _Debug:
+        printlog('Validate %r' % time.strftime('%a, %d %b %Y %H:%M:%S +0000'))
+    customers_dir = settings.getCustomersFilesDir()
+    if not os.path.exists(customers_dir):
+        return False
+
+    workers = settings.getSupplierValidateWorkers()
+    files_per_second = float(settings.getSupplierValidateFilesPerSecond())
+    bytes_per_second = float(settings.getSupplierValidateBytesPerSecond())
+    stats = {
+        'checked': 0,
+        'skipped': 0,
+        'removed': 0,
+        'failed': 0,
+        'bytes': 0,
+    }
+    pending = {}
+    validated = []
 
+    def remove_file(path, reason):
+        stats['removed'] += 1
+        try:
+            os.remove(path)  # if is is no good it is of no use to anyone
+            files_index.remove_path(path)
+            _journal_removed(path)
+            if _Debug:
+                printlog('Validate %r removed (%s)' % (path, reason))
+        except:
+            if _Debug:
+                printlog('Validate ERROR removing %r' % path)
+
+    def on_verified(fut):
+        path, mtime, size = pending.pop(fut)
+        try:
+            reason = fut.result()
+        except Exception as exc:
+            stats['failed'] += 1
+            if _Debug:
+                printlog('Validate ERROR verifying %r : %r' % (path, exc))
+            return
+        if reason:
+            remove_file(path, reason)
+            return
+        validated.append((path, mtime, size))
+        if len(validated) >= 100:
+            files_index.set_validated(validated)
+            del validated[:]
+
+    started = time.time()
+    pool = futures.ThreadPoolExecutor(max_workers=workers)
+    try:
+        for path in _customers_files(customers_dir, files_index.is_ready()):
+            try:
+                file_stats = os.stat(path)
+            except:
+                files_index.remove_path(path)
+                continue
+            if files_index.is_validated(path, file_stats.st_mtime, file_stats.st_size):
+                stats['skipped'] += 1
+                continue
+            packetsrc = bpio.ReadBinaryFile(path)
+            stats['checked'] += 1
+            stats['bytes'] += len(packetsrc or b'')
+            if not packetsrc:
+                remove_file(path, 'empty file')
+                continue
+            pending[pool.submit(_verify_packet, packetsrc)] = (path, file_stats.st_mtime, file_stats.st_size)
+            del packetsrc
+            if len(pending) >= workers*2:
+                done, _ = futures.wait(list(pending.keys()), return_when=futures.FIRST_COMPLETED)
+                for fut in done:
+                    on_verified(fut)
+            delay = max(stats['checked']/files_per_second, stats['bytes']/bytes_per_second) - (time.time() - started)
+            if delay > 0:
+                time.sleep(delay)
+        for fut in futures.as_completed(list(pending.keys())):
+            on_verified(fut)
+    finally:
+        pool.shutdown(wait=True)
+        if validated:
+            files_index.set_validated(validated)
+
+    duration = max(time.time() - started, 0.001)
+    stats['duration'] = round(duration, 3)
+    stats['files_per_second'] = round(stats['checked']/duration, 2)
+    stats['bytes_per_second'] = int(stats['bytes']/duration)
+    files_index.set_info('validate_stats', jsn.dumps(stats, sort_keys=True))
+    if _Debug:
+        printlog('Validate finished %r' % stats)
     return True
 
 
@@ -403,6 +542,7 @@ def main():
     lg.disable_output()
     settings.init()
     lg.set_debug_level(0)
+    id_verified.init()
     id_url.init()
     commands = {
         'update_customers': UpdateCustomers,
@@ -415,8 +555,10 @@ def main():
             printlog('ERROR wrong command: %r' % sys.argv)
         return
     cmd()
+    files_index.shutdown()
     settings.shutdown()
     id_url.shutdown()
+    id_verified.shutdown()
 
 
 #------------------------------------------------------------------------------
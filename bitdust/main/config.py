@@ -79,6 +79,8 @@ def shutdown():
         lg.out(_DebugLevel, 'config.shutdown')
     global _Config
     if _Config:
+        # cached values are stored in the class attribute and must not survive next init()
+        _Config.cache().clear()
         del _Config
         _Config = None
 
@@ -79,9 +79,11 @@ def reset(conf_obj):
     conf_obj.setDefaultValue('services/backup-db/enabled', 'true')
 
     conf_obj.setDefaultValue('services/backups/enabled', 'true')
+    conf_obj.setDefaultValue('services/backups/binary-blocks-enabled', 'false')
     conf_obj.setDefaultValue('services/backups/block-size', diskspace.MakeStringFromBytes(settings.DefaultBackupBlockSize()))
     conf_obj.setDefaultValue('services/backups/max-block-size', diskspace.MakeStringFromBytes(settings.DefaultBackupMaxBlockSize()))
     conf_obj.setDefaultValue('services/backups/max-copies', '2')
+    conf_obj.setDefaultValue('services/backups/max-blocks-in-flight', 4)
     conf_obj.setDefaultValue('services/backups/keep-local-copies-enabled', 'true')
     conf_obj.setDefaultValue('services/backups/wait-suppliers-enabled', 'true')
 
@@ -148,6 +150,8 @@ def reset(conf_obj):
 
     conf_obj.setDefaultValue('services/gateway/enabled', 'true')
     conf_obj.setDefaultValue('services/gateway/p2p-timeout', 15)
+    conf_obj.setDefaultValue('services/gateway/verify-child-processes-enabled', 'false')
+    conf_obj.setDefaultValue('services/gateway/verify-child-processes-ncpus', 0)
 
     conf_obj.setDefaultValue('services/http-connections/enabled', 'false')
     conf_obj.setDefaultValue('services/http-connections/http-port', settings.DefaultHTTPPort())
@@ -233,13 +237,21 @@ def reset(conf_obj):
     conf_obj.setDefaultValue('services/proxy-transport/current-router', '')
 
     conf_obj.setDefaultValue('services/rebuilding/enabled', 'true')
+    conf_obj.setDefaultValue('services/rebuilding/child-processes-enabled', 'false')
+    conf_obj.setDefaultValue('services/rebuilding/child-processes-ncpus', 0)
 
     conf_obj.setDefaultValue('services/restores/enabled', 'true')
+    conf_obj.setDefaultValue('services/restores/prefetch-blocks', 2)
+    conf_obj.setDefaultValue('services/restores/hedge-latency-percentile', 90)
 
     conf_obj.setDefaultValue('services/shared-data/enabled', 'true')
 
     conf_obj.setDefaultValue('services/supplier/enabled', 'true')
     conf_obj.setDefaultValue('services/supplier/donated-space', diskspace.MakeStringFromBytes(settings.DefaultDonatedBytes()))
+    conf_obj.setDefaultValue('services/supplier/fsync-enabled', 'true')
+    conf_obj.setDefaultValue('services/supplier/validate-workers', 0)
+    conf_obj.setDefaultValue('services/supplier/validate-files-per-second', settings.DefaultLocaltesterValidateFilesPerSecond())
+    conf_obj.setDefaultValue('services/supplier/validate-bytes-per-second', settings.DefaultLocaltesterValidateBytesPerSecond())
 
     conf_obj.setDefaultValue('services/supplier-contracts/enabled', 'true')
     conf_obj.setDefaultValue('services/supplier-contracts/initial-duration-hours', 6)
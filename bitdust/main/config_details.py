@@ -115,6 +115,14 @@ When you upload same file multiple times data is not overwritten - another versi
 This value indicates how many versions of same uploaded file must be stored on remote suppliers.
 The oldest copies are removed automatically. A value of `0` indicates unlimited number of versions.
 
+{services/backups/binary-blocks-enabled} compact binary format for data blocks
+Encrypted data blocks are serialized in binary form instead of JSON, this saves memory and CPU during uploads.
+Only enable this when all of your own devices are able to read the binary format, otherwise they will fail to restore the data.
+
+{services/backups/max-blocks-in-flight} number of blocks processed at once
+While one block is being read from the source, few other blocks can be encrypted and processed by the RAID workers at the same time.
+Higher values utilize CPU and disk better during large uploads, but use more memory and temporary disk space.
+
 {services/backups/wait-suppliers-enabled} extra check after 24 hours
 When critical amount of your suppliers become unreliable - your uploaded data is lost completely.
 Enable this option to wait for 24 hours after any file upload and perform an extra check of all suppliers before cleaning up the local copy.
@@ -217,6 +225,12 @@ Every incoming packet is digitally verified here, processed and sent to the unde
 {services/gateway/p2p-timeout} peer-to-peer reply timeout
 Due to network failures or slowness, signed peer-to-peer packets are considered as "undelivered" without receiving a confirmation of delivery within the specified number of seconds.
 
+{services/gateway/verify-child-processes-enabled} verify incoming packets using multiple CPU cores
+When a lot of packets are arriving, digital signatures are verified in a pool of child processes instead of the main process. This is not available on Android.
+
+{services/gateway/verify-child-processes-ncpus} number of child processes
+How many CPU cores can be used at once to verify incoming packets, set to 0 to use all CPU cores except one.
+
 {services/http-connections/enabled} HTTP enabled
 This will allow BitDust to use the HTTP protocol for service data and encrypted traffic
 
@@ -390,9 +404,21 @@ When one of your suppliers is not available for some reason, all encrypted fragm
 The `rebuilding` service will automatically download the available fragments from those suppliers that are still online, and "rebuild" the lost fragments that the new supplier receives.
 **WARNING!** At the moment when a critical number of fragments are lost, downloading data is no longer possible.
 
+{services/rebuilding/child-processes-enabled} use multiple CPU cores
+Run data encoding, decoding and rebuilding tasks in a pool of child processes instead of a single background thread. This is not available on Android.
+
+{services/rebuilding/child-processes-ncpus} number of child processes
+How many CPU cores can be used at once for data encoding, decoding and rebuilding, set to 0 to use half of all available CPU cores.
+
 {services/restores/enabled} enable data downloading
 Controls network connections and incoming data streams when downloading encrypted fragments from suppliers nodes.
 
+{services/restores/prefetch-blocks} number of blocks to download in advance
+While current block is being downloaded and decoded, fragments of that many next blocks are also requested from suppliers, set to 0 to download blocks one by one.
+
+{services/restores/hedge-latency-percentile} detect slow suppliers
+When a requested fragment is not received after a time longer than that percent of all previous responses, another fragment is requested from a different supplier to replace it.
+
 {services/shared-data/enabled} enable data sharing
 Makes possible decentralized sharing of encrypted files with other users.
 
@@ -403,6 +429,18 @@ The `supplier` service allocates a part of your disk and serves encrypted files
 {services/supplier/donated-space} donated space
 The amount of storage space you want to donate to other users.
 
+{services/supplier/fsync-enabled} flush stored files to disk
+Incoming files are written to disk in batches, when enabled every batch is flushed to the physical disk before customers are notified that files were stored.
+
+{services/supplier/validate-workers} number of threads to verify stored files
+Stored files are periodically checked and corrupted files are removed, set to 0 to choose the number of threads depending on available CPU cores.
+
+{services/supplier/validate-files-per-second} files to verify per second
+Limits how many stored files are verified per second, so the periodic check does not slow down other disk operations.
+
+{services/supplier/validate-bytes-per-second} bytes to read per second when verifying files
+Limits how many bytes are read from disk per second during the periodic check of stored files.
+
 {services/supplier-contracts/enabled} digitally signed supplier contracts
 The service is under development.
 
@@ -99,11 +99,13 @@ def defaults():
         'personal/private-key-size': TYPE_POSITIVE_INTEGER,
         'services/accountant/enabled': TYPE_BOOLEAN,
         'services/backup-db/enabled': TYPE_BOOLEAN,
+        'services/backups/binary-blocks-enabled': TYPE_BOOLEAN,
         'services/backups/block-size': TYPE_DISK_SPACE,
         'services/backups/enabled': TYPE_BOOLEAN,
         'services/backups/keep-local-copies-enabled': TYPE_BOOLEAN,
         'services/backups/max-block-size': TYPE_DISK_SPACE,
         'services/backups/max-copies': TYPE_POSITIVE_INTEGER,
+        'services/backups/max-blocks-in-flight': TYPE_NON_ZERO_POSITIVE_INTEGER,
         'services/backups/wait-suppliers-enabled': TYPE_BOOLEAN,
         'services/blockchain-id/enabled': TYPE_BOOLEAN,
         'services/blockchain-authority/enabled': TYPE_BOOLEAN,
@@ -150,6 +152,8 @@ def defaults():
         'services/employer/candidates': TYPE_STRING,
         'services/gateway/enabled': TYPE_BOOLEAN,
         'services/gateway/p2p-timeout': TYPE_POSITIVE_INTEGER,
+        'services/gateway/verify-child-processes-enabled': TYPE_BOOLEAN,
+        'services/gateway/verify-child-processes-ncpus': TYPE_POSITIVE_INTEGER,
         'services/http-connections/enabled': TYPE_BOOLEAN,
         'services/http-connections/http-port': TYPE_PORT_NUMBER,
         'services/http-transport/enabled': TYPE_BOOLEAN,
@@ -207,10 +211,18 @@ def defaults():
         'services/proxy-transport/current-router': TYPE_STRING,
         'services/proxy-transport/preferred-routers': TYPE_TEXT,  # 'services/proxy-transport/router-lifetime-seconds': TYPE_POSITIVE_INTEGER,
         'services/rebuilding/enabled': TYPE_BOOLEAN,
+        'services/rebuilding/child-processes-enabled': TYPE_BOOLEAN,
+        'services/rebuilding/child-processes-ncpus': TYPE_POSITIVE_INTEGER,
         'services/restores/enabled': TYPE_BOOLEAN,
+        'services/restores/prefetch-blocks': TYPE_POSITIVE_INTEGER,
+        'services/restores/hedge-latency-percentile': TYPE_NON_ZERO_POSITIVE_INTEGER,
         'services/shared-data/enabled': TYPE_BOOLEAN,
         'services/supplier/donated-space': TYPE_DISK_SPACE,
         'services/supplier/enabled': TYPE_BOOLEAN,
+        'services/supplier/fsync-enabled': TYPE_BOOLEAN,
+        'services/supplier/validate-workers': TYPE_POSITIVE_INTEGER,
+        'services/supplier/validate-files-per-second': TYPE_NON_ZERO_POSITIVE_INTEGER,
+        'services/supplier/validate-bytes-per-second': TYPE_NON_ZERO_POSITIVE_INTEGER,
         'services/supplier-contracts/enabled': TYPE_BOOLEAN,
         'services/supplier-contracts/initial-duration-hours': TYPE_NON_ZERO_POSITIVE_INTEGER,
         'services/supplier-contracts/duration-raise-factor': TYPE_NON_ZERO_POSITIVE_FLOATING_POINT,
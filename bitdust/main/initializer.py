@@ -112,10 +112,12 @@ def init_settings(base_dir=None, network_name=None, override_configs=None, enabl
 def init_engine():
     from bitdust.contacts import identitydb
     from bitdust.userid import id_url
+    from bitdust.userid import id_verified
     from bitdust.main import listeners
     from bitdust.main import events
     events.init()
     listeners.init()
+    id_verified.init()
     id_url.init()
     identitydb.init()
 
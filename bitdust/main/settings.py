@@ -510,6 +510,31 @@ def DefaultLocaltesterValidateTimeout():
     return 120*60
 
 
+def DefaultLocaltesterValidateWorkers():
+    """
+    How many threads ``Validate`` action of the local tester uses to verify signatures of stored packets.
+    """
+    import multiprocessing
+    try:
+        return max(1, min(4, multiprocessing.cpu_count() - 1))
+    except:
+        return 1
+
+
+def DefaultLocaltesterValidateFilesPerSecond():
+    """
+    ``Validate`` action of the local tester will not check more files than that per second.
+    """
+    return 100
+
+
+def DefaultLocaltesterValidateBytesPerSecond():
+    """
+    ``Validate`` action of the local tester will not read more bytes than that per second from disk.
+    """
+    return 10*1024*1024
+
+
 def DefaultLocaltesterUpdateCustomersTimeout():
     """
     A period in seconds to call ``UpdateCustomers`` action of the local tester.
@@ -520,8 +545,11 @@ def DefaultLocaltesterUpdateCustomersTimeout():
 def DefaultLocaltesterSpaceTimeTimeout():
     """
     A period in seconds to call ``SpaceTime`` action of the local tester.
+
+    Customers quotas are enforced by ``customer_space`` every time a new file is stored,
+    so this is only a consistency check.
     """
-    return 5*60
+    return 60*60
 
 
 def MinimumSendingDelay():
@@ -688,6 +716,13 @@ def IdentityHistoryDir():
     return os.path.join(BaseDir(), 'identityhistory')
 
 
+def VerifiedIdentitiesFile():
+    """
+    See ``userid.id_verified`` module, keeps digests of identities which signatures were already verified.
+    """
+    return os.path.join(MetaDataDir(), 'verifiedidentities')
+
+
 def IdentityCacheDir():
     """
     See ``lib.identitycache`` module, this is a place to store user's identity
@@ -990,6 +1025,10 @@ def CustomersUsedSpaceFile():
     return os.path.join(MetaDataDir(), 'spaceused')
 
 
+def CustomersFilesIndexFile():
+    return os.path.join(MetaDataDir(), 'customersfilesindex')
+
+
 def BalanceFile():
     """
     This file keeps our current BitDust balance - two values:
@@ -1811,6 +1850,51 @@ def getDonatedBytes():
     return diskspace.GetBytesFromString(getDonatedString())
 
 
+def getSupplierFsyncEnabled():
+    """
+    If True, files received from customers are flushed to the physical disk before Ack() is sent back.
+    """
+    return config.conf().getBool('services/supplier/fsync-enabled', True)
+
+
+def getSupplierValidateWorkers():
+    """
+    How many threads are used to verify signatures of stored files, 0 means it depends on number of CPU cores.
+    """
+    workers = config.conf().getInt('services/supplier/validate-workers', 0)
+    if workers <= 0:
+        return DefaultLocaltesterValidateWorkers()
+    return workers
+
+
+def getSupplierValidateFilesPerSecond():
+    """
+    Maximum number of stored files to be verified per second.
+    """
+    return config.conf().getInt('services/supplier/validate-files-per-second', DefaultLocaltesterValidateFilesPerSecond())
+
+
+def getSupplierValidateBytesPerSecond():
+    """
+    Maximum number of bytes to be read from disk per second when stored files are verified.
+    """
+    return config.conf().getInt('services/supplier/validate-bytes-per-second', DefaultLocaltesterValidateBytesPerSecond())
+
+
+def getRestorePrefetchBlocks():
+    """
+    How many next blocks are requested from suppliers in advance during restore.
+    """
+    return config.conf().getInt('services/restores/prefetch-blocks', 2)
+
+
+def getRestoreHedgeLatencyPercentile():
+    """
+    Pending request is considered as slow when it takes longer than that percentile of all previous responses.
+    """
+    return min(99, max(50, config.conf().getInt('services/restores/hedge-latency-percentile', 90)))
+
+
 def getUpdatesMode():
     """
     User can set different modes to update the BitDust software.
@@ -1855,6 +1939,21 @@ def getBackupsMaxCopies():
     return config.conf().getInt('services/backups/max-copies', 2)
 
 
+def getBackupMaxBlocksInFlight():
+    """
+    Return a number of blocks which can be processed at the same time during the backup:
+    one block is read from the source while few others are encrypted and passed to the RAID workers.
+    """
+    return config.conf().getInt('services/backups/max-blocks-in-flight', 4)
+
+
+def getBackupBinaryBlocksEnabled():
+    """
+    Return True if encrypted data blocks must be serialized in the compact binary format instead of JSON.
+    """
+    return config.conf().getBool('services/backups/binary-blocks-enabled', False)
+
+
 def getBackupsKeepLocalCopies():
     """
     Return True if user wish to keep local backups.
@@ -94,10 +94,12 @@ def shutdown_settings():
 def shutdown_engine():
     from bitdust.contacts import identitydb
     from bitdust.userid import id_url
+    from bitdust.userid import id_verified
     from bitdust.main import listeners
     from bitdust.main import events
     identitydb.shutdown()
     id_url.shutdown()
+    id_verified.shutdown()
     listeners.shutdown()
     events.shutdown()
 
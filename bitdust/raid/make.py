@@ -59,7 +59,6 @@ _Debug = False
 
 import os
 import sys
-import copy
 import array
 
 #------------------------------------------------------------------------------
@@ -139,52 +138,88 @@ def ReadBinaryFileAsArray(filename):
     return values
 
 
+def RoundupBuffer(data, stepsize):
+    """
+    Same as ``RoundupFile()`` but works with a bytes-like object in memory.
+    """
+    mod = len(data) % stepsize
+    if mod > 0:
+        return b''.join([data, b' '*(stepsize - mod)])
+    return data
+
+
+def WriteSegments(wholefile, myeccmap, blockNumber, targetDir, threshold_control=None):
+    """
+    Split the data into segments, calculate parity segments and write all of them to the ``targetDir``.
+    Input ``wholefile`` must be already padded to the multiple of ``datasegments*4`` bytes.
+    """
+    if not os.path.exists(targetDir):
+        os.makedirs(targetDir)
+
+    INTSIZE = 4
+    wholefile = memoryview(wholefile)
+    length = len(wholefile)
+    seglength = int(length/myeccmap.datasegments)
+
+    # list of data segments, memoryview slices do not copy the data
+    sds = []
+    for seg_num, chunk in enumerate(bitdust.raid.raidutils.chunks(wholefile, seglength or INTSIZE)):
+        FileName = targetDir + '/' + str(blockNumber) + '-' + str(seg_num) + '-Data'
+        with open(FileName, mode='wb') as f:
+            f.write(chunk)
+        sds.append(chunk)
+
+    psds_list = bitdust.raid.raidutils.build_parity_bulk(
+        sds,
+        seglength,
+        myeccmap,
+        threshold_control=threshold_control,
+    )
+
+    dataNum = len(sds)
+    parityNum = len(psds_list)
+
+    for PSegNum, _ in psds_list.items():
+        FileName = targetDir + '/' + str(blockNumber) + '-' + str(PSegNum) + '-Parity'
+        with open(FileName, mode='wb') as f:
+            f.write(psds_list[PSegNum])
+
+    return dataNum, parityNum
+
+
 def do_in_memory(filename, eccmapname, version, blockNumber, targetDir, threshold_control=None):
     try:
         if _Debug:
             with open('/tmp/raid.log', 'a') as logfile:
                 logfile.write(u'make filename=%s eccmapname=%s blockNumber=%s\n' % (repr(filename), eccmapname, blockNumber))
 
-        if not os.path.exists(targetDir):
-            os.makedirs(targetDir)
-
         INTSIZE = 4
         myeccmap = bitdust.raid.eccmap.eccmap(eccmapname)
         # any padding at end and block.Length fixes
         RoundupFile(filename, myeccmap.datasegments*INTSIZE)
-        wholefile = ReadBinaryFileAsArray(filename)
-        length = len(wholefile)
-        length = length*4
-        seglength = (length + myeccmap.datasegments - 1)/myeccmap.datasegments
-
-        # dict of data segments
-        sds = {}
-        for seg_num, chunk in enumerate(bitdust.raid.raidutils.chunks(wholefile, int(seglength/4) or 1)):
-            FileName = targetDir + '/' + str(blockNumber) + '-' + str(seg_num) + '-Data'
-            with open(FileName, mode='wb') as f:
-                chunk_to_write = copy.copy(chunk)
-                chunk_to_write.byteswap()
-                sds[seg_num] = iter(chunk)
-                f.write(chunk_to_write)
-
-        psds_list = bitdust.raid.raidutils.build_parity(
-            sds,
-            int(seglength/INTSIZE),
-            myeccmap.datasegments,
-            myeccmap,
-            myeccmap.paritysegments,
-            threshold_control=threshold_control,
-        )
-
-        dataNum = len(sds)
-        parityNum = len(psds_list)
-
-        for PSegNum, _ in psds_list.items():
-            FileName = targetDir + '/' + str(blockNumber) + '-' + str(PSegNum) + '-Parity'
-            with open(FileName, mode='wb') as f:
-                f.write(psds_list[PSegNum])
-
-        return dataNum, parityNum
+        return WriteSegments(ReadBinaryFile(filename), myeccmap, blockNumber, targetDir, threshold_control=threshold_control)
+
+    except:
+        bitdust.logs.lg.exc()
+        return -1, -1
+
+
+def do_from_buffer(label, data, eccmapname, version, blockNumber, targetDir, threshold_control=None):
+    """
+    Same as ``do_in_memory()`` but takes the block data directly from a bytes-like object,
+    so there is no need to write it to a temporary file first.
+    The ``label`` is only used to identify the task, for example to cancel it.
+    """
+    try:
+        if _Debug:
+            with open('/tmp/raid.log', 'a') as logfile:
+                logfile.write(u'make label=%s eccmapname=%s blockNumber=%s\n' % (repr(label), eccmapname, blockNumber))
+
+        INTSIZE = 4
+        myeccmap = bitdust.raid.eccmap.eccmap(eccmapname)
+        # any padding at end and block.Length fixes
+        wholefile = RoundupBuffer(data, myeccmap.datasegments*INTSIZE)
+        return WriteSegments(wholefile, myeccmap, blockNumber, targetDir, threshold_control=threshold_control)
 
     except:
         bitdust.logs.lg.exc()
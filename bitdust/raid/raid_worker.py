@@ -62,6 +62,9 @@ import os
 import sys
 import time
 import threading
+import multiprocessing
+
+from collections import OrderedDict
 
 from six.moves import range
 
@@ -86,6 +89,8 @@ from bitdust.automats import automat
 
 from bitdust.system import bpio
 
+from bitdust.main import config
+
 from bitdust.raid import read
 from bitdust.raid import make
 from bitdust.raid import rebuild
@@ -116,12 +121,21 @@ _VALID_TASKS = {
             make.ReadBinaryFile,
             make.WriteFile,
             make.ReadBinaryFileAsArray,
+            make.WriteSegments,
+        ),
+    ),
+    'make-buffer': (
+        make.do_from_buffer,
+        (
+            make.RoundupBuffer,
+            make.WriteSegments,
         ),
     ),
     'read': (
         read.raidread,
         (
             read.RebuildOne,
+            read.RebuildInMemory,
             read.ReadBinaryFile,
         ),
     ),
@@ -172,6 +186,23 @@ def cancel_task(cmd, first_parameter):
     return True
 
 
+def get_ncpus():
+    """
+    Returns number of child processes to be used to run RAID tasks or 0 if all tasks must be executed in a thread.
+    """
+    if bpio.Android():
+        return 0
+    if not config.conf() or not config.conf().getBool('services/rebuilding/child-processes-enabled', False):
+        return 0
+    ncpus = config.conf().getInt('services/rebuilding/child-processes-ncpus', 0)
+    if ncpus <= 0:
+        # we do not want to use all CPU cores at once
+        # need to keep at least one for all other operations
+        # decided to use only half of CPUs by default
+        ncpus = max(1, int(bpio.detect_number_of_cpu_cores()/2.0))
+    return ncpus
+
+
 #------------------------------------------------------------------------------
 
 
@@ -309,35 +340,19 @@ class RaidWorker(automat.Automat):
         """
         Action method.
         """
-        self.processor = ThreadedRaidProcessor()
-
-        # TODO: possible improvement in the future
-        # On Android it is not possible to run a separate sub-process: the only possible way is to use threads
-        # but on Windows and Linux we can use parallelp or multiprocessing libraries to utilize other CPU cores and
-        # gain more performance
-
-        # we do not want to use all CPU cores at once
-        # need to keep at least one for all other operations
-        # decided to use only half of CPUs at the moment
-        # TODO: make an option in the software settings
-        # ncpus = bpio.detect_number_of_cpu_cores()
-        # if ncpus > 1:
-        #     ncpus = int(ncpus/2.0)
-        # if bpio.Android() or not config.conf().getBool('services/rebuilding/child-processes-enabled'):
-        #     self.processor = ThreadedRaidProcessor()
-        # else:
-        #     os.environ['PYTHONUNBUFFERED'] = '1'
-        #     from parallelp import pp
-        #     self.processor = pp.Server(
-        #         secret='bitdust',
-        #         ncpus=ncpus,
-        #         loglevel=lg.get_loging_level(_DebugLevel),
-        #         logfile=settings.ParallelPLogFilename(),
-        #     )
-        # else:
-        #     from bitdust.raid import worker
-        #     self.processor = worker.Manager(ncpus=ncpus)
-
+        self.processor = None
+        ncpus = get_ncpus()
+        if ncpus > 0:
+            try:
+                self.processor = ProcessRaidProcessor(ncpus=ncpus)
+            except:
+                lg.exc()
+                self.processor = None
+        if not self.processor:
+            # On Android it is not possible to run a separate sub-process: the only possible way is to use threads
+            self.processor = ThreadedRaidProcessor()
+        if _Debug:
+            lg.args(_DebugLevel, processor=self.processor, ncpus=self.processor.get_ncpus())
         self.automat('process-started')
 
     def doKillProcess(self, *args, **kwargs):
@@ -509,6 +524,10 @@ class ThreadedRaidProcessor(object):
         self.max_simultaneous_tasks = 1
 
     def cancel(self, task_id):
+        if task_id in self.tasks:
+            # task was not started yet, it will be stopped right after the first processed chunk
+            self.tasks[task_id].stop()
+            return
         if task_id not in self.active_tasks:
             lg.warn('can not cancel task %r, task was not found' % task_id)
             return
@@ -566,6 +585,125 @@ class ThreadedRaidProcessor(object):
         return RaidTaskInfo(task_id)
 
 
+#------------------------------------------------------------------------------
+
+_ProcessCancelFlags = None
+
+
+def _process_init(cancel_flags):
+    """
+    Executed once inside of every child process when the pool starts.
+    """
+    global _ProcessCancelFlags
+    _ProcessCancelFlags = cancel_flags
+
+
+def _process_run(func, args, slot):
+    """
+    Executed inside of the child process, the task can be cancelled from the main process via shared flags.
+    """
+
+    def _threshold_control(more_bytes):
+        return not _ProcessCancelFlags[slot]
+
+    return func(*(tuple(args) + (_threshold_control, )))
+
+
+class ProcessRaidProcessor(object):
+
+    """
+    Runs RAID tasks in a pool of child processes to utilize multiple CPU cores.
+    Only the task parameters (block file paths, eccmap name, etc.) are sent to the child process.
+    Every running task gets a "slot" in the shared array of flags, so ``threshold_control()``
+    inside of the child process is able to detect that task was cancelled.
+    """
+
+    def __init__(self, ncpus):
+        self.latest_task_id = 0
+        self.tasks = OrderedDict()
+        self.active_tasks = {}
+        self.max_simultaneous_tasks = ncpus
+        self.context = multiprocessing.get_context('spawn')
+        if bpio.Windows():
+            from bitdust.system import deploy
+            deploy.init_base_dir()
+            venv_python_path = os.path.join(deploy.current_base_dir(), 'venv', 'Scripts', 'bitdust-node.exe')
+            lg.info('will use %s as multiprocessing executable' % venv_python_path)
+            self.context.set_executable(venv_python_path)
+        self.cancel_flags = self.context.Array('b', ncpus, lock=False)
+        self.free_slots = list(range(ncpus))
+        self.pool = self.context.Pool(
+            processes=ncpus,
+            initializer=_process_init,
+            initargs=(self.cancel_flags, ),
+        )
+
+    def cancel(self, task_id):
+        if task_id in self.tasks:
+            _, _, callback = self.tasks.pop(task_id)
+            reactor.callLater(0, callback, None)  # @UndefinedVariable
+            return
+        if task_id not in self.active_tasks:
+            lg.warn('can not cancel task %r, task was not found' % task_id)
+            return
+        self.cancel_flags[self.active_tasks[task_id]] = 1
+
+    def destroy(self):
+        for slot in range(self.max_simultaneous_tasks):
+            self.cancel_flags[slot] = 1
+        self.tasks.clear()
+        self.pool.terminate()
+
+    def get_ncpus(self):
+        return self.max_simultaneous_tasks
+
+    def on_success(self, task_id, result, callback):
+        slot = self.active_tasks.pop(task_id, None)
+        if slot is not None:
+            self.free_slots.append(slot)
+        if _Debug:
+            lg.args(_DebugLevel, task_id=task_id, result=result, active_tasks=list(self.active_tasks.keys()))
+        reactor.callLater(0, callback, result)  # @UndefinedVariable
+        reactor.callLater(0, self.process)  # @UndefinedVariable
+        return None
+
+    def on_fail(self, task_id, err, callback):
+        slot = self.active_tasks.pop(task_id, None)
+        if slot is not None:
+            self.free_slots.append(slot)
+        lg.err('task %r failed in child process: %r' % (task_id, err))
+        reactor.callLater(0, callback, None)  # @UndefinedVariable
+        reactor.callLater(0, self.process)  # @UndefinedVariable
+        return None
+
+    def process(self):
+        while len(self.active_tasks) < self.max_simultaneous_tasks and self.tasks and self.free_slots:
+            task_id, task_data = self.tasks.popitem(last=False)
+            self._start(task_id, *task_data)
+
+    def submit(self, func, args=None, depfuncs=None, modules=None, callback=None):
+        task_id = self.latest_task_id + 1
+        if task_id in self.tasks:
+            raise Exception('another RaidTask already exists with task_id=%r' % task_id)
+        self.tasks[task_id] = (func, args or (), callback)
+        self.latest_task_id = task_id
+        if _Debug:
+            lg.args(_DebugLevel, task_id=task_id, func=func, total_tasks=len(self.tasks))
+        reactor.callLater(0, self.process)  # @UndefinedVariable
+        return RaidTaskInfo(task_id)
+
+    def _start(self, task_id, func, args, callback):
+        slot = self.free_slots.pop(0)
+        self.cancel_flags[slot] = 0
+        self.active_tasks[task_id] = slot
+        self.pool.apply_async(
+            _process_run,
+            args=(func, args, slot),
+            callback=lambda result: reactor.callFromThread(self.on_success, task_id, result, callback),  # @UndefinedVariable
+            error_callback=lambda err: reactor.callFromThread(self.on_fail, task_id, err, callback),  # @UndefinedVariable
+        )
+
+
 #------------------------------------------------------------------------------
 
 
@@ -30,6 +30,17 @@
 
 import array
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#------------------------------------------------------------------------------
+
+_ChunkSize = 64*1024
+
+#------------------------------------------------------------------------------
+
 
 def build_parity(sds, iters, datasegments, myeccmap, paritysegments, threshold_control=None):
     psds_list = {seg_num: array.array('i') for seg_num in range(myeccmap.paritysegments)}
@@ -64,3 +75,56 @@ def chunks(l, n):
     """Yield successive n-sized chunks from l."""
     for i in range(0, len(l), n):
         yield l[i:i + n]
+
+
+def xor_buffers(buffers, length):
+    """
+    Returns bytes of given length where every byte is a XOR of the bytes at
+    the same position in all given buffers.
+    Uses NumPy if it is installed, otherwise falls back to the wide-int XOR
+    which is still done in C but requires extra copies.
+    """
+    if not buffers:
+        return bytes(length)
+    if numpy is not None:
+        result = numpy.frombuffer(buffers[0], dtype=numpy.uint8, count=length).copy()
+        for buf in buffers[1:]:
+            numpy.bitwise_xor(result, numpy.frombuffer(buf, dtype=numpy.uint8, count=length), out=result)
+        return result.tobytes()
+    result = int.from_bytes(buffers[0][:length], 'little')
+    for buf in buffers[1:]:
+        result ^= int.from_bytes(buf[:length], 'little')
+    return result.to_bytes(length, 'little')
+
+
+def build_parity_bulk(segments, seglength, myeccmap, threshold_control=None, chunk_size=None):
+    """
+    Same as ``build_parity()`` but works over whole buffers instead of one
+    integer at a time.
+    Input ``segments`` is a list of bytes-like objects (better memoryviews to avoid copying)
+    of the same length ``seglength``, one for every data segment.
+    Returns a dictionary with a ``bytearray`` for every parity segment.
+    The ``threshold_control`` is called once per chunk with number of processed bytes.
+    """
+    chunk_size = chunk_size or _ChunkSize
+    parity_to_data = {seg_num: [] for seg_num in range(myeccmap.paritysegments)}
+    for DSegNum in range(len(segments)):
+        for PSegNum in myeccmap.DataToParity[DSegNum]:
+            if PSegNum > myeccmap.paritysegments:
+                myeccmap.check()
+                raise Exception('eccmap error')
+            parity_to_data[PSegNum].append(DSegNum)
+    psds_list = {seg_num: bytearray(seglength) for seg_num in range(myeccmap.paritysegments)}
+    for offset in range(0, seglength, chunk_size):
+        chunk_length = min(chunk_size, seglength - offset)
+        for PSegNum, data_segments in parity_to_data.items():
+            if not data_segments:
+                continue
+            psds_list[PSegNum][offset:offset + chunk_length] = xor_buffers(
+                [segments[DSegNum][offset:offset + chunk_length] for DSegNum in data_segments],
+                chunk_length,
+            )
+        if threshold_control:
+            if not threshold_control(chunk_length*len(segments)):
+                raise Exception('task cancelled')
+    return psds_list
@@ -56,7 +56,6 @@
 
 from __future__ import absolute_import
 from __future__ import print_function
-import six
 from io import open
 from six.moves import range
 
@@ -81,6 +80,7 @@ if __name__ == '__main__':
 import bitdust.logs.lg
 
 import bitdust.raid.eccmap
+import bitdust.raid.raidutils
 
 #------------------------------------------------------------------------------
 
@@ -97,12 +97,11 @@ def ReadBinaryFile(filename):
 
 
 def RebuildOne(inlist, listlen, outfilename, threshold_control=None):
-    readsize = 1  # vary from 1 byte to 4 bytes
-    raidfiles = ['']*listlen  # just need a list of this size
-    raidreads = ['']*listlen
+    readsize = 64*1024  # XOR whole windows of all input files at once
+    raidfiles = []
     for filenum in range(listlen):
         try:
-            raidfiles[filenum] = open(inlist[filenum], 'rb')
+            raidfiles.append(open(inlist[filenum], 'rb'))
         except:
             bitdust.logs.lg.exc()
             for f in raidfiles:
@@ -114,34 +113,25 @@ def RebuildOne(inlist, listlen, outfilename, threshold_control=None):
 
     rebuildfile = open(outfilename, 'wb')
     progress = 0
-    while True:
-        for k in range(listlen):
-            raidreads[k] = raidfiles[k].read(2048)
-        if not raidreads[0]:
-            break
-        i = 0
-        while i < len(raidreads[0]):
-            xor = 0
-            for j in range(listlen):
-                b1 = ord(raidreads[j][i:i + 1])
-                xor = xor ^ b1
-            if six.PY3:
-                out_byte = bytes([
-                    xor,
-                ])
-            else:
-                out_byte = chr(xor)
-            rebuildfile.write(out_byte)
-            i += readsize
-            progress += 1
+    try:
+        while True:
+            raidreads = [f.read(readsize) for f in raidfiles]
+            length = len(raidreads[0])
+            if not length:
+                break
+            for raidread in raidreads[1:]:
+                if len(raidread) < length:
+                    raise Exception('input file is too short')
+            rebuildfile.write(bitdust.raid.raidutils.xor_buffers(raidreads, length))
+            progress += length
 
             if threshold_control:
-                if not threshold_control(readsize):
+                if not threshold_control(length):
                     raise Exception('task cancelled')
-
-    for filenum in range(listlen):
-        raidfiles[filenum].close()
-    rebuildfile.close()
+    finally:
+        for f in raidfiles:
+            f.close()
+        rebuildfile.close()
 
     if _Debug:
         with open('/tmp/raid.log', 'a') as logfile:
@@ -149,6 +139,40 @@ def RebuildOne(inlist, listlen, outfilename, threshold_control=None):
     return True
 
 
+def RebuildInMemory(inlist, listlen, outfilename, segments, threshold_control=None):
+    """
+    Same as ``RebuildOne()``, but input files are read from disk only once and kept in ``segments`` dictionary.
+    Rebuilt segment is also stored there, so the next rebuild pass does not need to read it again.
+    """
+    readsize = 64*1024
+    for filename in inlist[:listlen]:
+        if filename not in segments:
+            segments[filename] = ReadBinaryFile(filename)
+    raidreads = [memoryview(segments[filename]) for filename in inlist[:listlen]]
+    length = len(raidreads[0])
+    for raidread in raidreads[1:]:
+        if len(raidread) < length:
+            raise Exception('input file is too short')
+    result = bytearray(length)
+    for offset in range(0, length, readsize):
+        chunk_length = min(readsize, length - offset)
+        result[offset:offset + chunk_length] = bitdust.raid.raidutils.xor_buffers(
+            [raidread[offset:offset + chunk_length] for raidread in raidreads],
+            chunk_length,
+        )
+        if threshold_control:
+            if not threshold_control(chunk_length):
+                raise Exception('task cancelled')
+    with open(outfilename, 'wb') as rebuildfile:
+        rebuildfile.write(result)
+    segments[outfilename] = result
+
+    if _Debug:
+        with open('/tmp/raid.log', 'a') as logfile:
+            logfile.write(u'raidread.RebuildInMemory inlist=%d listlen=%d outfilename=%r progress=%d\n' % (len(inlist), listlen, outfilename, length))
+    return True
+
+
 # If segment is good, there is a file for it, if not then no file exists.
 # We only rebuild data segments.
 # Could only make parity segments from existing data segments, so no help toward getting data.
@@ -171,6 +195,8 @@ def raidread(
             open('/tmp/raid.log', 'a').write(u'raidread OutputFileName=%s blockNumber=%s eccmapname=%s\n' % (repr(OutputFileName), blockNumber, eccmapname))
 
         myeccmap = bitdust.raid.eccmap.eccmap(eccmapname)
+        # all segments are loaded only once and kept in memory during all rebuild passes
+        segments = {}
         GoodFiles = [
             '',
         ]*(myeccmap.datasegments + myeccmap.paritysegments)
@@ -204,7 +230,7 @@ def raidread(
                         MakingProgress = 1
                         GoodFiles[GoodDSegs] = PFileName
                         GoodDSegs += 1
-                        RebuildOne(GoodFiles, GoodDSegs, BadName, threshold_control=threshold_control)
+                        RebuildInMemory(GoodFiles, GoodDSegs, BadName, segments, threshold_control=threshold_control)
 
         GoodFiles = []
         #  Count up the good segments and combine
@@ -216,7 +242,10 @@ def raidread(
                 version,
                 str(blockNumber) + '-' + str(DSegNum) + '-Data',
             )
-            if os.path.exists(FileName):
+            if FileName in segments:
+                GoodDSegs += 1
+                output.write(segments.pop(FileName))
+            elif os.path.exists(FileName):
                 GoodDSegs += 1
                 fin = open(FileName, 'rb')
                 moredata = fin.read()
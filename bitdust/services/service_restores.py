@@ -54,5 +54,7 @@ class RestoreMonitorService(LocalService):
 
     def stop(self):
         from bitdust.storage import restore_monitor
+        from bitdust.storage import restore_scheduler
         restore_monitor.shutdown()
+        restore_scheduler.shutdown()
         return True
@@ -48,6 +48,9 @@ _DebugLevel = 4
 
 import os
 import math
+import threading
+
+from twisted.internet import task  # @UnresolvedImport
 
 from bitdust.logs import lg
 
@@ -72,40 +75,106 @@ from bitdust.userid import my_id
 #------------------------------------------------------------------------------
 
 
+_CustomersQuotas = None
+_CustomersFreeSpace = 0
+_CustomersUsage = None
+_CustomersUsageChanged = False
+_CustomersUsageDeltas = None
+_CustomersLock = threading.RLock()
+_SaveUsageTask = None
+_SaveUsageInterval = 30
+
+#------------------------------------------------------------------------------
+
+
 def init():
+    """
+    Customers quotas and usage info are loaded from disk only once and kept in memory after that.
+    Changes of the usage made by ``increase_customer_usage()`` are written to the file periodically.
+    """
+    global _SaveUsageTask
     if _Debug:
         lg.out(_DebugLevel, 'accounting.init')
+    if _SaveUsageTask is None:
+        _SaveUsageTask = task.LoopingCall(save_customers_usage)
+        _SaveUsageTask.start(_SaveUsageInterval, now=False)
+
+
+def shutdown():
+    global _SaveUsageTask
+    if _Debug:
+        lg.out(_DebugLevel, 'accounting.shutdown')
+    if _SaveUsageTask is not None:
+        if _SaveUsageTask.running:
+            _SaveUsageTask.stop()
+        _SaveUsageTask = None
+    reset_customers_info()
+
+
+def reset_customers_info():
+    """
+    Drops cached quotas and usage info, so it will be loaded from disk again on next call.
+    Must be called when customer IDURL was rotated, because all the keys are normalized when the file is loaded.
+    """
+    global _CustomersQuotas
+    global _CustomersFreeSpace
+    global _CustomersUsage
+    global _CustomersUsageDeltas
+    with _CustomersLock:
+        save_customers_usage()
+        _CustomersQuotas = None
+        _CustomersFreeSpace = 0
+        _CustomersUsage = None
+        _CustomersUsageDeltas = None
 
 
 #------------------------------------------------------------------------------
 
 
+def _load_customers_quotas():
+    global _CustomersQuotas
+    global _CustomersFreeSpace
+    if _CustomersQuotas is None:
+        space_dict = bpio._read_dict(settings.CustomersSpaceFile(), {})
+        _CustomersFreeSpace = int(space_dict.pop('free', 0))
+        _CustomersQuotas = {id_url.field(k).to_bin(): v for k, v in space_dict.items()}
+    return _CustomersQuotas
+
+
 def read_customers_quotas():
-    space_dict = bpio._read_dict(settings.CustomersSpaceFile(), {})
-    free_space = int(space_dict.pop('free', 0))
-    space_dict = {id_url.field(k).to_bin(): v for k, v in space_dict.items()}
-    return space_dict, free_space
+    with _CustomersLock:
+        space_dict = dict(_load_customers_quotas())
+        return space_dict, _CustomersFreeSpace
 
 
 def write_customers_quotas(new_space_dict, free_space):
-    space_dict = {id_url.field(k).to_text(): v for k, v in new_space_dict.items()}
-    space_dict['free'] = free_space
-    return bpio._write_dict(settings.CustomersSpaceFile(), space_dict)
+    global _CustomersQuotas
+    global _CustomersFreeSpace
+    with _CustomersLock:
+        _CustomersQuotas = {id_url.field(k).to_bin(): v for k, v in new_space_dict.items()}
+        _CustomersFreeSpace = int(free_space)
+        space_dict = {id_url.field(k).to_text(): v for k, v in new_space_dict.items()}
+        space_dict['free'] = free_space
+        return bpio._write_dict(settings.CustomersSpaceFile(), space_dict)
 
 
 def get_customer_quota(customer_idurl):
     customer_idurl = id_url.field(customer_idurl).to_bin()
-    try:
-        return int(read_customers_quotas()[0].get(customer_idurl, None))
-    except:
-        return None
+    with _CustomersLock:
+        try:
+            return int(_load_customers_quotas().get(customer_idurl, None))
+        except:
+            return None
 
 
 def check_create_customers_quotas(donated_bytes=None):
+    global _CustomersQuotas
     if not os.path.isfile(settings.CustomersSpaceFile()):
-        bpio._write_dict(settings.CustomersSpaceFile(), {
-            'free': donated_bytes or settings.getDonatedBytes(),
-        })
+        with _CustomersLock:
+            bpio._write_dict(settings.CustomersSpaceFile(), {
+                'free': donated_bytes or settings.getDonatedBytes(),
+            })
+            _CustomersQuotas = None
         lg.info('created a new customers quotas file: %s' % settings.CustomersSpaceFile())
         return True
     return False
@@ -147,17 +216,97 @@ def validate_customers_quotas(space_dict=None, free_space=None):
 #------------------------------------------------------------------------------
 
 
+def _load_customers_usage():
+    global _CustomersUsage
+    if _CustomersUsage is None:
+        usage_dict = {}
+        if os.path.exists(settings.CustomersUsedSpaceFile()):
+            usage_dict = jsn.dict_keys_to_bin(bpio._read_dict(settings.CustomersUsedSpaceFile(), {}))
+        _CustomersUsage = {id_url.field(k).to_bin(): v for k, v in usage_dict.items()}
+    return _CustomersUsage
+
+
 def read_customers_usage():
-    usage_dict = {}
-    if os.path.exists(settings.CustomersUsedSpaceFile()):
-        usage_dict = jsn.dict_keys_to_bin(bpio._read_dict(settings.CustomersUsedSpaceFile(), {}))
-    usage_dict = {id_url.field(k).to_bin(): v for k, v in usage_dict.items()}
-    return usage_dict
+    with _CustomersLock:
+        return dict(_load_customers_usage())
+
+
+def start_customers_usage_scan():
+    """
+    Must be called before counting files of all customers on disk, returns current usage info.
+    All changes made by ``increase_customer_usage()`` after that moment are re-applied in ``update_customers_usage()``.
+    """
+    global _CustomersUsageDeltas
+    with _CustomersLock:
+        _CustomersUsageDeltas = {}
+        return dict(_load_customers_usage())
 
 
 def update_customers_usage(new_space_usage_dict):
-    usage_dict = {id_url.field(k).to_bin(): v for k, v in new_space_usage_dict.items()}
-    return bpio._write_dict(settings.CustomersUsedSpaceFile(), jsn.dict_keys_to_text(usage_dict))
+    """
+    Stores values counted on disk for every given customer, other customers are not touched.
+    """
+    global _CustomersUsageChanged
+    global _CustomersUsageDeltas
+    with _CustomersLock:
+        usage_dict = _load_customers_usage()
+        deltas = _CustomersUsageDeltas or {}
+        _CustomersUsageDeltas = None
+        for customer_idurl, used_bytes in new_space_usage_dict.items():
+            customer_idurl = id_url.field(customer_idurl).to_bin()
+            try:
+                used_bytes = int(used_bytes)
+            except:
+                lg.warn('wrong usage value %r for customer %r' % (used_bytes, customer_idurl))
+                continue
+            usage_dict[customer_idurl] = str(max(0, used_bytes + deltas.get(customer_idurl, 0)))
+        _CustomersUsageChanged = False
+        return bpio._write_dict(settings.CustomersUsedSpaceFile(), jsn.dict_keys_to_text(usage_dict))
+
+
+def save_customers_usage():
+    global _CustomersUsageChanged
+    with _CustomersLock:
+        if not _CustomersUsageChanged or _CustomersUsage is None:
+            return False
+        _CustomersUsageChanged = False
+        if _Debug:
+            lg.out(_DebugLevel, 'accounting.save_customers_usage %d customers' % len(_CustomersUsage))
+        return bpio._write_dict(settings.CustomersUsedSpaceFile(), jsn.dict_keys_to_text(_CustomersUsage))
+
+
+def get_customer_usage(customer_idurl):
+    """
+    Returns number of bytes used by given customer or None if it is not known yet.
+    """
+    customer_idurl = id_url.field(customer_idurl).to_bin()
+    with _CustomersLock:
+        try:
+            return int(_load_customers_usage().get(customer_idurl, None))
+        except:
+            return None
+
+
+def increase_customer_usage(customer_idurl, delta_bytes):
+    """
+    Called when customer file was stored or removed, negative ``delta_bytes`` value decrease the usage.
+    The info is written to the disk by ``save_customers_usage()`` later.
+    """
+    global _CustomersUsageChanged
+    if not delta_bytes:
+        return
+    customer_idurl = id_url.field(customer_idurl).to_bin()
+    with _CustomersLock:
+        usage_dict = _load_customers_usage()
+        try:
+            current_bytes = int(usage_dict.get(customer_idurl, 0))
+        except:
+            current_bytes = 0
+        usage_dict[customer_idurl] = str(max(0, current_bytes + delta_bytes))
+        _CustomersUsageChanged = True
+        if _CustomersUsageDeltas is not None:
+            # files are counted on disk right now, this change may not be visible there
+            _CustomersUsageDeltas[customer_idurl] = _CustomersUsageDeltas.get(customer_idurl, 0) + delta_bytes
 
 
 def calculate_customers_usage_ratio(space_dict=None, used_dict=None):
@@ -63,10 +63,14 @@ For each block must be received delivery report: positive or negative.
 Process will be completed as soon as all data will be read from the folder
 and all blocks will receive a delivery report.
 
+Blocks are processed in a pipeline: while one block is being encrypted in a worker thread
+and few other blocks are processed by ``raid_worker`` the next block can be already read from the pipe.
+The number of blocks "in flight" is limited by ``services/backups/max-blocks-in-flight`` option.
+Blocks are always reported to ``blockResultCallback`` in order.
+
 EVENTS:
     * :red:`block-encrypted`
     * :red:`block-raid-done`
-    * :red:`block-raid-started`
     * :red:`fail`
     * :red:`read-success`
     * :red:`start`
@@ -96,7 +100,8 @@ try:
 except:
     sys.exit('Error initializing twisted.internet.reactor in backup.py')
 
-from twisted.internet.defer import maybeDeferred, Deferred, succeed
+from twisted.internet import threads
+from twisted.internet.defer import Deferred, succeed
 
 #------------------------------------------------------------------------------
 
@@ -115,7 +120,6 @@ from bitdust.userid import my_id
 from bitdust.userid import global_id
 
 from bitdust.system import nonblocking
-from bitdust.system import tmpfile
 
 from bitdust.main import settings
 from bitdust.main import events
@@ -154,6 +158,7 @@ class backup(automat.Automat):
         keyID=None,
         ecc_map=None,
         creatorIDURL=None,
+        maxBlocksInFlight=None,
     ):
         self.backupID = backupID
         self.creatorIDURL = creatorIDURL or my_id.getIDURL()
@@ -177,6 +182,12 @@ class backup(automat.Automat):
         self.currentBlockData = BytesIO()
         self.currentBlockSize = 0
         self.workBlocks = {}
+        self.blocksInFlight = set()
+        self.blockResults = {}
+        self.nextBlockToReport = 0
+        self.maxBlocksInFlight = maxBlocksInFlight
+        if self.maxBlocksInFlight is None:
+            self.maxBlocksInFlight = settings.getBackupMaxBlocksInFlight()
         self.blockNumber = 0
         self.dataSent = 0
         self.blocksSent = 0
@@ -209,8 +220,15 @@ class backup(automat.Automat):
                 self.doFirstBlock(*args, **kwargs)
         #---READ---
         elif self.state == 'READ':
-            if event == 'read-success' and not self.isReadingNow(*args, **kwargs) and (self.isBlockReady(*args, **kwargs) or self.isEOF(*args, **kwargs)):
-                self.state = 'ENCRYPT'
+            if event == 'read-success' and not self.isReadingNow(*args, **kwargs) and self.isEOF(*args, **kwargs):
+                self.state = 'RAID'
+                self.doEncryptBlock(*args, **kwargs)
+            elif event == 'read-success' and not self.isReadingNow(*args, **kwargs) and not self.isEOF(*args, **kwargs) and self.isBlockReady(*args, **kwargs) and self.isMoreBlocksAllowed(*args, **kwargs):
+                self.doEncryptBlock(*args, **kwargs)
+                self.doNextBlock(*args, **kwargs)
+                self.doRead(*args, **kwargs)
+            elif event == 'read-success' and not self.isReadingNow(*args, **kwargs) and not self.isEOF(*args, **kwargs) and self.isBlockReady(*args, **kwargs) and not self.isMoreBlocksAllowed(*args, **kwargs):
+                self.state = 'RAID'
                 self.doEncryptBlock(*args, **kwargs)
             elif event == 'fail' or ((event == 'read-success' or event == 'timer-001sec') and self.isAborted(*args, **kwargs)):
                 self.state = 'ABORTED'
@@ -219,13 +237,15 @@ class backup(automat.Automat):
                 self.doDestroyMe(*args, **kwargs)
             elif (event == 'read-success' or event == 'timer-001sec') and not self.isAborted(*args, **kwargs) and self.isPipeReady(*args, **kwargs) and not self.isEOF(*args, **kwargs) and not self.isReadingNow(*args, **kwargs) and not self.isBlockReady(*args, **kwargs):
                 self.doRead(*args, **kwargs)
+            elif event == 'block-encrypted':
+                self.doBlockPushAndRaid(*args, **kwargs)
             elif event == 'block-raid-done' and not self.isAborted(*args, **kwargs):
                 self.doPopBlock(*args, **kwargs)
                 self.doBlockReport(*args, **kwargs)
                 self.doNotifyNewData(*args, **kwargs)
         #---RAID---
         elif self.state == 'RAID':
-            if event == 'block-raid-done' and not self.isMoreBlocks(*args, **kwargs) and not self.isAborted(*args, **kwargs):
+            if event == 'block-raid-done' and self.isEOF(*args, **kwargs) and not self.isMoreBlocks(*args, **kwargs) and not self.isAborted(*args, **kwargs):
                 self.state = 'DONE'
                 self.doPopBlock(*args, **kwargs)
                 self.doBlockReport(*args, **kwargs)
@@ -233,33 +253,24 @@ class backup(automat.Automat):
                 self.doClose(*args, **kwargs)
                 self.doReport(*args, **kwargs)
                 self.doDestroyMe(*args, **kwargs)
-            elif event == 'block-raid-started' and not self.isEOF(*args, **kwargs) and not self.isAborted(*args, **kwargs):
+            elif event == 'block-raid-done' and not self.isEOF(*args, **kwargs) and not self.isAborted(*args, **kwargs):
                 self.state = 'READ'
+                self.doPopBlock(*args, **kwargs)
+                self.doBlockReport(*args, **kwargs)
+                self.doNotifyNewData(*args, **kwargs)
                 self.doNextBlock(*args, **kwargs)
                 self.doRead(*args, **kwargs)
-            elif event == 'block-raid-done' and self.isMoreBlocks(*args, **kwargs) and not self.isAborted(*args, **kwargs):
+            elif event == 'block-raid-done' and self.isEOF(*args, **kwargs) and self.isMoreBlocks(*args, **kwargs) and not self.isAborted(*args, **kwargs):
                 self.doPopBlock(*args, **kwargs)
                 self.doBlockReport(*args, **kwargs)
                 self.doNotifyNewData(*args, **kwargs)
-            elif event == 'fail' or ((event == 'timer-01sec' or event == 'block-raid-done' or event == 'block-raid-started') and self.isAborted(*args, **kwargs)):
-                self.state = 'ABORTED'
-                self.doClose(*args, **kwargs)
-                self.doReport(*args, **kwargs)
-                self.doDestroyMe(*args, **kwargs)
-        #---ENCRYPT---
-        elif self.state == 'ENCRYPT':
-            if event == 'block-encrypted':
-                self.state = 'RAID'
+            elif event == 'block-encrypted' and not self.isAborted(*args, **kwargs):
                 self.doBlockPushAndRaid(*args, **kwargs)
-            elif event == 'fail':
+            elif event == 'fail' or ((event == 'timer-01sec' or event == 'block-raid-done' or event == 'block-encrypted') and self.isAborted(*args, **kwargs)):
                 self.state = 'ABORTED'
                 self.doClose(*args, **kwargs)
                 self.doReport(*args, **kwargs)
                 self.doDestroyMe(*args, **kwargs)
-            elif event == 'block-raid-done' and not self.isAborted(*args, **kwargs):
-                self.doPopBlock(*args, **kwargs)
-                self.doBlockReport(*args, **kwargs)
-                self.doNotifyNewData(*args, **kwargs)
         #---DONE---
         elif self.state == 'DONE':
             pass
@@ -310,8 +321,17 @@ class backup(automat.Automat):
         Condition method.
         """
         if _Debug:
-            lg.args(_DebugLevel, workBlocks=len(self.workBlocks))
-        return len(self.workBlocks) > 1
+            lg.args(_DebugLevel, workBlocks=len(self.workBlocks), blocksInFlight=len(self.blocksInFlight))
+        return len(self.blocksInFlight) > 1
+
+    def isMoreBlocksAllowed(self, *args, **kwargs):
+        """
+        Condition method.
+        Return True if after starting the current block there is still a room in the pipeline to read the next one.
+        """
+        if _Debug:
+            lg.args(_DebugLevel, blocksInFlight=len(self.blocksInFlight), maxBlocksInFlight=self.maxBlocksInFlight)
+        return len(self.blocksInFlight) + 1 < self.maxBlocksInFlight
 
     def doInit(self, *args, **kwargs):
         """
@@ -380,26 +400,30 @@ class backup(automat.Automat):
         """
         Action method.
         """
+        blockNumber = self.blockNumber
+        blockSize = self.currentBlockSize
+        lastBlock = self.stateEOF
+        raw_bytes = self.currentBlockData.getvalue()
+        self.blocksInFlight.add(blockNumber)
 
         def _doBlock():
+            # executed in a worker thread, so encryption and signing do not block the main thread
             dt = time.time()
-            raw_bytes = self.currentBlockData.getvalue()
             block = encrypted.Block(
                 CreatorID=self.creatorIDURL,
                 BackupID=self.backupID,
-                BlockNumber=self.blockNumber,
+                BlockNumber=blockNumber,
                 SessionKey=key.NewSessionKey(session_key_type=key.SessionKeyType()),
                 SessionKeyType=key.SessionKeyType(),
-                LastBlock=self.stateEOF,
+                LastBlock=lastBlock,
                 Data=raw_bytes,
                 EncryptKey=self.keyID,
             )
-            del raw_bytes
             if _Debug:
-                lg.out(_DebugLevel, 'backup.doEncryptBlock blockNumber=%d size=%d atEOF=%s dt=%s EncryptKey=%s' % (self.blockNumber, self.currentBlockSize, self.stateEOF, str(time.time() - dt), self.keyID))
+                lg.out(_DebugLevel, 'backup.doEncryptBlock blockNumber=%d size=%d atEOF=%s dt=%s EncryptKey=%s' % (blockNumber, blockSize, lastBlock, str(time.time() - dt), self.keyID))
             return block
 
-        d = maybeDeferred(_doBlock)
+        d = threads.deferToThread(_doBlock)  # @UndefinedVariable
         d.addCallback(lambda block: self.automat('block-encrypted', block))
         d.addErrback(lambda err: self.automat('fail', err))
 
@@ -420,28 +444,28 @@ class backup(automat.Automat):
             if _Debug:
                 lg.out(_DebugLevel, 'backup.doBlockPushAndRaid SKIP, terminating=True')
             return
-        fileno, filename = tmpfile.make('raid', extension='.raid')
-        serializedblock = newblock.Serialize()
+        serializedblock = newblock.Serialize(binary=settings.getBackupBinaryBlocksEnabled())
         blocklen = len(serializedblock)
-        os.write(fileno, strng.to_bin(blocklen) + b':' + serializedblock)
-        os.close(fileno)
-        self.workBlocks[newblock.BlockNumber] = filename
+        # the serialized block is passed to the RAID worker directly from memory, no temporary file needed
+        blockdata = b''.join([strng.to_bin(blocklen), b':', serializedblock])
+        del serializedblock
+        label = '%s/%d' % (self.backupID, newblock.BlockNumber)
+        self.workBlocks[newblock.BlockNumber] = label
         dt = time.time()
         outputpath = os.path.join(settings.getLocalBackupsDir(), self.customerGlobalID, self.pathID, self.version)
-        task_params = (filename, self.eccmap.name, self.version, newblock.BlockNumber, outputpath)
-        raid_worker.add_task('make', task_params, lambda cmd, params, result: self._raidmakeCallback(params, result, dt))
-        self.automat('block-raid-started', newblock)
-        del serializedblock
+        task_params = (label, blockdata, self.eccmap.name, self.version, newblock.BlockNumber, outputpath)
+        raid_worker.add_task('make-buffer', task_params, lambda cmd, params, result: self._raidmakeCallback(params, result, dt))
+        del blockdata
         if _Debug:
-            lg.out(_DebugLevel, 'backup.doBlockPushAndRaid %s : start process data from %s to %s, %d' % (newblock.BlockNumber, filename, outputpath, id(self.terminating)))
+            lg.out(_DebugLevel, 'backup.doBlockPushAndRaid %s : start process %d bytes to %s, %d' % (newblock.BlockNumber, blocklen, outputpath, id(self.terminating)))
 
     def doPopBlock(self, *args, **kwargs):
         """
         Action method.
         """
         blockNumber, _ = args[0]
-        filename = self.workBlocks.pop(blockNumber)
-        tmpfile.throw_out(filename, 'block raid done')
+        self.blocksInFlight.discard(blockNumber)
+        self.workBlocks.pop(blockNumber, None)
 
     def doFirstBlock(self, *args, **kwargs):
         """
@@ -450,6 +474,8 @@ class backup(automat.Automat):
         self.dataSent = 0
         self.blocksSent = 0
         self.blockNumber = 0
+        self.nextBlockToReport = 0
+        self.blockResults.clear()
         self.currentBlockSize = 0
         self.currentBlockData = BytesIO()
 
@@ -469,8 +495,13 @@ class backup(automat.Automat):
         Action method.
         """
         BlockNumber, result = args[0]
-        if self.blockResultCallback:
-            self.blockResultCallback(self.backupID, BlockNumber, result)
+        # RAID tasks can be finished in any order, but blocks are always reported one by one
+        self.blockResults[BlockNumber] = result
+        while self.nextBlockToReport in self.blockResults:
+            result = self.blockResults.pop(self.nextBlockToReport)
+            if self.blockResultCallback:
+                self.blockResultCallback(self.backupID, self.nextBlockToReport, result)
+            self.nextBlockToReport += 1
 
     def doNotifyNewData(self, *args, **kwargs):
         """
@@ -484,8 +515,6 @@ class backup(automat.Automat):
         Action method.
         """
         self.closed = True
-        for filename in self.workBlocks.values():
-            tmpfile.throw_out(filename, 'backup aborted')
 
     def doReport(self, *args, **kwargs):
         """
@@ -515,6 +544,8 @@ class backup(automat.Automat):
         self.stateReading = False
         self.closed = False
         self.workBlocks = None
+        self.blocksInFlight = None
+        self.blockResults = None
         self.resultDefer = None
         self.finishCallback = None
         self.blockResultCallback = None
@@ -532,9 +563,9 @@ class backup(automat.Automat):
         if _Debug:
             lg.out(_DebugLevel, 'backup.abort id %s, %d' % (str(self.backupID), id(self.ask4abort)))
         self.terminating = True
-        for blockNumber, filename in self.workBlocks.items():
-            lg.warn('aborting raid make worker for block %d in %s' % (blockNumber, filename))
-            raid_worker.cancel_task('make', filename)
+        for blockNumber, label in self.workBlocks.items():
+            lg.warn('aborting raid make worker for block %d of %s' % (blockNumber, label))
+            raid_worker.cancel_task('make-buffer', label)
         lg.warn('killing backup pipe')
         self.ask4abort = True
         self._kill_pipe()
@@ -548,7 +579,7 @@ class backup(automat.Automat):
         return percent
 
     def _raidmakeCallback(self, params, result, dt):
-        _, _, _, blockNumber, _ = params
+        _, _, _, _, blockNumber, _ = params
         if result is None:
             if _Debug:
                 lg.out(_DebugLevel, 'backup._raidmakeCallback WARNING - result is None :  %r eof=%s dt=%s' % (blockNumber, str(self.stateEOF), str(time.time() - dt)))
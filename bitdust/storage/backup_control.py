@@ -253,14 +253,25 @@ def IncomingSupplierListFiles(newpacket, list_files_global_id):
     from bitdust.storage import index_synchronizer
     is_in_sync = index_synchronizer.is_synchronized() and backup_fs.revision() > 0
     list_files_raw = UnpackListFiles(input_data, settings.ListFilesFormat())
-    remote_files_changed, backups2remove, paths2remove, missed_backups = backup_matrix.process_raw_list_files(
-        supplier_num=num,
-        list_files_text_body=list_files_raw,
-        customer_idurl=None,
-        is_in_sync=is_in_sync,
-    )
+    revision, list_files_raw = backup_matrix.SplitListFilesRevision(list_files_raw)
+    if revision and revision['since'] is not None:
+        # supplier sent only changes made since the revision we already know
+        remote_files_changed, backups2remove, paths2remove, missed_backups = backup_matrix.process_list_files_changes(
+            supplier_num=num,
+            list_files_text_body=list_files_raw,
+            customer_idurl=None,
+        )
+    else:
+        remote_files_changed, backups2remove, paths2remove, missed_backups = backup_matrix.process_raw_list_files(
+            supplier_num=num,
+            list_files_text_body=list_files_raw,
+            customer_idurl=None,
+            is_in_sync=is_in_sync,
+        )
+    if revision:
+        backup_matrix.SetListFilesRevision(supplier_idurl, revision['epoch'], revision['revision'], customer_idurl=customer_idurl)
     list_files_orator.IncomingListFiles(newpacket)
-    if remote_files_changed:
+    if remote_files_changed and not (revision and revision['since'] is not None):
         backup_matrix.SaveLatestRawListFiles(supplier_idurl, list_files_raw)
     if _Debug:
         lg.args(_DebugLevel, s=nameurl.GetName(supplier_idurl), c=nameurl.GetName(customer_idurl), backups2remove=len(backups2remove), paths2remove=len(paths2remove), files_changed=remote_files_changed, missed_backups=len(missed_backups))
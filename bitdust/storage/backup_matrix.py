@@ -63,6 +63,7 @@ _DebugLevel = 24
 #------------------------------------------------------------------------------
 
 import os
+import array
 
 #------------------------------------------------------------------------------
 
@@ -91,8 +92,8 @@ from bitdust.userid import id_url
 
 #------------------------------------------------------------------------------
 
-_RemoteFiles = {}
-_LocalFiles = {}
+_RemoteFiles = None
+_LocalFiles = None
 _RemoteMaxBlockNumbers = {}
 _LocalMaxBlockNumbers = {}
 _LocalBackupSize = {}
@@ -101,6 +102,7 @@ _StatusCallBackForGuiBackup = None
 _LocalFilesNotifyCallback = None
 _UpdatedBackupIDs = set()
 _ListFilesQueryCallbacks = {}
+_ListFilesRevisions = {}
 
 #------------------------------------------------------------------------------
 
@@ -139,11 +141,14 @@ def remote_files():
       0  : no info comes yet
       1  : this file exist on given remote machine
 
-    This is a dictionary of dictionaries of dictionaries of lists. :-)))
-    Values can be accessed this way::
+    This is a dictionary of ``BlocksMatrix`` objects by backup ID, every
+    matrix is a compact array of cells. Values can be read this way::
 
       remote_files()[backupID][blockNumber][dataORparity][supplierNumber]
 
+    but must be written with ``remote_files()[backupID].set()`` or by
+    assigning the whole block row.
+
     Here the keys are:
 
     - backupID - a unique identifier of that backup, see ``lib.packetid`` module
@@ -152,6 +157,8 @@ def remote_files():
     - supplierNumber - who should keep that piece?
     """
     global _RemoteFiles
+    if _RemoteFiles is None:
+        _RemoteFiles = BackupsMatrix()
     return _RemoteFiles
 
 
@@ -172,6 +179,8 @@ def local_files():
     integers: 0 or 1 to know that local file exists or not.
     """
     global _LocalFiles
+    if _LocalFiles is None:
+        _LocalFiles = BackupsMatrix()
     return _LocalFiles
 
 
@@ -194,6 +203,207 @@ def local_backup_size():
     return _LocalBackupSize
 
 
+#------------------------------------------------------------------------------
+
+_Surfaces = {'D': 0, 'P': 1}
+
+# tables for bytes.translate(), cells are signed bytes so -1 is stored as 255
+_IsOne = bytes(1 if i == 1 else 0 for i in range(256))
+_NotOne = bytes(0 if i == 1 else 1 for i in range(256))
+_OneToZero = bytes(0 if i == 1 else i for i in range(256))
+
+
+def _mask_or(mask1, mask2):
+    return (int.from_bytes(mask1, 'big') | int.from_bytes(mask2, 'big')).to_bytes(len(mask1), 'big')
+
+
+def _mask_and(mask1, mask2):
+    return (int.from_bytes(mask1, 'big') & int.from_bytes(mask2, 'big')).to_bytes(len(mask1), 'big')
+
+
+def _mask_sum(masks, length):
+    """
+    Adds 0/1 masks byte by byte, every byte of the result is a counter per block.
+    There are no carries between bytes while number of masks is less than 256.
+    """
+    total = 0
+    for mask in masks:
+        total += int.from_bytes(mask, 'big')
+    return total.to_bytes(length, 'big')
+
+
+def _positions(mask):
+    """
+    Return indexes of all non-zero bytes in the 0/1 mask.
+    """
+    result = []
+    pos = mask.find(1)
+    while pos >= 0:
+        result.append(pos)
+        pos = mask.find(1, pos + 1)
+    return result
+
+
+class BlocksMatrix(object):
+    """
+    Keeps info about all pieces of a single backup in one flat array of
+    signed bytes: blocks x {Data, Parity} x suppliers.
+
+    The cell of the piece is at ``(blockNum*2 + surface)*suppliers + supplierNum``,
+    so every column (one surface of one supplier) is an extended slice of
+    the array and can be scanned for all blocks at once.
+
+    Object behaves like a dictionary of ``{'D': [...], 'P': [...]}`` rows
+    by block number, returned rows are copies.
+    """
+
+    def __init__(self, suppliers=0):
+        self.suppliers = suppliers
+        self.cells = array.array('b')
+        self.known = bytearray()
+
+    def __repr__(self):
+        return 'BlocksMatrix(%d blocks, %d suppliers)' % (len(self), self.suppliers)
+
+    def __len__(self):
+        return self.known.count(1)
+
+    def __contains__(self, blockNum):
+        return isinstance(blockNum, int) and 0 <= blockNum < len(self.known) and self.known[blockNum] == 1
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __getitem__(self, blockNum):
+        if blockNum not in self:
+            raise KeyError(blockNum)
+        return {
+            'D': self.row(blockNum, 'D'),
+            'P': self.row(blockNum, 'P'),
+        }
+
+    def __setitem__(self, blockNum, value):
+        self.add_block(blockNum, max(len(value['D']), len(value['P'])))
+        for dataORparity in ('D', 'P'):
+            offset = self.offset(blockNum, dataORparity, 0)
+            row = [0]*self.suppliers
+            row[:len(value[dataORparity])] = value[dataORparity]
+            self.cells[offset:offset + self.suppliers] = array.array('b', row)
+
+    def __delitem__(self, blockNum):
+        if blockNum not in self:
+            raise KeyError(blockNum)
+        offset = self.offset(blockNum, 'D', 0)
+        self.cells[offset:offset + 2*self.suppliers] = array.array('b', bytes(2*self.suppliers))
+        self.known[blockNum] = 0
+
+    def keys(self):
+        return _positions(self.known)
+
+    def items(self):
+        return [(blockNum, self[blockNum]) for blockNum in self.keys()]
+
+    def get(self, blockNum, default=None):
+        if blockNum not in self:
+            return default
+        return self[blockNum]
+
+    def offset(self, blockNum, dataORparity, supplierNum):
+        return (blockNum*2 + _Surfaces[dataORparity])*self.suppliers + supplierNum
+
+    def expand(self, blockNum, suppliers=0):
+        """
+        Make sure the array have cells for given block number and number of suppliers.
+        """
+        if suppliers > self.suppliers:
+            cells = array.array('b', bytes(len(self.known)*2*suppliers))
+            for surface in range(2):
+                for supplierNum in range(self.suppliers):
+                    cells[surface*suppliers + supplierNum::2*suppliers] = self.cells[surface*self.suppliers + supplierNum::2*self.suppliers]
+            self.cells = cells
+            self.suppliers = suppliers
+        if blockNum >= len(self.known):
+            count = blockNum + 1 - len(self.known)
+            self.known.extend(bytes(count))
+            self.cells.frombytes(bytes(count*2*self.suppliers))
+
+    def add_block(self, blockNum, suppliers=0):
+        self.expand(blockNum, suppliers)
+        self.known[blockNum] = 1
+
+    def add_blocks(self, maxBlockNum, suppliers=0):
+        self.expand(maxBlockNum, suppliers)
+        self.known[:maxBlockNum + 1] = b'\x01'*(maxBlockNum + 1)
+
+    def set(self, blockNum, dataORparity, supplierNum, value):
+        self.expand(blockNum, supplierNum + 1)
+        self.cells[self.offset(blockNum, dataORparity, supplierNum)] = value
+
+    def row(self, blockNum, dataORparity):
+        offset = self.offset(blockNum, dataORparity, 0)
+        return self.cells[offset:offset + self.suppliers].tolist()
+
+    def column(self, dataORparity, supplierNum, blocks=None):
+        """
+        Return values of given supplier for first ``blocks`` blocks as bytes,
+        cells of not existing blocks are zeros.
+        """
+        if blocks is None:
+            blocks = len(self.known)
+        stop = min(blocks, len(self.known))*2*self.suppliers
+        result = self.cells[self.offset(0, dataORparity, supplierNum):stop:2*self.suppliers].tobytes()
+        if len(result) < blocks:
+            result += bytes(blocks - len(result))
+        return result
+
+    def set_column(self, dataORparity, supplierNum, values):
+        stop = len(values)*2*self.suppliers
+        self.cells[self.offset(0, dataORparity, supplierNum):stop:2*self.suppliers] = array.array('b', values)
+
+    def count(self, dataORparity, supplierNum, blocks=None):
+        """
+        Number of existing pieces of given supplier.
+        """
+        return self.column(dataORparity, supplierNum, blocks).count(1)
+
+    def unknown(self, blocks):
+        """
+        Return 0/1 mask of first ``blocks`` blocks, 1 for blocks without any info.
+        """
+        result = bytes(self.known[:blocks]).translate(_NotOne)
+        if len(result) < blocks:
+            result += b'\x01'*(blocks - len(result))
+        return result
+
+    def clear_supplier(self, supplierNum):
+        """
+        Reset all existing pieces of given supplier to "no info", return number of cleared cells.
+        """
+        cleared = 0
+        if supplierNum >= self.suppliers:
+            return cleared
+        for dataORparity in ('D', 'P'):
+            values = self.column(dataORparity, supplierNum)
+            cleared += values.count(1)
+            self.set_column(dataORparity, supplierNum, values.translate(_OneToZero))
+        return cleared
+
+
+class BackupsMatrix(dict):
+    """
+    Dictionary of ``BlocksMatrix`` objects by backup ID, plain dictionaries
+    assigned here are converted.
+    """
+
+    def __setitem__(self, backupID, value):
+        if not isinstance(value, BlocksMatrix):
+            matrix = BlocksMatrix()
+            for blockNum, row in value.items():
+                matrix[blockNum] = row
+            value = matrix
+        dict.__setitem__(self, backupID, value)
+
+
 #------------------------------------------------------------------------------
 
 
@@ -618,21 +828,20 @@ def process_version_data(words, customer_idurl, backupID, supplier_num, maxBlock
                 lg.exc()
                 return None, None
     if backupID not in remote_files():
-        remote_files()[backupID] = {}
+        remote_files()[backupID] = BlocksMatrix()
         if _Debug:
             lg.out(_DebugLevel, '            new remote entry for %s created in memory' % backupID)
+    matrix = remote_files()[backupID]
     # +1 because range(2) give us [0,1] but we want [0,1,2]
-    for blockNum in range(maxBlockNum + 1):
-        if blockNum not in remote_files()[backupID]:
-            remote_files()[backupID][blockNum] = {
-                'D': [0]*contactsdb.num_suppliers(customer_idurl=customer_idurl),
-                'P': [0]*contactsdb.num_suppliers(customer_idurl=customer_idurl),
-            }
-        for dataORparity in ['Data', 'Parity']:
-            # we set -1 if the file is missing and 1 if exist, so 0 mean "no info yet" ... smart!
-            bit = -1 if str(blockNum) in missingBlocksSet[dataORparity] else 1
-            remote_files()[backupID][blockNum][dataORparity[0]][supplier_num] = bit
-            stored_files += int((bit + 1)/2)  # this should switch -1 or 1 to 0 or 1
+    matrix.add_blocks(maxBlockNum, max(contactsdb.num_suppliers(customer_idurl=customer_idurl), supplier_num + 1))
+    for dataORparity in ['Data', 'Parity']:
+        # we set -1 if the file is missing and 1 if exist, so 0 mean "no info yet" ... smart!
+        column = bytearray(b'\x01')*(maxBlockNum + 1)
+        for blockNum in missingBlocksSet[dataORparity]:
+            if blockNum.isdigit() and int(blockNum) <= maxBlockNum:
+                column[int(blockNum)] = 255
+        matrix.set_column(dataORparity[0], supplier_num, column)
+        stored_files += column.count(1)
     # save max block number for this backup
     if backupID not in remote_max_block_numbers():
         remote_max_block_numbers()[backupID] = -1
@@ -820,6 +1029,149 @@ def process_raw_list_files(supplier_num, list_files_text_body, customer_idurl=No
     return remote_files_changed, backups2remove, paths2remove, missed_backups
 
 
+def process_list_files_changes(supplier_num, list_files_text_body, customer_idurl=None):
+    """
+    Apply only changes reported by the supplier since the revision we already know, lines are like that:
+
+      Q*
+      Kmaster
+      +0/0/123/4567/F20090709034221PM/0-1-Data 434353
+      -0/0/123/4/F20090709012331PM
+
+    Here "+" is for a stored file and "-" for a removed file, version or folder.
+    Returns same values as ``process_raw_list_files()``.
+    """
+    global _ListFilesQueryCallbacks
+    if not customer_idurl:
+        customer_idurl = my_id.getIDURL()
+    customer_id = global_id.UrlToGlobalID(customer_idurl)
+    num_suppliers = contactsdb.num_suppliers(customer_idurl=customer_idurl)
+    remote_files_changed = False
+    current_key_alias = 'master'
+    current_query = None
+    updated_backups = set()
+    newfiles = 0
+    inpt = BytesIO(strng.to_bin(list_files_text_body))
+    while True:
+        line = strng.to_text(inpt.readline())
+        if line == '':
+            break
+        typ = line[0]
+        line = line[1:].rstrip('\n')
+        if line.strip() == '':
+            continue
+        if typ == 'Q':
+            current_query = line.strip()
+            continue
+        if typ == 'K':
+            current_key_alias = process_line_key(line)
+            continue
+        if current_key_alias == 'master' and not id_url.is_the_same(customer_idurl, my_id.getIDURL()):
+            continue
+        if typ == '+':
+            path = line.split(' ')[0]
+            if not packetid.Valid(path):
+                continue
+            _, remotePath, versionName, blockNum, supplierNum, dataORparity = packetid.SplitFull(path)
+            if None in [remotePath, versionName, blockNum, supplierNum] or dataORparity not in ['Data', 'Parity']:
+                continue
+            if supplierNum != supplier_num:
+                continue
+            backupID = packetid.MakeBackupID(customer=customer_id, path_id=remotePath, key_alias=current_key_alias, version=versionName)
+            if backupID not in remote_files():
+                remote_files()[backupID] = BlocksMatrix()
+            remote_files()[backupID].add_block(blockNum, num_suppliers)
+            remote_files()[backupID].set(blockNum, dataORparity[0], supplierNum, 1)
+            if blockNum > remote_max_block_numbers().get(backupID, -1):
+                remote_max_block_numbers()[backupID] = blockNum
+            updated_backups.add(backupID)
+            newfiles += 1
+            continue
+        if typ == '-':
+            path = line.strip('/')
+            if path.endswith('-Data') or path.endswith('-Parity'):
+                _, remotePath, versionName, blockNum, supplierNum, dataORparity = packetid.SplitFull(path)
+                if None in [remotePath, versionName, blockNum, supplierNum]:
+                    continue
+                backupID = packetid.MakeBackupID(customer=customer_id, path_id=remotePath, key_alias=current_key_alias, version=versionName)
+                if backupID in remote_files() and blockNum in remote_files()[backupID] and supplierNum == supplier_num:
+                    remote_files()[backupID].set(blockNum, dataORparity[0], supplierNum, -1)
+                    updated_backups.add(backupID)
+                continue
+            prefix = packetid.MakeBackupID(customer=customer_id, path_id=path, key_alias=current_key_alias)
+            for backupID in list(remote_files().keys()):
+                if backupID == prefix or backupID.startswith(prefix + '/'):
+                    if remote_files()[backupID].clear_supplier(supplier_num):
+                        updated_backups.add(backupID)
+            continue
+        raise Exception('unexpected line received: %r' % line)
+    inpt.close()
+    remote_files_changed = len(updated_backups) > 0
+    if _Debug:
+        lg.args(_DebugLevel, s=supplier_num, c=customer_idurl, q=current_query, new=newfiles, updated=len(updated_backups))
+    for backupID in updated_backups:
+        populate_remote_versions(backup_id=backupID)
+    if current_query is not None and (customer_idurl, current_query) in _ListFilesQueryCallbacks:
+        for cb in _ListFilesQueryCallbacks[(customer_idurl, current_query)]:
+            cb(supplier_num, newfiles)
+    return remote_files_changed, set(), set(), set()
+
+
+#------------------------------------------------------------------------------
+
+
+def SplitListFilesRevision(list_files_text_body):
+    """
+    Supplier can put revision of his changes journal in the first line of the list files:
+
+      R<epoch> <revision>           for a full list of files
+      R<epoch> <revision> <since>   when only changes after "since" revision are listed
+
+    Return a dictionary with those values (or None) and the rest of the text.
+    """
+    if not list_files_text_body.startswith('R'):
+        return None, list_files_text_body
+    header, _, list_files_text_body = list_files_text_body.partition('\n')
+    words = header[1:].split(' ')
+    try:
+        revision = {
+            'epoch': words[0],
+            'revision': int(words[1]),
+            'since': int(words[2]) if len(words) > 2 else None,
+        }
+    except:
+        lg.warn('incorrect list files revision header: %r' % header)
+        return None, list_files_text_body
+    return revision, list_files_text_body
+
+
+def GetListFilesRevision(supplier_idurl, customer_idurl=None):
+    """
+    Latest known revision of the supplier changes journal, to request only changes after it.
+    """
+    if not customer_idurl:
+        customer_idurl = my_id.getIDURL()
+    known = _ListFilesRevisions.get((id_url.to_bin(customer_idurl), id_url.to_bin(supplier_idurl)))
+    if not known:
+        return {
+            'epoch': '',
+            'since': -1,
+        }
+    return {
+        'epoch': known['epoch'],
+        'since': known['revision'],
+    }
+
+
+def SetListFilesRevision(supplier_idurl, epoch, revision, customer_idurl=None):
+    if not customer_idurl:
+        customer_idurl = my_id.getIDURL()
+    _ListFilesRevisions[(id_url.to_bin(customer_idurl), id_url.to_bin(supplier_idurl))] = {
+        'epoch': epoch,
+        'revision': revision,
+    }
+
+
 #------------------------------------------------------------------------------
 
 
@@ -947,24 +1299,19 @@ def RemoteFileReport(backupID, blockNum, supplierNum, dataORparity, result, item
     blockNum = int(blockNum)
     supplierNum = int(supplierNum)
     customer_idurl = packetid.CustomerIDURL(backupID)
-    if supplierNum > contactsdb.num_suppliers(customer_idurl=customer_idurl):
+    if supplierNum >= contactsdb.num_suppliers(customer_idurl=customer_idurl):
         if _Debug:
             lg.out(_DebugLevel, 'backup_matrix.RemoteFileReport got too big supplier number, possible this is an old packet')
         return
     if backupID not in remote_files():
-        remote_files()[backupID] = {}
+        remote_files()[backupID] = BlocksMatrix()
         lg.info('new remote entry for %s created in memory' % backupID)
     if blockNum not in remote_files()[backupID]:
-        remote_files()[backupID][blockNum] = {
-            'D': [0]*contactsdb.num_suppliers(customer_idurl=customer_idurl),
-            'P': [0]*contactsdb.num_suppliers(customer_idurl=customer_idurl),
-        }
+        remote_files()[backupID].add_block(blockNum, contactsdb.num_suppliers(customer_idurl=customer_idurl))
     # save backed up block info into remote info structure, synchronize on hand info
     flag = 1 if result else 0
-    if dataORparity == 'Data':
-        remote_files()[backupID][blockNum]['D'][supplierNum] = flag
-    elif dataORparity == 'Parity':
-        remote_files()[backupID][blockNum]['P'][supplierNum] = flag
+    if dataORparity in ('Data', 'Parity'):
+        remote_files()[backupID].set(blockNum, dataORparity[0], supplierNum, flag)
     else:
         lg.warn('incorrect backup ID: %s' % backupID)
     # if we know only N blocks stored on remote machine
@@ -1029,16 +1376,13 @@ def LocalFileReport(packetID=None, backupID=None, blockNum=None, supplierNum=Non
         return
     localDest = os.path.join(settings.getLocalBackupsDir(), customer, filename)
     if backupID not in local_files():
-        local_files()[backupID] = {}
+        local_files()[backupID] = BlocksMatrix()
     if blockNum not in local_files()[backupID]:
-        local_files()[backupID][blockNum] = {
-            'D': [0]*contactsdb.num_suppliers(customer_idurl=customer_idurl),
-            'P': [0]*contactsdb.num_suppliers(customer_idurl=customer_idurl),
-        }
+        local_files()[backupID].add_block(blockNum, contactsdb.num_suppliers(customer_idurl=customer_idurl))
     if not os.path.isfile(localDest):
-        local_files()[backupID][blockNum][dataORparity[0]][supplierNum] = 0
+        local_files()[backupID].set(blockNum, dataORparity[0], supplierNum, 0)
         return
-    local_files()[backupID][blockNum][dataORparity[0]][supplierNum] = 1
+    local_files()[backupID].set(blockNum, dataORparity[0], supplierNum, 1)
     if backupID not in local_max_block_numbers():
         local_max_block_numbers()[backupID] = -1
     if local_max_block_numbers()[backupID] < blockNum:
@@ -1078,25 +1422,18 @@ def LocalBlockReport(backupID, blockNumber, result):
             packetID = packetid.MakePacketID(backupID, blockNum, supplierNum, dataORparity)
             local_file = os.path.join(settings.getLocalBackupsDir(), customer, packetID)
             if backupID not in local_files():
-                local_files()[backupID] = {}
+                local_files()[backupID] = BlocksMatrix()
                 # repaint_flag = True
                 if _Debug:
                     lg.out(_DebugLevel, '    new local entry for %s created in memory' % backupID)
             if blockNum not in local_files()[backupID]:
-                local_files()[backupID][blockNum] = {
-                    'D': [
-                        0,
-                    ]*num_suppliers,
-                    'P': [
-                        0,
-                    ]*num_suppliers,
-                }
+                local_files()[backupID].add_block(blockNum, num_suppliers)
                 # repaint_flag = True
             if not os.path.isfile(local_file):
-                local_files()[backupID][blockNum][dataORparity[0]][supplierNum] = 0
+                local_files()[backupID].set(blockNum, dataORparity[0], supplierNum, 0)
                 # repaint_flag = True
                 continue
-            local_files()[backupID][blockNum][dataORparity[0]][supplierNum] = 1
+            local_files()[backupID].set(blockNum, dataORparity[0], supplierNum, 1)
             if backupID not in local_backup_size():
                 local_backup_size()[backupID] = 0
                 # repaint_flag = True
@@ -1127,7 +1464,7 @@ def ScanMissingBlocks(backupID):
     if _Debug:
         lg.out(_DebugLevel, 'backup_matrix.ScanMissingBlocks for %s' % backupID)
     customer_idurl = packetid.CustomerIDURL(backupID)
-    missingBlocks = set()
+    missingBlocks = []
     localMaxBlockNum = local_max_block_numbers().get(backupID, -1)
     remoteMaxBlockNum = remote_max_block_numbers().get(backupID, -1)
     supplierActiveArray = GetActiveArray(customer_idurl=customer_idurl)
@@ -1145,51 +1482,45 @@ def ScanMissingBlocks(backupID):
             # need to scan all block numbers
             if _Debug:
                 lg.out(_DebugLevel, '    no remote info but found local info, maxBlockNum=%d' % localMaxBlockNum)
-            for blockNum in range(localMaxBlockNum + 1):
-                # we check for Data and Parity packets
-                localData = GetLocalDataArray(backupID, blockNum)
-                localParity = GetLocalParityArray(backupID, blockNum)
-                for supplierNum in range(len(supplierActiveArray)):
-                    # if supplier is not alive we can not send to him
-                    # so no need to scan for missing blocks
-                    if supplierActiveArray[supplierNum] != 1:
-                        continue
-                    if localData[supplierNum] == 1:
-                        missingBlocks.add(blockNum)
-                    if localParity[supplierNum] == 1:
-                        missingBlocks.add(blockNum)
+            localMatrix = local_files()[backupID]
+            blocks = localMaxBlockNum + 1
+            missing = bytes(blocks)
+            for supplierNum in range(len(supplierActiveArray)):
+                # if supplier is not alive we can not send to him
+                # so no need to scan for missing blocks
+                if supplierActiveArray[supplierNum] != 1 or supplierNum >= localMatrix.suppliers:
+                    continue
+                missing = _mask_or(missing, localMatrix.column('D', supplierNum, blocks).translate(_IsOne))
+                missing = _mask_or(missing, localMatrix.column('P', supplierNum, blocks).translate(_IsOne))
+            missingBlocks = _positions(missing)
     else:
         # now we have some remote info
         # we take max block number from local and remote
         maxBlockNum = max(remoteMaxBlockNum, localMaxBlockNum)
         if _Debug:
             lg.out(_DebugLevel, '    found remote info, maxBlockNum=%d' % maxBlockNum)
+        remoteMatrix = remote_files()[backupID]
         # and increase by one because range(3) give us [0, 1, 2], but we want [0, 1, 2, 3]
-        for blockNum in range(maxBlockNum + 1):
-            # if we have few remote files, but many locals - we want to send all missed
-            if blockNum not in remote_files()[backupID]:
-                missingBlocks.add(blockNum)
+        blocks = maxBlockNum + 1
+        # if we have few remote files, but many locals - we want to send all missed
+        missing = remoteMatrix.unknown(blocks)
+        # now check every our supplier for every block
+        for supplierNum in range(len(supplierActiveArray)):
+            # if supplier is not alive we can not send to him
+            # so no need to scan for missing blocks
+            if supplierActiveArray[supplierNum] != 1:
                 continue
-            # take remote info for this block
-            remoteData = GetRemoteDataArray(backupID, blockNum)
-            remoteParity = GetRemoteParityArray(backupID, blockNum)
-            # now check every our supplier for every block
-            for supplierNum in range(len(supplierActiveArray)):
-                # if supplier is not alive we can not send to him
-                # so no need to scan for missing blocks
-                if supplierActiveArray[supplierNum] != 1:
-                    continue
-                if supplierNum >= len(remoteData) or supplierNum >= len(remoteParity):
-                    missingBlocks.add(blockNum)
-                    continue
-                if remoteData[supplierNum] != 1:  # -1 means missing
-                    missingBlocks.add(blockNum)  # 0 - no info yet
-                if remoteParity[supplierNum] != 1:  # 1 - file exist on remote supplier
-                    missingBlocks.add(blockNum)
+            if supplierNum >= remoteMatrix.suppliers:
+                missing = b'\x01'*blocks
+                break
+            # -1 means missing, 0 - no info yet, 1 - file exist on remote supplier
+            missing = _mask_or(missing, remoteMatrix.column('D', supplierNum, blocks).translate(_NotOne))
+            missing = _mask_or(missing, remoteMatrix.column('P', supplierNum, blocks).translate(_NotOne))
+        missingBlocks = _positions(missing)
 
     if _Debug:
         lg.out(_DebugLevel, '    missingBlocks=%s' % missingBlocks)
-    return list(missingBlocks)
+    return missingBlocks
 
 
 def ScanBlocksToRemove(backupID, check_all_suppliers=True):
@@ -1209,16 +1540,22 @@ def ScanBlocksToRemove(backupID, check_all_suppliers=True):
     if backupID not in remote_files() or backupID not in local_files():
         # no info about this backup yet - skip
         return packets
-    for blockNum in range(localMaxBlockNum + 1):
+    remoteMatrix = remote_files()[backupID]
+    localMatrix = local_files()[backupID]
+    blocks = localMaxBlockNum + 1
+    # if some supplier do not have some data for that block - do not remove any local files for that block!
+    # we do remove the local files only when we sure all suppliers got the all data pieces
+    # also if we do not have any info about this block for some supplier do not remove other local pieces
+    delivered = remoteMatrix.unknown(blocks).translate(_NotOne)
+    for supplierNum in range(remoteMatrix.suppliers):
+        delivered = _mask_and(delivered, remoteMatrix.column('D', supplierNum, blocks).translate(_IsOne))
+        delivered = _mask_and(delivered, remoteMatrix.column('P', supplierNum, blocks).translate(_IsOne))
+    stored = bytes(blocks)
+    for supplierNum in range(localMatrix.suppliers):
+        stored = _mask_or(stored, localMatrix.column('D', supplierNum, blocks).translate(_IsOne))
+        stored = _mask_or(stored, localMatrix.column('P', supplierNum, blocks).translate(_IsOne))
+    for blockNum in _positions(_mask_and(delivered, stored)):
         localArray = {'Data': GetLocalDataArray(backupID, blockNum), 'Parity': GetLocalParityArray(backupID, blockNum)}
-        remoteArray = {'Data': GetRemoteDataArray(backupID, blockNum), 'Parity': GetRemoteParityArray(backupID, blockNum)}
-        if (0 in remoteArray['Data']) or (0 in remoteArray['Parity']):
-            # if some supplier do not have some data for that block - do not remove any local files for that block!
-            # we do remove the local files only when we sure all suppliers got the all data pieces
-            continue
-        if (-1 in remoteArray['Data']) or (-1 in remoteArray['Parity']):
-            # also if we do not have any info about this block for some supplier do not remove other local pieces
-            continue
         for supplierNum in range(contactsdb.num_suppliers(customer_idurl=customer_idurl)):
             supplierIDURL = contactsdb.supplier(supplierNum, customer_idurl=customer_idurl)
             if not supplierIDURL:
@@ -1259,44 +1596,33 @@ def ScanBlocksToSend(backupID, limit_per_supplier=None):
     bySupplier = {}
     for supplierNum in range(len(supplierActiveArray)):
         bySupplier[supplierNum] = set()
-    if backupID not in remote_files():
-        # if _Debug:
-        #     lg.out(_DebugLevel, 'backup_matrix.ScanBlocksToSend  backupID %r not found in remote files' % backupID)
-        for blockNum in range(localMaxBlockNum + 1):
-            localData = GetLocalDataArray(backupID, blockNum)
-            localParity = GetLocalParityArray(backupID, blockNum)
-            for supplierNum in range(len(supplierActiveArray)):
-                if supplierActiveArray[supplierNum] != 1:
-                    continue
-                if supplierNum >= len(localData) or supplierNum >= len(localParity):
-                    continue
-                if localData[supplierNum] == 1:
-                    bySupplier[supplierNum].add(packetid.MakePacketID(backupID, blockNum, supplierNum, 'Data'))
-                if localParity[supplierNum] == 1:
-                    bySupplier[supplierNum].add(packetid.MakePacketID(backupID, blockNum, supplierNum, 'Parity'))
-                if limit_per_supplier:
-                    if len(bySupplier[supplierNum]) > limit_per_supplier:
-                        break
-    else:
-        # if _Debug:
-        #     lg.out(_DebugLevel, 'backup_matrix.ScanBlocksToSend  backupID %r was found in remote files' % backupID)
-        for blockNum in range(localMaxBlockNum + 1):
-            remoteData = GetRemoteDataArray(backupID, blockNum)
-            remoteParity = GetRemoteParityArray(backupID, blockNum)
-            localData = GetLocalDataArray(backupID, blockNum)
-            localParity = GetLocalParityArray(backupID, blockNum)
-            for supplierNum in range(len(supplierActiveArray)):
-                if supplierActiveArray[supplierNum] != 1:
-                    continue
-                if supplierNum >= len(remoteData) or supplierNum >= len(remoteParity):
-                    continue
-                if remoteData[supplierNum] != 1 and localData[supplierNum] == 1:
-                    bySupplier[supplierNum].add(packetid.MakePacketID(backupID, blockNum, supplierNum, 'Data'))
-                if remoteParity[supplierNum] != 1 and localParity[supplierNum] == 1:
-                    bySupplier[supplierNum].add(packetid.MakePacketID(backupID, blockNum, supplierNum, 'Parity'))
-                if limit_per_supplier:
-                    if len(bySupplier[supplierNum]) > limit_per_supplier:
-                        break
+    if backupID not in local_files():
+        return bySupplier
+    localMatrix = local_files()[backupID]
+    remoteMatrix = remote_files().get(backupID)
+    blocks = localMaxBlockNum + 1
+    for supplierNum in range(len(supplierActiveArray)):
+        if supplierActiveArray[supplierNum] != 1:
+            continue
+        if supplierNum >= localMatrix.suppliers:
+            continue
+        toSend = {}
+        for dataORparity in ['Data', 'Parity']:
+            toSend[dataORparity] = localMatrix.column(dataORparity[0], supplierNum, blocks).translate(_IsOne)
+            if remoteMatrix is None:
+                continue
+            if supplierNum >= remoteMatrix.suppliers:
+                # only blocks without any remote info, no info about that supplier in others
+                toSend[dataORparity] = _mask_and(toSend[dataORparity], remoteMatrix.unknown(blocks))
+            else:
+                toSend[dataORparity] = _mask_and(toSend[dataORparity], remoteMatrix.column(dataORparity[0], supplierNum, blocks).translate(_NotOne))
+        for blockNum in _positions(_mask_or(toSend['Data'], toSend['Parity'])):
+            for dataORparity in ['Data', 'Parity']:
+                if toSend[dataORparity][blockNum]:
+                    bySupplier[supplierNum].add(packetid.MakePacketID(backupID, blockNum, supplierNum, dataORparity))
+            if limit_per_supplier:
+                if len(bySupplier[supplierNum]) > limit_per_supplier:
+                    break
     return bySupplier
 
 
@@ -1343,6 +1669,7 @@ def ClearRemoteInfo():
     """
     remote_files().clear()
     remote_max_block_numbers().clear()
+    _ListFilesRevisions.clear()
 
 
 def ClearSupplierRemoteInfo(supplierNum, customer_idurl=None, key_alias=None):
@@ -1358,19 +1685,7 @@ def ClearSupplierRemoteInfo(supplierNum, customer_idurl=None, key_alias=None):
         _key_alias, _customer_idurl = packetid.KeyAliasCustomer(backupID)
         if _customer_idurl == customer_idurl and (key_alias is None or key_alias == 'master' or _key_alias == key_alias):
             backups += 1
-            for blockNum in remote_files()[backupID].keys():
-                try:
-                    if remote_files()[backupID][blockNum]['D'][supplierNum] == 1:
-                        files += 1
-                        remote_files()[backupID][blockNum]['D'][supplierNum] = 0
-                except:
-                    pass
-                try:
-                    if remote_files()[backupID][blockNum]['P'][supplierNum] == 1:
-                        files += 1
-                        remote_files()[backupID][blockNum]['P'][supplierNum] = 0
-                except:
-                    pass
+            files += remote_files()[backupID].clear_supplier(supplierNum)
     if _Debug:
         lg.args(_DebugLevel, files_cleaned=files, backups_cleaned=backups, supplier_pos=supplierNum, c=customer_idurl, k=key_alias)
     return files
@@ -1392,21 +1707,14 @@ def GetBackupStats(backupID):
     maxBlockNum = GetKnownMaxBlockNum(backupID)
     fileNumbers = [0]*contactsdb.num_suppliers(customer_idurl=customer_idurl)
     totalNumberOfFiles = 0
-    for blockNum in remote_files()[backupID].keys():
-        for supplierNum in range(len(fileNumbers)):
-            if supplierNum < contactsdb.num_suppliers(customer_idurl=customer_idurl):
-                if supplierNum < len(remote_files()[backupID][blockNum]['D']):
-                    if remote_files()[backupID][blockNum]['D'][supplierNum] == 1:
-                        fileNumbers[supplierNum] += 1
-                        totalNumberOfFiles += 1
-                else:
-                    lg.warn('wrong supplier position %d for customer %r in backup Data matrix, backupID=%r' % (supplierNum, customer_idurl, backupID))
-                if supplierNum < len(remote_files()[backupID][blockNum]['P']):
-                    if remote_files()[backupID][blockNum]['P'][supplierNum] == 1:
-                        fileNumbers[supplierNum] += 1
-                        totalNumberOfFiles += 1
-                else:
-                    lg.warn('wrong supplier position %d for customer %r in backup Parity matrix, backupID=%r' % (supplierNum, customer_idurl, backupID))
+    remoteMatrix = remote_files()[backupID]
+    for supplierNum in range(len(fileNumbers)):
+        if supplierNum >= remoteMatrix.suppliers:
+            if len(remoteMatrix):
+                lg.warn('wrong supplier position %d for customer %r in backup matrix, backupID=%r' % (supplierNum, customer_idurl, backupID))
+            continue
+        fileNumbers[supplierNum] = remoteMatrix.count('D', supplierNum) + remoteMatrix.count('P', supplierNum)
+        totalNumberOfFiles += fileNumbers[supplierNum]
     statsArray = []
     for supplierNum in range(contactsdb.num_suppliers(customer_idurl=customer_idurl)):
         if maxBlockNum > -1:
@@ -1434,20 +1742,10 @@ def GetBackupLocalStats(backupID):
     percentPerSupplier = 100.0/contactsdb.num_suppliers(customer_idurl=customer_idurl)
     totalNumberOfFiles = 0
     fileNumbers = [0]*contactsdb.num_suppliers(customer_idurl=customer_idurl)
-    for blockNum in range(maxBlockNum + 1):
-        if blockNum not in list(local_files()[backupID].keys()):
-            continue
-
-
-#    for blockNum in local_files()[backupID].keys():
-        for supplierNum in range(len(fileNumbers)):
-            if supplierNum < contactsdb.num_suppliers(customer_idurl=customer_idurl):
-                if local_files()[backupID][blockNum]['D'][supplierNum] == 1:
-                    fileNumbers[supplierNum] += 1
-                    totalNumberOfFiles += 1
-                if local_files()[backupID][blockNum]['P'][supplierNum] == 1:
-                    fileNumbers[supplierNum] += 1
-                    totalNumberOfFiles += 1
+    localMatrix = local_files()[backupID]
+    for supplierNum in range(min(len(fileNumbers), localMatrix.suppliers)):
+        fileNumbers[supplierNum] = localMatrix.count('D', supplierNum, maxBlockNum + 1) + localMatrix.count('P', supplierNum, maxBlockNum + 1)
+        totalNumberOfFiles += fileNumbers[supplierNum]
     statsArray = []
     for supplierNum in range(contactsdb.num_suppliers(customer_idurl=customer_idurl)):
         if maxBlockNum > -1:
@@ -1475,12 +1773,9 @@ def GetBackupBlocksAndPercent(backupID):
     customer_idurl = packetid.CustomerIDURL(backupID)
     # we count all remote files for this backup
     fileCounter = 0
-    for blockNum in remote_files()[backupID].keys():
-        for supplierNum in range(contactsdb.num_suppliers(customer_idurl=customer_idurl)):
-            if remote_files()[backupID][blockNum]['D'][supplierNum] == 1:
-                fileCounter += 1
-            if remote_files()[backupID][blockNum]['P'][supplierNum] == 1:
-                fileCounter += 1
+    remoteMatrix = remote_files()[backupID]
+    for supplierNum in range(min(contactsdb.num_suppliers(customer_idurl=customer_idurl), remoteMatrix.suppliers)):
+        fileCounter += remoteMatrix.count('D', supplierNum) + remoteMatrix.count('P', supplierNum)
     # +1 since zero based and *0.5 because Data and Parity
     return maxBlockNum + 1, 100.0*0.5*fileCounter/((maxBlockNum + 1)*contactsdb.num_suppliers(customer_idurl=customer_idurl))
 
@@ -1511,32 +1806,27 @@ def GetBackupRemoteStats(backupID, only_available_files=True):
     weakBlockNum = -1
     lessSuppliers = supplierCount
     activeArray = GetActiveArray(customer_idurl=customer_idurl)
+    remoteMatrix = remote_files()[backupID]
+    blocks = maxBlockNum + 1
     # we count all remote files for this backup - scan all blocks
-    for blockNum in range(maxBlockNum + 1):
-        if blockNum not in list(remote_files()[backupID].keys()):
-            lessSuppliers = 0
-            weakBlockNum = blockNum
+    goodMasks = []
+    for supplierNum in range(min(supplierCount, remoteMatrix.suppliers)):
+        if activeArray[supplierNum] != 1 and only_available_files:
             continue
-        goodSuppliers = supplierCount
-        for supplierNum in range(supplierCount):
-            if activeArray[supplierNum] != 1 and only_available_files:
-                goodSuppliers -= 1
-                continue
-            try:
-                remote_files()[backupID][blockNum]['D'][supplierNum]
-                remote_files()[backupID][blockNum]['P'][supplierNum]
-            except:
-                goodSuppliers -= 1
-                continue
-            if remote_files()[backupID][blockNum]['D'][supplierNum] != 1 or remote_files()[backupID][blockNum]['P'][supplierNum] != 1:
-                goodSuppliers -= 1
-            if remote_files()[backupID][blockNum]['D'][supplierNum] == 1:
-                fileCounter += 1
-            if remote_files()[backupID][blockNum]['P'][supplierNum] == 1:
-                fileCounter += 1
-        if goodSuppliers < lessSuppliers:
-            lessSuppliers = goodSuppliers
-            weakBlockNum = blockNum
+        dataColumn = remoteMatrix.column('D', supplierNum, blocks)
+        parityColumn = remoteMatrix.column('P', supplierNum, blocks)
+        fileCounter += dataColumn.count(1) + parityColumn.count(1)
+        goodMasks.append(_mask_and(dataColumn.translate(_IsOne), parityColumn.translate(_IsOne)))
+    lastUnknownBlockNum = remoteMatrix.unknown(blocks).rfind(1)
+    if lastUnknownBlockNum >= 0:
+        # block without any info is the worst one
+        lessSuppliers = 0
+        weakBlockNum = lastUnknownBlockNum
+    else:
+        goodSuppliers = _mask_sum(goodMasks, blocks)
+        if min(goodSuppliers) < lessSuppliers:
+            lessSuppliers = min(goodSuppliers)
+            weakBlockNum = goodSuppliers.index(lessSuppliers)
     # +1 since zero based and *0.5 because Data and Parity
     return (
         maxBlockNum + 1,
@@ -1622,7 +1912,7 @@ def GetLocalDataArray(backupID, blockNum):
         return [
             0,
         ]*contactsdb.num_suppliers(customer_idurl=customer_idurl)
-    return local_files()[backupID][blockNum]['D']
+    return local_files()[backupID].row(blockNum, 'D')
 
 
 def GetLocalParityArray(backupID, blockNum):
@@ -1635,7 +1925,7 @@ def GetLocalParityArray(backupID, blockNum):
         return [0]*contactsdb.num_suppliers(customer_idurl=customer_idurl)
     if blockNum not in local_files()[backupID]:
         return [0]*contactsdb.num_suppliers(customer_idurl=customer_idurl)
-    return local_files()[backupID][blockNum]['P']
+    return local_files()[backupID].row(blockNum, 'P')
 
 
 def GetRemoteMatrix(backupID, blockNum):
@@ -1663,7 +1953,7 @@ def GetRemoteDataArray(backupID, blockNum):
         return [0]*contactsdb.num_suppliers(customer_idurl=customer_idurl)
     if blockNum not in remote_files()[backupID]:
         return [0]*contactsdb.num_suppliers(customer_idurl=customer_idurl)
-    return remote_files()[backupID][blockNum]['D']
+    return remote_files()[backupID].row(blockNum, 'D')
 
 
 def GetRemoteParityArray(backupID, blockNum):
@@ -1676,7 +1966,7 @@ def GetRemoteParityArray(backupID, blockNum):
         return [0]*contactsdb.num_suppliers(customer_idurl=customer_idurl)
     if blockNum not in remote_files()[backupID]:
         return [0]*contactsdb.num_suppliers(customer_idurl=customer_idurl)
-    return remote_files()[backupID][blockNum]['P']
+    return remote_files()[backupID].row(blockNum, 'P')
 
 
 def GetSupplierStats(supplierNum, customer_idurl=None):
@@ -1688,23 +1978,42 @@ def GetSupplierStats(supplierNum, customer_idurl=None):
     for backupID in remote_files().keys():
         if customer_idurl != packetid.CustomerIDURL(backupID):
             continue
+        remoteMatrix = remote_files()[backupID]
         result[backupID] = {
             'data': 0,
             'parity': 0,
-            'total': 0,
+            'total': 2*len(remoteMatrix),
         }
-        for blockNum in remote_files()[backupID].keys():
-            if remote_files()[backupID][blockNum]['D'][supplierNum] == 1:
-                result[backupID]['data'] += 1
-                files += 1
-            if remote_files()[backupID][blockNum]['P'][supplierNum] == 1:
-                result[backupID]['parity'] += 1
-                files += 1
-            result[backupID]['total'] += 2
-            total += 2
+        if supplierNum < remoteMatrix.suppliers:
+            result[backupID]['data'] = remoteMatrix.count('D', supplierNum)
+            result[backupID]['parity'] = remoteMatrix.count('P', supplierNum)
+        files += result[backupID]['data'] + result[backupID]['parity']
+        total += result[backupID]['total']
     return files, total, result
 
 
+def _weak_block(matrix, maxBlockNum, supplierCount, activeArray=None):
+    blocks = maxBlockNum + 1
+    firstUnknownBlockNum = matrix.unknown(blocks).find(1)
+    if firstUnknownBlockNum >= 0:
+        return firstUnknownBlockNum, 0, supplierCount
+    if blocks == 0:
+        return -1, supplierCount, supplierCount
+    goodMasks = []
+    for supplierNum in range(min(supplierCount, matrix.suppliers)):
+        if activeArray is not None and activeArray[supplierNum] != 1:
+            continue
+        goodMasks.append(_mask_and(
+            matrix.column('D', supplierNum, blocks).translate(_IsOne),
+            matrix.column('P', supplierNum, blocks).translate(_IsOne),
+        ))
+    goodSuppliers = _mask_sum(goodMasks, blocks)
+    lessSuppliers = min(goodSuppliers)
+    if lessSuppliers >= supplierCount:
+        return -1, supplierCount, supplierCount
+    return goodSuppliers.index(lessSuppliers), lessSuppliers, supplierCount
+
+
 def GetWeakLocalBlock(backupID):
     """
     Scan all "local" blocks for given backup and find the most "weak" block.
@@ -1714,19 +2023,7 @@ def GetWeakLocalBlock(backupID):
     if backupID not in local_files():
         return -1, 0, supplierCount
     maxBlockNum = GetKnownMaxBlockNum(backupID)
-    weakBlockNum = -1
-    lessSuppliers = supplierCount
-    for blockNum in range(maxBlockNum + 1):
-        if blockNum not in list(local_files()[backupID].keys()):
-            return blockNum, 0, supplierCount
-        goodSuppliers = supplierCount
-        for supplierNum in range(supplierCount):
-            if local_files()[backupID][blockNum]['D'][supplierNum] != 1 or local_files()[backupID][blockNum]['P'][supplierNum] != 1:
-                goodSuppliers -= 1
-        if goodSuppliers < lessSuppliers:
-            lessSuppliers = goodSuppliers
-            weakBlockNum = blockNum
-    return weakBlockNum, lessSuppliers, supplierCount
+    return _weak_block(local_files()[backupID], maxBlockNum, supplierCount)
 
 
 def GetWeakRemoteBlock(backupID):
@@ -1739,23 +2036,8 @@ def GetWeakRemoteBlock(backupID):
     if backupID not in remote_files():
         return -1, 0, supplierCount
     maxBlockNum = GetKnownMaxBlockNum(backupID)
-    weakBlockNum = -1
-    lessSuppliers = supplierCount
     activeArray = GetActiveArray(customer_idurl=customer_idurl)
-    for blockNum in range(maxBlockNum + 1):
-        if blockNum not in list(remote_files()[backupID].keys()):
-            return blockNum, 0, supplierCount
-        goodSuppliers = supplierCount
-        for supplierNum in range(supplierCount):
-            if activeArray[supplierNum] != 1:
-                goodSuppliers -= 1
-                continue
-            if remote_files()[backupID][blockNum]['D'][supplierNum] != 1 or remote_files()[backupID][blockNum]['P'][supplierNum] != 1:
-                goodSuppliers -= 1
-        if goodSuppliers < lessSuppliers:
-            lessSuppliers = goodSuppliers
-            weakBlockNum = blockNum
-    return weakBlockNum, lessSuppliers, supplierCount
+    return _weak_block(remote_files()[backupID], maxBlockNum, supplierCount, activeArray)
 
 
 #------------------------------------------------------------------------------
@@ -42,13 +42,16 @@ _DebugLevel = 10
 
 import os
 import sys
+import threading
 from io import open
+from collections import deque
 
 #------------------------------------------------------------------------------
 
 from twisted.internet import reactor  # @UnresolvedImport
 from twisted.internet import threads
 from twisted.internet.defer import Deferred
+from twisted.python import threadable
 
 #------------------------------------------------------------------------------
 
@@ -71,26 +74,44 @@ BYTES_LOOP_CLOSED = 2
 
 #------------------------------------------------------------------------------
 
+_MaxBufferSize = 16*1024*1024
+
+#------------------------------------------------------------------------------
+
 
 class BytesLoop:
 
-    def __init__(self, s=b''):
-        self._buffer = s
+    """
+    A pipe between the thread producing tar archive and the reader running in the main thread.
+    Written data is kept as a queue of chunks, so reading never copies the rest of the buffer.
+    When ``max_buffer_size`` bytes were written but not yet read the writer thread is blocked
+    until the reader catches up.
+    """
+
+    def __init__(self, s=b'', max_buffer_size=None):
+        self._chunks = deque()
+        self._buffer_size = 0
+        self._pending_size = 0
+        self._max_buffer_size = max_buffer_size or _MaxBufferSize
+        self._condition = threading.Condition()
         self._reader = None
         self._last_read = -1
         self._finished = False
         self._closed = False
         self._bytes_read = 0
         self._bytes_wrote = 0
+        if s:
+            self._pending_size += len(s)
+            self._write(s)
 
     def read_defer(self, n=-1):
         if self._reader:
             raise Exception('already reading')
         if _Debug:
-            lg.args(_DebugLevel, n=n, b=len(self._buffer), f=self._finished)
+            lg.args(_DebugLevel, n=n, b=self._buffer_size, f=self._finished)
         self._reader = (Deferred(), n)
         chunk = None
-        if len(self._buffer) > 0:
+        if self._buffer_size > 0:
             chunk = self.read(n=n)
         else:
             if self._finished:
@@ -103,26 +124,60 @@ class BytesLoop:
         return d
 
     def read(self, n=-1):
-        before_bytes = len(self._buffer)
-        chunk = self._buffer[:n]
-        self._buffer = self._buffer[n:]
-        after_bytes = len(self._buffer)
+        before_bytes = self._buffer_size
+        if n is None or n < 0 or n >= self._buffer_size:
+            chunk = b''.join(self._chunks)
+            self._chunks.clear()
+        else:
+            parts = []
+            need = n
+            while need > 0:
+                first = self._chunks[0]
+                if len(first) <= need:
+                    parts.append(self._chunks.popleft())
+                    need -= len(first)
+                else:
+                    first = memoryview(first)
+                    parts.append(first[:need])
+                    self._chunks[0] = first[need:]
+                    need = 0
+            chunk = b''.join(parts)
+        self._buffer_size -= len(chunk)
+        after_bytes = self._buffer_size
         self._last_read = len(chunk)
         self._bytes_read += self._last_read
+        if self._last_read:
+            with self._condition:
+                self._pending_size -= self._last_read
+                self._condition.notify_all()
         if _Debug:
             lg.args(_DebugLevel, before_bytes=before_bytes, after_bytes=after_bytes, chunk_bytes=len(chunk))
         return chunk
 
     def write(self, chunk):
+        if not isinstance(chunk, bytes):
+            chunk = bytes(chunk)
+        with self._condition:
+            if not threadable.isInIOThread():
+                # block the writer thread until the reader consumed enough data
+                while not self._closed and self._pending_size >= self._max_buffer_size:
+                    self._condition.wait()
+            if self._closed:
+                return
+            self._pending_size += len(chunk)
         reactor.callFromThread(self._write, chunk)  # @UndefinedVariable
 
     def _write(self, chunk):
         chunk_sz = len(chunk)
-        self._buffer += chunk
+        if self._closed:
+            return
+        if chunk_sz:
+            self._chunks.append(chunk)
+            self._buffer_size += chunk_sz
         self._bytes_wrote += chunk_sz
         if _Debug:
-            lg.args(_DebugLevel, buffer_bytes=len(self._buffer), chunk_bytes=chunk_sz)
-        if len(self._buffer) > 0:
+            lg.args(_DebugLevel, buffer_bytes=self._buffer_size, chunk_bytes=chunk_sz)
+        if self._buffer_size > 0:
             if self._reader:
                 chunk = self.read(n=self._reader[1])
                 d = self._reader[0]
@@ -134,19 +189,34 @@ class BytesLoop:
             d = self._reader[0]
             self._reader = None
             reactor.callFromThread(d.callback, b'')  # @UndefinedVariable
-        self._closed = True
-        self._buffer = b''
+        with self._condition:
+            self._closed = True
+            self._chunks.clear()
+            self._buffer_size = 0
+            self._pending_size = 0
+            self._condition.notify_all()
 
     def kill(self):
         self.close()
 
     def mark_finished(self):
+        if not threadable.isInIOThread():
+            # make sure all chunks written before are already in the buffer
+            reactor.callFromThread(self._mark_finished)  # @UndefinedVariable
+            return
+        self._mark_finished()
+
+    def _mark_finished(self):
         self._finished = True
+        if self._reader and self._buffer_size == 0:
+            d = self._reader[0]
+            self._reader = None
+            reactor.callFromThread(d.callback, b'')  # @UndefinedVariable
 
     def state(self):
         if self._closed:
             return BYTES_LOOP_CLOSED
-        if len(self._buffer) > 0:
+        if self._buffer_size > 0:
             if self._reader:
                 return BYTES_LOOP_EMPTY
             return BYTES_LOOP_READY2READ
@@ -162,7 +232,113 @@ class BytesLoop:
 #------------------------------------------------------------------------------
 
 
-def backuptarfile_thread(filepath, arcname=None, compress=None):
+class ExtractLoop:
+
+    """
+    A pipe between the restore process running in the main thread and the tar extractor running in a thread.
+    Writing never blocks the main thread, the extractor thread is waiting inside ``read()`` for more data.
+    Writer can use ``when_writable()`` to pause until the extractor consumed enough data.
+    """
+
+    def __init__(self, max_buffer_size=None):
+        self._chunks = deque()
+        self._buffer_size = 0
+        self._max_buffer_size = max_buffer_size or _MaxBufferSize
+        self._condition = threading.Condition()
+        self._writable = []
+        self._finished = False
+        self._closed = False
+        self._bytes_read = 0
+        self._bytes_wrote = 0
+
+    def write(self, chunk):
+        if not chunk:
+            return
+        if not isinstance(chunk, bytes):
+            chunk = bytes(chunk)
+        with self._condition:
+            if self._closed:
+                return
+            self._chunks.append(chunk)
+            self._buffer_size += len(chunk)
+            self._bytes_wrote += len(chunk)
+            self._condition.notify_all()
+        if _Debug:
+            lg.args(_DebugLevel, buffer_bytes=self._buffer_size, chunk_bytes=len(chunk))
+
+    def when_writable(self):
+        """
+        Returns Deferred object which is fired when buffered data is smaller than ``max_buffer_size``.
+        Result is False if the stream was closed and no more data can be written.
+        """
+        d = Deferred()
+        with self._condition:
+            closed = self._closed
+            ready = closed or self._buffer_size < self._max_buffer_size
+            if not ready:
+                self._writable.append(d)
+        if ready:
+            d.callback(not closed)
+        return d
+
+    def read(self, n=-1):
+        """
+        Executed in the extractor thread, returns empty bytes only when all data was already read.
+        """
+        with self._condition:
+            while not self._chunks and not self._finished and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                raise IOError('stream was closed')
+            if not self._chunks:
+                return b''
+            if n is None or n < 0 or n >= self._buffer_size:
+                chunk = b''.join(self._chunks)
+                self._chunks.clear()
+            else:
+                parts = []
+                need = n
+                while need > 0:
+                    first = self._chunks[0]
+                    if len(first) <= need:
+                        parts.append(self._chunks.popleft())
+                        need -= len(first)
+                    else:
+                        parts.append(first[:need])
+                        self._chunks[0] = first[need:]
+                        need = 0
+                chunk = b''.join(parts)
+            self._buffer_size -= len(chunk)
+            self._bytes_read += len(chunk)
+            waiting = []
+            if self._writable and self._buffer_size < self._max_buffer_size:
+                waiting = self._writable
+                self._writable = []
+        for d in waiting:
+            reactor.callFromThread(d.callback, True)  # @UndefinedVariable
+        return chunk
+
+    def mark_finished(self):
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._chunks.clear()
+            self._buffer_size = 0
+            waiting = self._writable
+            self._writable = []
+            self._condition.notify_all()
+        for d in waiting:
+            d.callback(False)
+
+
+#------------------------------------------------------------------------------
+
+
+def backuptarfile_thread(filepath, arcname=None, compress=None, max_buffer_size=None):
     """
     Makes tar archive of a single file inside a thread.
     Returns `BytesLoop` object instance which can be used to read produced data in parallel.
@@ -172,7 +348,7 @@ def backuptarfile_thread(filepath, arcname=None, compress=None):
         return None
     if arcname is None:
         arcname = os.path.basename(filepath)
-    p = BytesLoop()
+    p = BytesLoop(max_buffer_size=max_buffer_size)
 
     def _run():
         from bitdust.storage import tar_file
@@ -193,7 +369,7 @@ def backuptarfile_thread(filepath, arcname=None, compress=None):
     return p
 
 
-def backuptardir_thread(directorypath, arcname=None, recursive_subfolders=True, compress=None):
+def backuptardir_thread(directorypath, arcname=None, recursive_subfolders=True, compress=None, max_buffer_size=None):
     """
     Makes tar archive of a folder inside a thread.
     Returns `BytesLoop` object instance which can be used to read produced data in parallel.
@@ -203,7 +379,7 @@ def backuptardir_thread(directorypath, arcname=None, recursive_subfolders=True,
         return None
     if arcname is None:
         arcname = os.path.basename(directorypath)
-    p = BytesLoop()
+    p = BytesLoop(max_buffer_size=max_buffer_size)
 
     def _run():
         from bitdust.storage import tar_file
@@ -249,6 +425,30 @@ def extracttar_thread(tarfile, outdir, mode='r:bz2'):
     return threads.deferToThread(_run)  # @UndefinedVariable
 
 
+def extracttar_stream_thread(stream, outdir, mode='r|bz2'):
+    """
+    Extract files and folders inside a thread while ".tar" data is still being written into the ``stream``.
+    The ``stream`` must be an `ExtractLoop` object instance, returns Deferred object.
+    """
+    if _Debug:
+        lg.out(_DebugLevel, 'backup_tar.extracttar_stream_thread outdir=%s' % outdir)
+
+    def _run():
+        from bitdust.storage import tar_file
+        ret = tar_file.readtar(
+            archivepath=None,
+            outputdir=outdir,
+            encoding='utf-8',
+            mode=mode,
+            fileobj=stream,
+        )
+        if _Debug:
+            lg.out(_DebugLevel, 'backup_tar.extracttar_stream_thread readtar() finished, %d bytes extracted' % stream._bytes_read)
+        return ret
+
+    return threads.deferToThread(_run)  # @UndefinedVariable
+
+
 #------------------------------------------------------------------------------
 
 
@@ -38,18 +38,12 @@ _DebugLevel = 10
 
 #------------------------------------------------------------------------------
 
-import os
-
-#------------------------------------------------------------------------------
-
 from bitdust.logs import lg
 
 from bitdust.main import events
 
 from bitdust.lib import misc
 
-from bitdust.system import tmpfile
-
 from bitdust.storage import backup_tar
 from bitdust.storage import backup_matrix
 from bitdust.storage import backup_control
@@ -60,6 +54,7 @@ from bitdust.userid import global_id
 
 _WorkingBackupIDs = {}
 _WorkingRestoreProgress = {}
+_WorkingStreams = {}
 
 #------------------------------------------------------------------------------
 
@@ -105,12 +100,24 @@ def packet_in_callback(backupID, newpacket):
         OnRestorePacketFunc(backupID, SupplierNumber, newpacket)
 
 
-def extract_done(retcode, backupID, source_filename, output_location, callback_method):
-    lg.info('extract success of %s with result : %s' % (backupID, str(retcode)))
-    global OnRestoreDoneFunc
+def _is_finished(backupID, stream):
+    # result of the restore can be reported only once: by the restore_worker() or by the tar extractor
+    return _WorkingStreams.get(backupID) is not stream
+
+
+def _finish(backupID):
     _WorkingBackupIDs.pop(backupID, None)
     _WorkingRestoreProgress.pop(backupID, None)
-    tmpfile.throw_out(source_filename, 'file extracted')
+    _WorkingStreams.pop(backupID, None)
+
+
+def extract_done(retcode, backupID, stream, output_location, callback_method):
+    global OnRestoreDoneFunc
+    stream.close()
+    if _is_finished(backupID, stream):
+        return retcode
+    lg.info('extract success of %s with result : %s' % (backupID, str(retcode)))
+    _finish(backupID)
     if OnRestoreDoneFunc is not None:
         OnRestoreDoneFunc(backupID, 'restore done')
     if callback_method:
@@ -125,12 +132,17 @@ def extract_done(retcode, backupID, source_filename, output_location, callback_m
     return retcode
 
 
-def extract_failed(err, backupID, source_filename, output_location, callback_method):
-    lg.err('extract failed of %s with: %s' % (backupID, str(err)))
+def extract_failed(err, backupID, stream, output_location, callback_method):
     global OnRestoreDoneFunc
-    _WorkingBackupIDs.pop(backupID, None)
-    _WorkingRestoreProgress.pop(backupID, None)
-    tmpfile.throw_out(source_filename, 'file extract failed')
+    stream.close()
+    if _is_finished(backupID, stream):
+        return None
+    lg.err('extract failed of %s with: %s' % (backupID, str(err)))
+    r = _WorkingBackupIDs.get(backupID)
+    _finish(backupID)
+    if r and r.state not in ['DONE', 'FAILED']:
+        # no need to download the rest of the data
+        r.automat('abort', 'abort')
     if OnRestoreDoneFunc is not None:
         OnRestoreDoneFunc(backupID, 'extract failed')
     if callback_method:
@@ -144,31 +156,23 @@ def extract_failed(err, backupID, source_filename, output_location, callback_met
         reason='extracting file failed',
         error=str(err),
     ))
-    return err
+    return None
 
 
-def restore_done(result, backupID, outfd, tarfilename, outputlocation, callback_method):
-    global _WorkingBackupIDs
-    global _WorkingRestoreProgress
+def restore_done(result, backupID, stream, outputlocation, callback_method):
     global OnRestoreDoneFunc
     if _Debug:
-        lg.args(_DebugLevel, result=result, bid=backupID, tar=tarfilename, out=outputlocation)
+        lg.args(_DebugLevel, result=result, bid=backupID, out=outputlocation)
     if result == 'done':
         lg.info('restore success of %s with result=%s' % (backupID, result))
-    else:
-        lg.err('restore failed of %s with result=%s' % (backupID, result))
-    try:
-        os.close(outfd)
-    except:
-        lg.exc()
-    if result == 'done':
-        d = backup_tar.extracttar_thread(tarfilename, outputlocation)
-        d.addCallback(extract_done, backupID, tarfilename, outputlocation, callback_method)
-        d.addErrback(extract_failed, backupID, tarfilename, outputlocation, callback_method)
-        return d
-    _WorkingBackupIDs.pop(backupID, None)
-    _WorkingRestoreProgress.pop(backupID, None)
-    tmpfile.throw_out(tarfilename, 'restore ' + result)
+        # the extractor will finish reading the rest of the data and report the result
+        stream.mark_finished()
+        return result
+    lg.err('restore failed of %s with result=%s' % (backupID, result))
+    if _is_finished(backupID, stream):
+        return result
+    _finish(backupID)
+    stream.close()
     if OnRestoreDoneFunc is not None:
         OnRestoreDoneFunc(backupID, result)
     if callback_method:
@@ -189,19 +193,19 @@ def Start(backupID, outputLocation, callback=None, keyID=None):
     global _WorkingRestoreProgress
     if backupID in list(_WorkingBackupIDs.keys()):
         return _WorkingBackupIDs[backupID]
-    alias = backupID.split('$')[0]
-    outfd, outfilename = tmpfile.make(
-        'restore',
-        extension='.tar.gz',
-        prefix=alias + '_',
-    )
+    # restored data is extracted at the same time while next blocks are still downloading
+    stream = backup_tar.ExtractLoop()
     from bitdust.storage import restore_worker
-    r = restore_worker.RestoreWorker(backupID, outfd, KeyID=keyID)
-    r.MyDeferred.addCallback(restore_done, backupID, outfd, outfilename, outputLocation, callback)
+    r = restore_worker.RestoreWorker(backupID, stream, KeyID=keyID)
+    r.MyDeferred.addCallback(restore_done, backupID, stream, outputLocation, callback)
     r.set_block_restored_callback(block_restored_callback)
     r.set_packet_in_callback(packet_in_callback)
     _WorkingBackupIDs[backupID] = r
     _WorkingRestoreProgress[backupID] = {}
+    _WorkingStreams[backupID] = stream
+    d = backup_tar.extracttar_stream_thread(stream, outputLocation)
+    d.addCallback(extract_done, backupID, stream, outputLocation, callback)
+    d.addErrback(extract_failed, backupID, stream, outputLocation, callback)
     r.automat('init')
     return r
 
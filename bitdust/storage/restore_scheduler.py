@@ -0,0 +1,204 @@
+#!/usr/bin/python
+# restore_scheduler.py
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (restore_scheduler.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+#
+#
+#
+#
+"""
+..
+
+module:: restore_scheduler
+
+Helps ``restore_worker()`` to decide which fragments to request and from which suppliers.
+
+Download speed and response time of every supplier are measured when a requested fragment arrives.
+Those numbers are used to select a minimal set of Data/Parity fragments enough to rebuild the block,
+fastest suppliers first, and to detect requests which are taking much longer than usual.
+"""
+
+#------------------------------------------------------------------------------
+
+from __future__ import absolute_import
+
+#------------------------------------------------------------------------------
+
+_Debug = False
+_DebugLevel = 10
+
+#------------------------------------------------------------------------------
+
+from collections import deque
+
+#------------------------------------------------------------------------------
+
+from bitdust.logs import lg
+
+from bitdust.userid import id_url
+
+#------------------------------------------------------------------------------
+
+_SuppliersStats = {}
+_ThroughputSmoothing = 0.3
+_MaxLatencySamples = 100
+_MinLatencySamples = 10
+_MinHedgeDelay = 5.0
+_DefaultHedgeDelay = 30.0
+
+#------------------------------------------------------------------------------
+
+
+def shutdown():
+    _SuppliersStats.clear()
+
+
+#------------------------------------------------------------------------------
+
+
+def _supplier_stats(supplier_idurl):
+    supplier_idurl = id_url.to_bin(supplier_idurl)
+    if supplier_idurl not in _SuppliersStats:
+        _SuppliersStats[supplier_idurl] = {
+            'throughput': None,
+            'latency': deque(maxlen=_MaxLatencySamples),
+            'received': 0,
+            'failed': 0,
+        }
+    return _SuppliersStats[supplier_idurl]
+
+
+def on_request_finished(supplier_idurl, size, duration):
+    """
+    Must be called when requested fragment of ``size`` bytes was received from the supplier after ``duration`` seconds.
+    """
+    stats = _supplier_stats(supplier_idurl)
+    speed = float(size)/max(duration, 0.001)
+    if stats['throughput'] is None:
+        stats['throughput'] = speed
+    else:
+        stats['throughput'] = (1.0 - _ThroughputSmoothing)*stats['throughput'] + _ThroughputSmoothing*speed
+    stats['latency'].append(duration)
+    stats['received'] += 1
+    if _Debug:
+        lg.args(_DebugLevel, s=supplier_idurl, size=size, duration=duration, throughput=stats['throughput'])
+
+
+def on_request_failed(supplier_idurl):
+    """
+    Failed request is counted as a zero speed sample, so the supplier is slowly moved to the end of the list.
+    """
+    stats = _supplier_stats(supplier_idurl)
+    if stats['throughput'] is not None:
+        stats['throughput'] = (1.0 - _ThroughputSmoothing)*stats['throughput']
+    stats['failed'] += 1
+    if _Debug:
+        lg.args(_DebugLevel, s=supplier_idurl, throughput=stats['throughput'])
+
+
+def supplier_throughput(supplier_idurl):
+    """
+    Returns measured download speed in bytes per second, or None if nothing was received yet.
+    """
+    stats = _SuppliersStats.get(id_url.to_bin(supplier_idurl))
+    if not stats:
+        return None
+    return stats['throughput']
+
+
+def suppliers_speed(suppliers):
+    """
+    Returns list of speed values for given list of suppliers.
+    Suppliers without any measurements yet get the median value, so they are also tried from time to time.
+    """
+    speeds = [(supplier_throughput(s) if s else None) for s in suppliers]
+    known = sorted([s for s in speeds if s is not None])
+    default_speed = known[int(len(known)/2)] if known else 1.0
+    return [(default_speed if s is None else s) for s in speeds]
+
+
+def latency_percentile(percentile):
+    """
+    Returns response time in seconds which given percent of all known requests did not exceed.
+    """
+    samples = []
+    for stats in _SuppliersStats.values():
+        samples.extend(stats['latency'])
+    if len(samples) < _MinLatencySamples:
+        return None
+    samples.sort()
+    pos = min(len(samples) - 1, int(len(samples)*percentile/100.0))
+    return samples[pos]
+
+
+def hedge_delay(percentile):
+    """
+    Returns number of seconds after which a pending request is considered as slow.
+    """
+    latency = latency_percentile(percentile)
+    if latency is None:
+        return _DefaultHedgeDelay
+    return max(_MinHedgeDelay, latency)
+
+
+#------------------------------------------------------------------------------
+
+
+def select_fragments(ecc_map, data_segments, parity_segments, available, speeds):
+    """
+    Returns list of tuples (supplier_number, 'Data' or 'Parity') to be requested,
+    so that together with already received or pending fragments the block becomes fixable.
+
+    Lists ``data_segments`` and ``parity_segments`` mark fragments which are already on hand or pending.
+    The ``available`` is a list of tuples (supplier_number, 'Data' or 'Parity') which can be requested,
+    ``speeds`` is a list of measured speed values indexed by supplier number.
+    Fastest suppliers are selected first, the Data fragment is preferred because it is not needed to be decoded,
+    then all fragments which are not really needed are dropped starting from the slowest supplier.
+    If the block is not fixable even with all available fragments, all of them are returned.
+    """
+    data = [(1 if d else 0) for d in data_segments]
+    parity = [(1 if p else 0) for p in parity_segments]
+    if ecc_map.Fixable(data, parity):
+        return []
+    candidates = list(available)
+    load = {}
+    selected = []
+    while candidates:
+        # same supplier is sending all fragments requested from him one by one, so his speed is shared
+        candidates.sort(key=lambda c: (-speeds[c[0]]/(1.0 + load.get(c[0], 0)), 0 if c[1] == 'Data' else 1, c[0]))
+        supplier_number, data_or_parity = candidates.pop(0)
+        if data_or_parity == 'Data':
+            data[supplier_number] = 1
+        else:
+            parity[supplier_number] = 1
+        load[supplier_number] = load.get(supplier_number, 0) + 1
+        selected.append((supplier_number, data_or_parity))
+        if ecc_map.Fixable(data, parity):
+            break
+    else:
+        return selected
+    for supplier_number, data_or_parity in reversed(list(selected)):
+        segments = data if data_or_parity == 'Data' else parity
+        segments[supplier_number] = 0
+        if ecc_map.Fixable(data, parity):
+            selected.remove((supplier_number, data_or_parity))
+        else:
+            segments[supplier_number] = 1
+    return selected
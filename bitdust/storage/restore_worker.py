@@ -41,12 +41,12 @@ EVENTS:
     * :red:`timer-5sec`
 
 
-At least for now we will work one block at a time, though packets in parallel.
-We ask transport_control for all the data packets for a block then see if we
-get them all or need to ask for some parity packets.  We do this till we have
-gotten a block with the "LastBlock" flag set.  If we have tried several times
-and not gotten data packets from a supplier we can flag him as suspect-bad
-and start requesting a parity packet to cover him right away.
+Blocks are decoded one at a time, though packets are requested in parallel.
+For every block only a minimal set of Data/Parity packets needed to rebuild it is requested,
+from the fastest suppliers first - see ``restore_scheduler`` module.
+Packets of few next blocks are requested in advance while current block is still in progress.
+When a request is taking much longer than usual, another packet is requested from a different
+supplier to replace it. We do this till we have gotten a block with the "LastBlock" flag set.
 
 When we are missing a data packet we pick a parity packet where we have all the
 other data packets for that parity so we can recover the missing data packet.
@@ -73,6 +73,7 @@ The other thing we need is the backupIDs which we can get from our suppliers wit
 #------------------------------------------------------------------------------
 
 from __future__ import absolute_import
+import six
 from six.moves import range
 
 #------------------------------------------------------------------------------
@@ -94,6 +95,7 @@ except:
     sys.exit('Error initializing twisted.internet.reactor in restore.py')
 
 from twisted.internet.defer import Deferred
+from twisted.internet.task import LoopingCall  #@UnresolvedImport
 
 #------------------------------------------------------------------------------
 
@@ -123,6 +125,8 @@ from bitdust.stream import io_throttle
 from bitdust.raid import raid_worker
 from bitdust.raid import eccmap
 
+from bitdust.storage import restore_scheduler
+
 from bitdust.services import driver
 
 from bitdust.userid import global_id
@@ -169,6 +173,10 @@ class RestoreWorker(automat.Automat):
         self.LastAction = time.time()
         self.RequestFails = []
         self.block_requests = {}
+        self.prefetch_requests = {}
+        self.requests_started = {}
+        self.hedged_requests = set()
+        self.hedge_task = None
         self.AlreadyRequestedCounts = {}
         # For anyone who wants to know when we finish
         self.MyDeferred = Deferred()
@@ -384,6 +392,8 @@ class RestoreWorker(automat.Automat):
         self.max_errors = eccmap.GetCorrectableErrors(self.EccMap.NumSuppliers())*2
         if data_receiver.A():
             data_receiver.A().addStateChangedCallback(self._on_data_receiver_state_changed)
+        self.hedge_task = LoopingCall(self._do_check_slow_requests)
+        self.hedge_task.start(1.0, now=False)
 
     def doStartNewBlock(self, *args, **kwargs):
         """
@@ -397,7 +407,14 @@ class RestoreWorker(automat.Automat):
         self.OnHandParity = [False]*self.EccMap.paritysegments
         self.RequestFails = []
         self.block_requests = {}
+        self.hedged_requests.clear()
         self.AlreadyRequestedCounts = {}
+        # requests sent in advance for that block now became requests for the current block
+        for packetID in list(self.prefetch_requests.keys()):
+            if packetid.BlockNumber(packetID) == self.block_number:
+                self.block_requests[packetID] = self.prefetch_requests.pop(packetID)
+                if self.block_requests[packetID] is False:
+                    self.RequestFails.append(packetID)
 
     def doPingOfflineSuppliers(self, *args, **kwargs):
         """
@@ -415,13 +432,9 @@ class RestoreWorker(automat.Automat):
         Action method.
         """
         for SupplierNumber in range(self.EccMap.datasegments):
-            PacketID = packetid.MakePacketID(self.backup_id, self.block_number, SupplierNumber, 'Data')
-            customerID, remotePath = packetid.SplitPacketID(PacketID)
-            self.OnHandData[SupplierNumber] = bool(os.path.exists(os.path.join(settings.getLocalBackupsDir(), customerID, remotePath)))
+            self.OnHandData[SupplierNumber] = self._is_packet_on_hand(self.block_number, SupplierNumber, 'Data')
         for SupplierNumber in range(self.EccMap.paritysegments):
-            PacketID = packetid.MakePacketID(self.backup_id, self.block_number, SupplierNumber, 'Parity')
-            customerID, remotePath = packetid.SplitPacketID(PacketID)
-            self.OnHandParity[SupplierNumber] = bool(os.path.exists(os.path.join(settings.getLocalBackupsDir(), customerID, remotePath)))
+            self.OnHandParity[SupplierNumber] = self._is_packet_on_hand(self.block_number, SupplierNumber, 'Parity')
 
     def doRestoreBlock(self, *args, **kwargs):
         """
@@ -450,6 +463,13 @@ class RestoreWorker(automat.Automat):
             lg.warn('block read/unserialize failed from %d bytes of data' % len(blockbits))
             self.automat('block-failed')
             return
+        when_writable = getattr(self.output_stream, 'when_writable', None)
+        if when_writable:
+            # do not start next block until the reader consumed enough data from the output stream
+            d = when_writable()
+            d.addCallback(self._on_output_stream_writable, newblock, filename)
+            d.addErrback(lg.errback, debug=_Debug, debug_level=_DebugLevel, method='restore_worker.doRestoreBlock')
+            return
         self.automat('block-restored', (newblock, filename))
 
     def doRequestPackets(self, *args, **kwargs):
@@ -465,9 +485,8 @@ class RestoreWorker(automat.Automat):
         if not args or not args[0]:
             raise Exception('no input found')
         NewPacket, PacketID = args[0]
-        glob_path = global_id.NormalizeGlobalID(PacketID, detect_version=True)
         packetID = global_id.CanonicalID(PacketID)
-        customer_id, _, _, _, SupplierNumber, dataORparity = packetid.SplitFull(packetID)
+        _, _, _, _, SupplierNumber, dataORparity = packetid.SplitFull(packetID)
         if dataORparity == 'Data':
             self.OnHandData[SupplierNumber] = True
         elif dataORparity == 'Parity':
@@ -475,21 +494,7 @@ class RestoreWorker(automat.Automat):
         if not NewPacket:
             lg.warn('packet %r already exists locally' % packetID)
             return
-        filename = os.path.join(settings.getLocalBackupsDir(), customer_id, glob_path['path'])
-        dirpath = os.path.dirname(filename)
-        if not os.path.exists(dirpath):
-            try:
-                bpio._dirs_make(dirpath)
-            except:
-                lg.exc()
-        # either way the payload of packet is saved
-        if not bpio.WriteBinaryFile(filename, NewPacket.Payload):
-            lg.err('unable to write to %s' % filename)
-            return
-        if self.packetInCallback is not None:
-            self.packetInCallback(self.backup_id, NewPacket)
-        if _Debug:
-            lg.out(_DebugLevel, 'restore_worker.doSavePacket %s saved to %s' % (packetID, filename))
+        self._do_save_packet(NewPacket, PacketID)
 
     def doReadRaid(self, *args, **kwargs):
         """
@@ -551,9 +556,12 @@ class RestoreWorker(automat.Automat):
         """
         NewBlock = args[0][0]
         data = NewBlock.Data()
-        # Add to the file where all the data is going
+        # Add to the file or stream where all the data is going
         try:
-            os.write(self.output_stream, data)
+            if isinstance(self.output_stream, six.integer_types):
+                os.write(self.output_stream, data)
+            else:
+                self.output_stream.write(data)
             self.bytes_written += len(data)
         except:
             lg.exc()
@@ -608,9 +616,16 @@ class RestoreWorker(automat.Automat):
         self.OnHandParity = None
         self.EccMap = None
         self.LastAction = None
+        if self.hedge_task:
+            if self.hedge_task.running:
+                self.hedge_task.stop()
+            self.hedge_task = None
         self.RequestFails = []
         self.AlreadyRequestedCounts = None
         self.block_requests = None
+        self.prefetch_requests = None
+        self.requests_started = None
+        self.hedged_requests = None
         self.MyDeferred = None
         self.output_stream = None
         self.destroy()
@@ -627,73 +642,13 @@ class RestoreWorker(automat.Automat):
     def _do_check_run_requests(self):
         if _Debug:
             lg.out(_DebugLevel, 'restore_worker._do_check_run_requests for %s at block %d' % (self.backup_id, self.block_number))
-        packetsToRequest = []
-        for SupplierNumber in range(self.EccMap.datasegments):
-            request_packet_id = packetid.MakePacketID(self.backup_id, self.block_number, SupplierNumber, 'Data')
-            if self.OnHandData[SupplierNumber]:
-                if _Debug:
-                    lg.out(_DebugLevel, '        SKIP, OnHandData is True for supplier %d' % SupplierNumber)
-                if request_packet_id not in self.block_requests:
-                    self.block_requests[request_packet_id] = True
-                continue
-            if request_packet_id in self.block_requests:
-                if _Debug:
-                    lg.out(_DebugLevel, '        SKIP, request for packet %r already sent to IO queue for supplier %d' % (request_packet_id, SupplierNumber))
-                continue
-            SupplierID = contactsdb.supplier(SupplierNumber, customer_idurl=self.customer_idurl)
-            if not SupplierID:
-                lg.warn('unknown supplier at position %s' % SupplierNumber)
-                continue
-            if online_status.isOffline(SupplierID):
-                if _Debug:
-                    lg.out(_DebugLevel, '        SKIP, offline supplier: %s' % SupplierID)
-                continue
-            packetsToRequest.append((SupplierID, request_packet_id))
-        for SupplierNumber in range(self.EccMap.paritysegments):
-            request_packet_id = packetid.MakePacketID(self.backup_id, self.block_number, SupplierNumber, 'Parity')
-            if self.OnHandParity[SupplierNumber]:
-                if _Debug:
-                    lg.out(_DebugLevel, '        SKIP, OnHandParity is True for supplier %d' % SupplierNumber)
-                if request_packet_id not in self.block_requests:
-                    self.block_requests[request_packet_id] = True
-                continue
-            if request_packet_id in self.block_requests:
-                if _Debug:
-                    lg.out(_DebugLevel, '        SKIP, request for packet %r already sent to IO queue for supplier %d' % (request_packet_id, SupplierNumber))
-                continue
-            SupplierID = contactsdb.supplier(SupplierNumber, customer_idurl=self.customer_idurl)
-            if not SupplierID:
-                lg.warn('unknown supplier at position %s' % SupplierNumber)
-                continue
-            if online_status.isOffline(SupplierID):
-                if _Debug:
-                    lg.out(_DebugLevel, '        SKIP, offline supplier: %s' % SupplierID)
-                continue
-            packetsToRequest.append((SupplierID, request_packet_id))
-        requests_made = 0
-        # already_requested = 0
-        for SupplierID, packetID in packetsToRequest:
-            if io_throttle.HasPacketInRequestQueue(SupplierID, packetID):
-                # already_requested += 1
-                # if packetID not in self.AlreadyRequestedCounts:
-                #     self.AlreadyRequestedCounts[packetID] = 0
-                # self.AlreadyRequestedCounts[packetID] += 1
-                lg.warn('packet already in IO queue for supplier %s : %s' % (SupplierID, packetID))
-                continue
-            self.block_requests[packetID] = None
-            if io_throttle.QueueRequestFile(
-                callOnReceived=self._on_packet_request_result,
-                creatorID=self.creator_id,
-                packetID=packetID,
-                ownerID=self.creator_id,  # self.customer_idurl,
-                remoteID=SupplierID,
-            ):
-                requests_made += 1
-            else:
-                self.block_requests[packetID] = False
-            if _Debug:
-                lg.dbg(_DebugLevel, 'sent request %r to %r, other requests: %r' % (packetID, SupplierID, list(self.block_requests.values())))
-        del packetsToRequest
+        suppliers = [contactsdb.supplier(i, customer_idurl=self.customer_idurl) for i in range(max(self.EccMap.datasegments, self.EccMap.paritysegments))]
+        speeds = restore_scheduler.suppliers_speed(suppliers)
+        # slow requests are not counted, so other fragments are selected to replace them
+        data_segments, parity_segments, available = self._do_collect_fragments(self.block_number, self.block_requests, self.OnHandData, self.OnHandParity, self.hedged_requests)
+        selected = restore_scheduler.select_fragments(self.EccMap, data_segments, parity_segments, list(available.keys()), speeds)
+        requests_made = self._do_send_requests([available[f] for f in selected], self.block_requests)
+        self._do_prefetch_next_blocks(speeds)
         if requests_made:
             if _Debug:
                 lg.out(_DebugLevel, '        requested %d packets for block %d' % (requests_made, self.block_number))
@@ -715,6 +670,136 @@ class RestoreWorker(automat.Automat):
             lg.out(_DebugLevel, '        all requests finished for block %d : %r' % (self.block_number, current_block_requests_results))
         reactor.callLater(0, self.automat, 'request-finished', None)  # @UndefinedVariable
 
+    def _do_collect_fragments(self, block_number, requests, on_hand_data, on_hand_parity, slow_requests=()):
+        """
+        Returns tuple (data_segments, parity_segments, available) for given block.
+        Fragments which are on hand or still pending are marked in the lists, ``available`` is a dictionary
+        of fragments which can be requested: (supplier_number, data_or_parity) -> (supplier_idurl, packet_id).
+        """
+        data_segments = [0]*self.EccMap.datasegments
+        parity_segments = [0]*self.EccMap.paritysegments
+        available = {}
+        for dataORparity, on_hand, segments in (('Data', on_hand_data, data_segments), ('Parity', on_hand_parity, parity_segments)):
+            for SupplierNumber in range(len(segments)):
+                request_packet_id = packetid.MakePacketID(self.backup_id, block_number, SupplierNumber, dataORparity)
+                if on_hand[SupplierNumber]:
+                    if _Debug:
+                        lg.out(_DebugLevel, '        SKIP, %s packet is on hand for supplier %d in block %d' % (dataORparity, SupplierNumber, block_number))
+                    segments[SupplierNumber] = 1
+                    if request_packet_id not in requests:
+                        requests[request_packet_id] = True
+                    continue
+                if request_packet_id in requests:
+                    if requests[request_packet_id] is None and request_packet_id not in slow_requests:
+                        segments[SupplierNumber] = 1
+                    if _Debug:
+                        lg.out(_DebugLevel, '        SKIP, request for packet %r already sent to IO queue for supplier %d' % (request_packet_id, SupplierNumber))
+                    continue
+                SupplierID = contactsdb.supplier(SupplierNumber, customer_idurl=self.customer_idurl)
+                if not SupplierID:
+                    lg.warn('unknown supplier at position %s' % SupplierNumber)
+                    continue
+                if online_status.isOffline(SupplierID):
+                    if _Debug:
+                        lg.out(_DebugLevel, '        SKIP, offline supplier: %s' % SupplierID)
+                    continue
+                available[(SupplierNumber, dataORparity)] = (SupplierID, request_packet_id)
+        return data_segments, parity_segments, available
+
+    def _do_send_requests(self, packetsToRequest, requests):
+        requests_made = 0
+        for SupplierID, packetID in packetsToRequest:
+            if io_throttle.HasPacketInRequestQueue(SupplierID, packetID):
+                lg.warn('packet already in IO queue for supplier %s : %s' % (SupplierID, packetID))
+                continue
+            requests[packetID] = None
+            if io_throttle.QueueRequestFile(
+                callOnReceived=self._on_packet_request_result,
+                creatorID=self.creator_id,
+                packetID=packetID,
+                ownerID=self.creator_id,  # self.customer_idurl,
+                remoteID=SupplierID,
+            ):
+                requests_made += 1
+                self.requests_started[packetID] = (time.time(), SupplierID)
+            else:
+                requests[packetID] = False
+            if _Debug:
+                lg.dbg(_DebugLevel, 'sent request %r to %r, other requests: %r' % (packetID, SupplierID, list(requests.values())))
+        return requests_made
+
+    def _do_prefetch_next_blocks(self, speeds):
+        prefetch_blocks = settings.getRestorePrefetchBlocks()
+        if prefetch_blocks <= 0:
+            return
+        from bitdust.storage import backup_matrix
+        last_block_number = min(self.block_number + prefetch_blocks, backup_matrix.GetKnownMaxBlockNum(self.backup_id))
+        for block_number in range(self.block_number + 1, last_block_number + 1):
+            on_hand_data = [self._is_packet_on_hand(block_number, i, 'Data') for i in range(self.EccMap.datasegments)]
+            on_hand_parity = [self._is_packet_on_hand(block_number, i, 'Parity') for i in range(self.EccMap.paritysegments)]
+            data_segments, parity_segments, available = self._do_collect_fragments(block_number, self.prefetch_requests, on_hand_data, on_hand_parity)
+            selected = restore_scheduler.select_fragments(self.EccMap, data_segments, parity_segments, list(available.keys()), speeds)
+            requests_made = self._do_send_requests([available[f] for f in selected], self.prefetch_requests)
+            if _Debug and requests_made:
+                lg.out(_DebugLevel, '        requested %d packets in advance for block %d' % (requests_made, block_number))
+
+    def _do_check_slow_requests(self):
+        if self.state not in ['REQUESTED', 'RECEIVING']:
+            return
+        delay = restore_scheduler.hedge_delay(settings.getRestoreHedgeLatencyPercentile())
+        now = time.time()
+        slow_requests = []
+        for packetID, result in self.block_requests.items():
+            if result is not None or packetID in self.hedged_requests:
+                continue
+            started = self.requests_started.get(packetID)
+            if started and now - started[0] > delay:
+                slow_requests.append(packetID)
+        if not slow_requests:
+            return
+        lg.warn('%d requests for block %d are pending longer than %d seconds, will request other fragments' % (len(slow_requests), self.block_number, delay))
+        self.hedged_requests.update(slow_requests)
+        self._do_check_run_requests()
+
+    def _do_save_packet(self, NewPacket, PacketID):
+        glob_path = global_id.NormalizeGlobalID(PacketID, detect_version=True)
+        packetID = global_id.CanonicalID(PacketID)
+        customer_id = packetid.SplitFull(packetID)[0]
+        filename = os.path.join(settings.getLocalBackupsDir(), customer_id, glob_path['path'])
+        dirpath = os.path.dirname(filename)
+        if not os.path.exists(dirpath):
+            try:
+                bpio._dirs_make(dirpath)
+            except:
+                lg.exc()
+        # either way the payload of packet is saved
+        if not bpio.WriteBinaryFile(filename, NewPacket.Payload):
+            lg.err('unable to write to %s' % filename)
+            return False
+        if self.packetInCallback is not None:
+            self.packetInCallback(self.backup_id, NewPacket)
+        if _Debug:
+            lg.out(_DebugLevel, 'restore_worker._do_save_packet %s saved to %s' % (packetID, filename))
+        return True
+
+    def _is_packet_on_hand(self, block_number, supplier_number, dataORparity):
+        PacketID = packetid.MakePacketID(self.backup_id, block_number, supplier_number, dataORparity)
+        customerID, remotePath = packetid.SplitPacketID(PacketID)
+        return bool(os.path.exists(os.path.join(settings.getLocalBackupsDir(), customerID, remotePath)))
+
+    def _find_request(self, packet_id, requests):
+        if packet_id in requests:
+            return packet_id
+        resp = global_id.NormalizeGlobalID(packet_id)
+        for req_packet_id in requests:
+            req = global_id.NormalizeGlobalID(req_packet_id)
+            if resp['version'] == req['version'] and resp['path'] == req['path']:
+                if resp['key_alias'] == req['key_alias'] and resp['user'] == req['user']:
+                    if id_url.is_the_same(resp['idurl'], req['idurl']):
+                        lg.warn('found matching packet request %r for rotated idurl %r' % (req_packet_id, resp['idurl']))
+                        return req_packet_id
+        return None
+
     def _on_block_restored(self, restored_blocks, filename):
         if _Debug:
             lg.out(_DebugLevel, 'restore_worker._on_block_restored at %s with result: %s' % (filename, restored_blocks))
@@ -723,6 +808,26 @@ class RestoreWorker(automat.Automat):
         else:
             self.automat('raid-done', filename)
 
+    def _on_output_stream_writable(self, result, newblock, filename):
+        if self.output_stream is None:
+            return None
+        if not result:
+            # output stream was closed while the block was waiting, nothing to write anymore
+            if _Debug:
+                lg.dbg(_DebugLevel, 'output stream was closed, skip restored block %r' % filename)
+            return None
+        self.automat('block-restored', (newblock, filename))
+        return None
+
+    def _on_request_finished(self, packet_id, NewPacketOrPacketID, result):
+        started = self.requests_started.pop(packet_id, None) if packet_id else None
+        if not started:
+            return
+        if result == 'received':
+            restore_scheduler.on_request_finished(started[1], len(NewPacketOrPacketID.Payload), time.time() - started[0])
+        elif result == 'failed':
+            restore_scheduler.on_request_failed(started[1])
+
     def _on_packet_request_result(self, NewPacketOrPacketID, result):
         if self.block_requests is None:
             return
@@ -735,25 +840,38 @@ class RestoreWorker(automat.Automat):
             packet_id = getattr(NewPacketOrPacketID, 'PacketID', None)
         if not packet_id:
             raise Exception('packet ID is unknown from %r' % NewPacketOrPacketID)
-        if packet_id not in self.block_requests:
-            resp = global_id.NormalizeGlobalID(packet_id)
-            for req_packet_id in self.block_requests:
-                req = global_id.NormalizeGlobalID(req_packet_id)
-                if resp['version'] == req['version'] and resp['path'] == req['path']:
-                    if resp['key_alias'] == req['key_alias'] and resp['user'] == req['user']:
-                        if id_url.is_the_same(resp['idurl'], req['idurl']):
-                            packet_id = req_packet_id
-                            lg.warn('found matching packet request %r for rotated idurl %r' % (packet_id, resp['idurl']))
-                            break
-        if packet_id not in self.block_requests:
+        prefetched = False
+        known_packet_id = self._find_request(packet_id, self.block_requests)
+        if not known_packet_id:
+            known_packet_id = self._find_request(packet_id, self.prefetch_requests)
+            prefetched = bool(known_packet_id)
+        if not known_packet_id:
+            block_number = packetid.BlockNumber(packet_id)
+            if block_number is not None and block_number < self.block_number:
+                # fragment was not needed anymore, the block was already restored
+                if _Debug:
+                    lg.dbg(_DebugLevel, 'skip %r result for already restored block %d: %r' % (packet_id, block_number, result))
+                if result != 'in queue':
+                    # supplier still did the work, the speed stats must take it into account
+                    self._on_request_finished(self._find_request(packet_id, self.requests_started), NewPacketOrPacketID, result)
+                return
             if _Debug:
                 lg.args(_DebugLevel, block_requests=self.block_requests)
             raise Exception('packet ID not registered')
+        packet_id = known_packet_id
+        requests = self.prefetch_requests if prefetched else self.block_requests
         if result == 'in queue':
-            if self.block_requests[packet_id] is not None:
+            if requests[packet_id] is not None:
                 raise Exception('packet is still in IO queue, but already unregistered')
             lg.warn('packet already in the request queue: %r' % packet_id)
             return
+        self._on_request_finished(packet_id, NewPacketOrPacketID, result)
+        if prefetched:
+            if result == 'received':
+                requests[packet_id] = self._do_save_packet(NewPacketOrPacketID, packet_id)
+            else:
+                requests[packet_id] = (result == 'exist')
+            return
         if result in ['received', 'exist']:
             self.block_requests[packet_id] = True
             if result == 'exist':
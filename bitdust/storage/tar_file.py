@@ -296,14 +296,16 @@ def writetar(sourcepath, arcname=None, subdirs=True, compression='none', encodin
 #------------------------------------------------------------------------------
 
 
-def readtar(archivepath, outputdir, encoding=None, mode='r:*'):
+def readtar(archivepath, outputdir, encoding=None, mode='r:*', fileobj=None):
     """
     Extract tar file from ``archivepath`` location into local ``outputdir``
     folder.
+
+    When ``fileobj`` is given the archive is read from it instead, use "r|*" mode to read not seekable streams.
     """
     if _Debug:
-        printlog('READ: mode=%s name=%s outputdir=%s encoding=%s\n' % (mode, archivepath, outputdir, encoding))
-    tar = tarfile.open(name=archivepath, mode=mode, encoding=encoding)
+        printlog('READ: mode=%s name=%s outputdir=%s encoding=%s fileobj=%r\n' % (mode, archivepath, outputdir, encoding, fileobj))
+    tar = tarfile.open(name=archivepath, mode=mode, encoding=encoding, fileobj=fileobj)
     tar.extractall(outputdir)
     tar.close()
     return True
@@ -41,6 +41,8 @@ import base64
 #------------------------------------------------------------------------------
 
 from twisted.internet import reactor  # @UnresolvedImport
+from twisted.internet import threads  # @UnresolvedImport
+from twisted.internet.defer import DeferredSemaphore
 
 #------------------------------------------------------------------------------
 
@@ -57,6 +59,7 @@ from bitdust.main import settings
 from bitdust.main import events
 
 from bitdust.contacts import contactsdb
+from bitdust.contacts import identitycache
 
 from bitdust.services import driver
 
@@ -79,6 +82,8 @@ from bitdust.dht import known_nodes
 
 from bitdust.supplier import list_files
 from bitdust.supplier import local_tester
+from bitdust.supplier import files_index
+from bitdust.supplier import data_writer
 
 from bitdust.userid import global_id
 from bitdust.userid import id_url
@@ -88,11 +93,23 @@ from bitdust.userid import my_id
 
 _SupplierFileModifiedLatest = {}
 _SupplierFileModifiedNotifyTasks = {}
+_KnownKeyAliasDirs = set()
+_RetrieveReads = None
+_MaxRetrieveReads = 4
+_RetrieveSendTimeout = 120
 
 #------------------------------------------------------------------------------
 
 
 def init():
+    global _RetrieveReads
+    _RetrieveReads = DeferredSemaphore(_MaxRetrieveReads)
+    accounting.init()
+    data_writer.init()
+    files_index.init()
+    if not files_index.is_ready():
+        d = threads.deferToThread(files_index.rebuild)  # @UndefinedVariable
+        d.addErrback(lambda err: lg.err('failed to build customers files index: %r' % err))
     callback.append_inbox_callback(on_inbox_packet_received)
     events.add_subscriber(on_identity_url_changed, 'identity-url-changed')
     events.add_subscriber(on_customer_accepted, 'existing-customer-accepted')
@@ -127,6 +144,9 @@ def shutdown():
     events.remove_subscriber(on_customer_terminated, 'existing-customer-terminated')
     events.remove_subscriber(on_identity_url_changed, 'identity-url-changed')
     callback.remove_inbox_callback(on_inbox_packet_received)
+    data_writer.shutdown()
+    files_index.shutdown()
+    accounting.shutdown()
 
 
 #------------------------------------------------------------------------------
@@ -260,20 +280,23 @@ def make_filename(customerGlobID, filePath, keyAlias=None):
     keyAlias = keyAlias or 'master'
     customerDirName = str(customerGlobID)
     customersDir = settings.getCustomersFilesDir()
-    if not os.path.exists(customersDir):
-        if _Debug:
-            lg.dbg(_DebugLevel, 'making a new folder: %s' % customersDir)
-        bpio._dir_make(customersDir)
     ownerDir = os.path.join(customersDir, customerDirName)
-    if not os.path.exists(ownerDir):
-        if _Debug:
-            lg.dbg(_DebugLevel, 'making a new folder: %s' % ownerDir)
-        bpio._dir_make(ownerDir)
     keyAliasDir = os.path.join(ownerDir, keyAlias)
-    if not os.path.exists(keyAliasDir):
-        if _Debug:
-            lg.dbg(_DebugLevel, 'making a new folder: %s' % keyAliasDir)
-        bpio._dir_make(keyAliasDir)
+    if keyAliasDir not in _KnownKeyAliasDirs:
+        # folders are only checked once, data_writer will create them again if they were removed later
+        if not os.path.exists(customersDir):
+            if _Debug:
+                lg.dbg(_DebugLevel, 'making a new folder: %s' % customersDir)
+            bpio._dir_make(customersDir)
+        if not os.path.exists(ownerDir):
+            if _Debug:
+                lg.dbg(_DebugLevel, 'making a new folder: %s' % ownerDir)
+            bpio._dir_make(ownerDir)
+        if not os.path.exists(keyAliasDir):
+            if _Debug:
+                lg.dbg(_DebugLevel, 'making a new folder: %s' % keyAliasDir)
+            bpio._dir_make(keyAliasDir)
+        _KnownKeyAliasDirs.add(keyAliasDir)
     if packetid.IsIndexFileName(filePath):
         filePath = settings.BackupIndexFileName()
     filename = os.path.join(keyAliasDir, filePath)
@@ -347,7 +370,53 @@ def do_notify_supplier_file_modified(key_alias, remote_path, action, customer_id
 #------------------------------------------------------------------------------
 
 
+def do_enforce_customer_quota(customer_idurl):
+    """
+    Removes the oldest files of the customer until the usage is below the quota.
+    Same rule as ``bptester.SpaceTime()`` uses, but only for one customer and without reading the customer folder.
+    Executed in the ``data_writer`` thread, so files of the customer are not written at the same moment.
+    """
+    bytes_donated_to_customer = accounting.get_customer_quota(customer_idurl)
+    bytes_used_by_customer = accounting.get_customer_usage(customer_idurl)
+    if bytes_donated_to_customer is None or bytes_used_by_customer is None:
+        return 0
+    if bytes_used_by_customer < bytes_donated_to_customer:
+        return 0
+    if not files_index.is_ready():
+        reactor.callFromThread(local_tester.TestSpaceTime)  # @UndefinedVariable
+        return 0
+    customer = global_id.UrlToGlobalID(customer_idurl)
+    count = 0
+    while bytes_used_by_customer >= bytes_donated_to_customer:
+        oldest = files_index.oldest_files(customer)
+        if not oldest:
+            break
+        for key_alias, path, filesize in oldest:
+            if bytes_used_by_customer < bytes_donated_to_customer:
+                break
+            filename = files_index.local_filename(customer, key_alias, path)
+            try:
+                os.remove(filename)
+            except:
+                if os.path.exists(filename):
+                    lg.exc()
+                    return count
+            files_index.remove_path(filename)
+            accounting.increase_customer_usage(customer_idurl, -filesize)
+            list_files.journal_record(customer_idurl, '-', key_alias, path)
+            bytes_used_by_customer -= filesize
+            count += 1
+    if _Debug:
+        lg.args(_DebugLevel, c=customer, removed=count, used=bytes_used_by_customer, donated=bytes_donated_to_customer)
+    return count
+
+
+#------------------------------------------------------------------------------
+
+
 def on_data(newpacket):
+    # received bytes are only needed here, the packet object must not keep them in memory after that
+    new_data = newpacket.SerializedSource(release=True)
     if id_url.is_the_same(newpacket.OwnerID, my_id.getIDURL()):
         # this Data belong to us, SKIP
         return False
@@ -374,69 +443,67 @@ def on_data(newpacket):
         lg.warn('got empty filename, bad customer or wrong packetID?')
         # p2p_service.SendFail(newpacket, 'empty filename')
         return False
-    # dirname = os.path.dirname(filename)
-    # if not os.path.exists(dirname):
-    #     try:
-    #         bpio._dirs_make(dirname)
-    #     except:
-    #         lg.err('can not create sub dir %s' % dirname)
-    #         p2p_service.SendFail(newpacket, 'write error', remote_idurl=authorized_idurl)
-    #         return False
-    new_data = newpacket.Serialize()
     donated_bytes = settings.getDonatedBytes()
     accounting.check_create_customers_quotas(donated_bytes)
-    space_dict, _ = accounting.read_customers_quotas()
-    known_customers_quoats = list(space_dict.keys())
-    if id_url.is_not_in(customer_idurl, known_customers_quoats, as_field=False, as_bin=True):
+    bytes_donated_to_customer = accounting.get_customer_quota(customer_idurl)
+    if bytes_donated_to_customer is None:
         lg.err('customer space is broken, no info about donated space can be found for %s' % newpacket)
         p2p_service.SendFail(newpacket, 'customer space is broken, no info found about donated space', remote_idurl=authorized_idurl)
         return False
-    used_space_dict = accounting.read_customers_usage()
-    known_customers_usage = list(used_space_dict.keys())
-    if id_url.is_in(customer_idurl, known_customers_usage, as_field=False, as_bin=True):
-        try:
-            bytes_used_by_customer = int(used_space_dict[customer_idurl.to_bin()])
-            bytes_donated_to_customer = int(space_dict[customer_idurl.to_bin()])
-            if bytes_donated_to_customer - bytes_used_by_customer < len(new_data):
-                lg.warn('no free space left for customer data for %s' % customer_idurl)
-                p2p_service.SendFail(newpacket, 'no free space left for customer data', remote_idurl=authorized_idurl)
-                return False
-        except:
-            lg.exc()
-    data_existed = os.path.exists(filename)
-    # data_changed = True
-    # if data_exists:
-    #     if remote_path == settings.BackupIndexFileName() or packetid.IsIndexFileName(remote_path):
-    #         current_data = bpio.ReadBinaryFile(filename)
-    #         if current_data == new_data:
-    #             data_changed = False
-    # if data_changed:
-    if True:
-        dirname = os.path.dirname(filename)
-        if not os.path.exists(dirname):
-            try:
-                bpio._dirs_make(dirname)
-            except:
-                lg.err('can not create sub dir %s' % dirname)
-                p2p_service.SendFail(newpacket, 'write error', remote_idurl=authorized_idurl)
-                return False
-        if not bpio.WriteBinaryFile(filename, new_data):
-            lg.err('can not write to %s' % str(filename))
-            p2p_service.SendFail(newpacket, 'write error', remote_idurl=authorized_idurl)
+    bytes_used_by_customer = accounting.get_customer_usage(customer_idurl)
+    if bytes_used_by_customer is None and files_index.is_ready():
+        bytes_used_by_customer = files_index.customer_used_space(global_id.UrlToGlobalID(customer_idurl))
+        accounting.increase_customer_usage(customer_idurl, bytes_used_by_customer)
+    if bytes_used_by_customer is not None:
+        if bytes_donated_to_customer - bytes_used_by_customer < len(new_data):
+            lg.warn('no free space left for customer data for %s' % customer_idurl)
+            p2p_service.SendFail(newpacket, 'no free space left for customer data', remote_idurl=authorized_idurl)
             return False
+    # space is reserved before the file is written, so few files received at once can not exceed the quota
+    accounting.increase_customer_usage(customer_idurl, len(new_data))
+    # the file is written in a thread, Ack() is sent only after the data is on disk
+    d = data_writer.write(filename, new_data, on_written=lambda fn, previous_size: on_data_stored(fn, len(new_data), previous_size, customer_idurl))
+    d.addCallback(on_data_written, newpacket, filename, len(new_data), remote_path, key_alias, customer_idurl, authorized_idurl)
+    d.addErrback(lg.errback, debug=_Debug, debug_level=_DebugLevel, method='customer_space.on_data')
+    return True
+
+
+def on_data_stored(filename, data_size, previous_size, customer_idurl):
+    """
+    Executed in the ``data_writer`` thread right after the file was written.
+    """
+    files_index.add_file(filename, size=data_size, ctime=time.time())
+    if previous_size:
+        # existing file was overwritten, only the difference was actually added
+        accounting.increase_customer_usage(customer_idurl, -previous_size)
+    do_enforce_customer_quota(customer_idurl)
+
+
+def on_data_written(result, newpacket, filename, data_size, remote_path, key_alias, customer_idurl, authorized_idurl):
+    success, previous_size = result
+    if success is None:
+        # file was removed by the customer right after it was written, usage was already decreased
+        if _Debug:
+            lg.dbg(_DebugLevel, 'file %r was removed while being written' % filename)
+        p2p_service.SendFail(newpacket, 'file was removed', remote_idurl=authorized_idurl)
+        return False
+    if not success:
+        accounting.increase_customer_usage(customer_idurl, -data_size)
+        lg.err('can not write to %s' % str(filename))
+        p2p_service.SendFail(newpacket, 'write error', remote_idurl=authorized_idurl)
+        return False
     # Here Data() packet was stored as it is on supplier node (current machine)
-    del new_data
+    list_files.journal_record(customer_idurl, '+', key_alias, remote_path, data_size)
     sz = len(newpacket.Payload)
     p2p_service.SendAck(newpacket, response=strng.to_text(sz), remote_idurl=authorized_idurl)
-    reactor.callLater(0, local_tester.TestSpaceTime)  # @UndefinedVariable
-    if key_alias != 'master':  # and data_changed:
+    if key_alias != 'master':
         if remote_path == settings.BackupIndexFileName() or packetid.IsIndexFileName(remote_path):
             do_notify_supplier_file_modified(key_alias, settings.BackupIndexFileName(), 'write', customer_idurl, authorized_idurl)
         else:
             if packetid.BlockNumber(newpacket.PacketID) == 0:
                 do_notify_supplier_file_modified(key_alias, remote_path, 'write', customer_idurl, authorized_idurl)
     if _Debug:
-        lg.args(_DebugLevel, sz=sz, fn=filename, remote_idurl=authorized_idurl, pid=newpacket.PacketID, existed=data_existed)
+        lg.args(_DebugLevel, sz=sz, fn=filename, remote_idurl=authorized_idurl, pid=newpacket.PacketID, existed=bool(previous_size))
     return True
 
 
@@ -498,29 +565,68 @@ def on_retrieve(newpacket):
         lg.warn('had empty filename')
         p2p_service.SendFail(newpacket, 'empty filename', remote_idurl=recipient_idurl)
         return False
-    if not os.path.exists(filename):
-        lg.warn('did not found requested file locally : %s' % filename)
-        p2p_service.SendFail(newpacket, 'did not found requested file locally', remote_idurl=recipient_idurl)
-        return False
+    # stored file is read and checked in a thread, only few files are loaded into memory at the same time:
+    # the slot is released by on_stored_packet_read() only after the packet was sent or failed
+    release = make_retrieve_slot_release()
+    d = _RetrieveReads.acquire()
+    d.addCallback(lambda _: threads.deferToThread(read_stored_packet, filename))  # @UndefinedVariable
+    d.addCallback(on_stored_packet_read, newpacket, glob_path, filename, recipient_idurl, release)
+    d.addErrback(on_stored_packet_read_failed, release)
+    return True
+
+
+def read_stored_packet(filename):
+    """
+    Executed in a thread, returns tuple (stored_packet, error_message).
+    Signature of the stored packet is only verified when the file was not yet validated before.
+    """
+    try:
+        file_stats = os.stat(filename)
+    except:
+        return None, 'did not found requested file locally'
     if not os.access(filename, os.R_OK):
-        lg.warn('no read access to requested packet %s' % filename)
-        p2p_service.SendFail(newpacket, 'failed reading requested file', remote_idurl=recipient_idurl)
-        return False
+        return None, 'failed reading requested file'
     data = bpio.ReadBinaryFile(filename)
     if not data:
-        lg.warn('empty data on disk %s' % filename)
-        p2p_service.SendFail(newpacket, 'empty data on disk', remote_idurl=recipient_idurl)
-        return False
+        return None, 'empty data on disk'
     stored_packet = signed.Unserialize(data)
-    sz = len(data)
     del data
     if stored_packet is None:
-        lg.warn('Unserialize failed, not Valid packet %s' % filename)
-        p2p_service.SendFail(newpacket, 'unserialize failed', remote_idurl=recipient_idurl)
-        return False
-    if not stored_packet.Valid():
-        lg.warn('Stored packet is not Valid %s' % filename)
-        p2p_service.SendFail(newpacket, 'stored packet is not valid', remote_idurl=recipient_idurl)
+        return None, 'unserialize failed'
+    if not files_index.is_validated(filename, file_stats.st_mtime, file_stats.st_size):
+        if not stored_packet.Valid():
+            return None, 'stored packet is not valid'
+        files_index.set_validated([
+            (filename, file_stats.st_mtime, file_stats.st_size),
+        ])
+    return stored_packet, None
+
+
+def make_retrieve_slot_release():
+    """
+    Returns a function which releases the slot of ``_RetrieveReads`` only once, no matter how many times it was called.
+    """
+    released = []
+
+    def _release(*args, **kwargs):
+        if not released:
+            released.append(True)
+            _RetrieveReads.release()
+
+    return _release
+
+
+def on_stored_packet_read_failed(err, release):
+    release()
+    return lg.errback(err, debug=_Debug, debug_level=_DebugLevel, method='customer_space.on_retrieve')
+
+
+def on_stored_packet_read(result, newpacket, glob_path, filename, recipient_idurl, release):
+    stored_packet, error_message = result
+    if stored_packet is None:
+        release()
+        lg.warn('%s : %s' % (error_message, filename))
+        p2p_service.SendFail(newpacket, error_message, remote_idurl=recipient_idurl)
         return False
     if stored_packet.Command != commands.Data():
         lg.warn('sending back packet which is not a Data')
@@ -533,7 +639,9 @@ def on_retrieve(newpacket):
     return_packet_id = stored_packet.PacketID
     if packetid.IsIndexFileName(glob_path['path']):
         return_packet_id = newpacket.PacketID
-    payload = stored_packet.Serialize()
+    # bytes are sent exactly as they were stored, no need to serialize the packet again,
+    # but binary packets are converted back to JSON if the requester is not able to read them
+    payload = stored_packet.SerializedSource(binary=signed.IsBinaryFormatSupported(identitycache.FromCache(recipient_idurl)), release=True)
     return_packet = signed.Packet(
         Command=commands.Data(),
         OwnerID=stored_packet.OwnerID,
@@ -543,15 +651,26 @@ def on_retrieve(newpacket):
         RemoteID=recipient_idurl,
     )
     if _Debug:
-        lg.args(_DebugLevel, file_size=sz, payload_size=len(payload), fn=filename, recipient=recipient_idurl)
+        lg.args(_DebugLevel, payload_size=len(payload), fn=filename, recipient=recipient_idurl)
     if recipient_idurl == stored_packet.OwnerID:
         if _Debug:
             lg.dbg(_DebugLevel, 'from request %r : sending back %r in %r to owner: %s' % (newpacket, stored_packet, return_packet, recipient_idurl))
-        gateway.outbox(return_packet)
-        return True
-    if _Debug:
-        lg.dbg(_DebugLevel, 'from request %r : returning data %r in %r owned by %s to %s' % (newpacket, stored_packet, return_packet, stored_packet.OwnerID, recipient_idurl))
-    gateway.outbox(return_packet)
+    else:
+        if _Debug:
+            lg.dbg(_DebugLevel, 'from request %r : returning data %r in %r owned by %s to %s' % (newpacket, stored_packet, return_packet, stored_packet.OwnerID, recipient_idurl))
+    # the slot is released when the packet was sent or failed, but not later than after _RetrieveSendTimeout seconds
+    timer = reactor.callLater(_RetrieveSendTimeout, release)  # @UndefinedVariable
+
+    def _on_finished(*args, **kwargs):
+        if timer.active():
+            timer.cancel()
+        release()
+
+    callbacks = {key: _on_finished for key in ('sent', 'acked', 'failed', 'cancelled', 'timeout', None)}
+    if gateway.outbox(return_packet, callbacks=callbacks) is None:
+        # packet was not sent at all, none of the callbacks will be executed
+        _on_finished()
+        return False
     return True
 
 
@@ -592,6 +711,7 @@ def on_list_files(newpacket):
         key_id=key_id,
         remote_idurl=newpacket.OwnerID,  # send back to the requesting node
         query_items=json_query['items'],
+        revision=json_query.get('revision'),
     )
     if _Debug:
         lg.args(_DebugLevel, r=newpacket.OwnerID, c=customer_idurl, k=key_id, pid=newpacket.PacketID)
@@ -634,6 +754,8 @@ def on_delete_file(newpacket):
             lg.warn('got empty filename, bad customer or wrong packetID?')
             p2p_service.SendFail(newpacket, 'not a customer, or file not found')
             return False
+        data_writer.discard(filename)
+        removed_bytes = files_index.path_size(filename)
         if os.path.isfile(filename):
             try:
                 os.remove(filename)
@@ -648,6 +770,10 @@ def on_delete_file(newpacket):
                 lg.exc()
         else:
             lg.warn('path was not found %s' % filename)
+        files_index.remove_path(filename)
+        data_writer.forget_dir(filename)
+        accounting.increase_customer_usage(newpacket.OwnerID, -removed_bytes)
+        list_files.journal_record(newpacket.OwnerID, '-', glob_path['key_alias'], glob_path['path'])
         do_notify_supplier_file_modified(glob_path['key_alias'], glob_path['path'], 'delete', newpacket.OwnerID, newpacket.CreatorID)
     p2p_service.SendAck(newpacket)
     if _Debug:
@@ -686,6 +812,8 @@ def on_delete_backup(newpacket):
             lg.warn('got empty filename, bad customer or wrong packetID?')
             p2p_service.SendFail(newpacket, 'not a customer, or file not found')
             return False
+        data_writer.discard(filename)
+        removed_bytes = files_index.path_size(filename)
         if os.path.isdir(filename):
             try:
                 bpio._dir_remove(filename)
@@ -701,6 +829,10 @@ def on_delete_backup(newpacket):
         else:
             if _Debug:
                 lg.dbg(_DebugLevel, 'path not found %s' % filename)
+        files_index.remove_path(filename)
+        data_writer.forget_dir(filename)
+        accounting.increase_customer_usage(newpacket.OwnerID, -removed_bytes)
+        list_files.journal_record(newpacket.OwnerID, '-', glob_path['key_alias'], glob_path['path'])
         do_notify_supplier_file_modified(glob_path['key_alias'], glob_path['path'], 'delete', newpacket.OwnerID, newpacket.CreatorID)
     p2p_service.SendAck(newpacket)
     if _Debug:
@@ -762,6 +894,7 @@ def on_customer_terminated(evt):
         lg.warn('unknown customer idurl in event data payload')
         return False
     customer_glob_id = global_id.idurl2glob(customer_idurl)
+    list_files.journal_erase(customer_idurl)
     queue_id = global_id.MakeGlobalQueueID(
         queue_alias='supplier-file-modified',
         owner_id=customer_glob_id,
@@ -823,6 +956,7 @@ def on_identity_url_changed(evt):
     if meta_info_changed:
         contactsdb.write_customers_meta_info_all(all_meta_info)
     # update customer idurl in "space" file
+    accounting.reset_customers_info()
     space_dict, free_space = accounting.read_customers_quotas()
     space_changed = False
     for customer_idurl_bin in list(space_dict.keys()):
@@ -848,6 +982,7 @@ def on_identity_url_changed(evt):
             if os.path.exists(old_owner_dir):
                 bpio._dir_remove(old_owner_dir)
                 lg.warn('removed %r' % old_owner_dir)
+            files_index.rename_customer(old_customer_dirname, new_customer_dirname)
         except:
             lg.exc()
     # update customer idurl in "spaceused" file
@@ -0,0 +1,329 @@
+#!/usr/bin/python
+# data_writer.py
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (data_writer.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+#
+#
+#
+#
+"""
+..
+
+module:: data_writer
+
+Files received from customers are written to disk outside of the main thread.
+
+All files queued while previous batch is being written are collected into the next batch.
+Batches are processed one by one, so two writes of the same file are always done in the right order.
+Every file is written into a temporary file and renamed after that, when ``settings.getSupplierFsyncEnabled()``
+is True all temporary files of the batch are flushed to the physical disk before they are renamed.
+Optional ``on_written`` callback is executed in the same thread right after the file was renamed,
+so any other slow work related to the written file is also done outside of the main thread.
+
+Files of the batch being written can be discarded as well: the temporary file is removed instead of renamed
+if the file was discarded before, and the result is reported as (None, previous_file_size)
+if the file was discarded after it was already written.
+
+Temporary files must never be counted or reported as stored data, see ``is_temp_file()``,
+those left on disk after the previous session was interrupted are removed by ``init()``.
+"""
+
+#------------------------------------------------------------------------------
+
+from __future__ import absolute_import
+
+#------------------------------------------------------------------------------
+
+_Debug = False
+_DebugLevel = 10
+
+#------------------------------------------------------------------------------
+
+import os
+import time
+import platform
+import threading
+
+#------------------------------------------------------------------------------
+
+from twisted.internet import reactor  # @UnresolvedImport
+from twisted.internet import threads  # @UnresolvedImport
+from twisted.internet.defer import Deferred
+
+#------------------------------------------------------------------------------
+
+from bitdust.logs import lg
+
+from bitdust.system import bpio
+
+from bitdust.main import settings
+
+#------------------------------------------------------------------------------
+
+_PendingWrites = []
+_CurrentBatch = None
+_KnownDirs = set()
+_MaxBatchSize = 200
+_DiscardedFiles = set()
+_DiscardedFilesLock = threading.Lock()
+
+#------------------------------------------------------------------------------
+
+
+def init():
+    # temporary files could be left on disk if the previous session was interrupted
+    d = threads.deferToThread(remove_temp_files, settings.getCustomersFilesDir(), time.time())  # @UndefinedVariable
+    d.addErrback(lambda err: lg.err('failed to remove temporary files: %r' % err))
+
+
+def shutdown():
+    if _PendingWrites or _CurrentBatch:
+        lg.warn('%d files still not written' % (len(_PendingWrites) + len(_CurrentBatch or [])))
+    _KnownDirs.clear()
+
+
+#------------------------------------------------------------------------------
+
+
+def write(filename, data, on_written=None):
+    """
+    Queue the data to be written to the file.
+    Returns Deferred object, fired with a tuple (success, previous_file_size) when the file is on disk.
+    Success is None when the file was written, but discarded right after that and is already removed by the caller.
+    If ``on_written`` is set it is called in the thread as ``on_written(filename, previous_file_size)``
+    after the file was successfully written.
+    """
+    result = Deferred()
+    _PendingWrites.append((filename, data, on_written, result))
+    if _CurrentBatch is None and len(_PendingWrites) == 1:
+        reactor.callLater(0, _start_batch)  # @UndefinedVariable
+    return result
+
+
+def discard(filename):
+    """
+    Drop all writes of given file or files inside of given folder.
+    Files of the batch which is being written right now are marked, so they are not renamed into place.
+    """
+    prefix = filename.rstrip(os.sep) + os.sep
+    count = 0
+    for item in list(_PendingWrites):
+        if item[0] == filename or item[0].startswith(prefix):
+            _PendingWrites.remove(item)
+            item[3].callback((False, 0))
+            count += 1
+    with _DiscardedFilesLock:
+        for item in (_CurrentBatch or []):
+            if item[0] == filename or item[0].startswith(prefix):
+                _DiscardedFiles.add(item[0])
+                count += 1
+    if _Debug:
+        lg.args(_DebugLevel, f=filename, discarded=count)
+    return count
+
+
+def is_temp_file(filename):
+    return filename.endswith('.new')
+
+
+def remove_temp_files(dirpath, older_than):
+    """
+    Executed in a thread, removes temporary files created before ``older_than`` moment inside of given folder.
+    Files which are being written right now are more recent and remain untouched.
+    """
+    removed = []
+
+    def cb(realpath, subpath, name):
+        if not os.path.isfile(realpath):
+            return True
+        if not is_temp_file(name):
+            return False
+        try:
+            if os.path.getmtime(realpath) < older_than:
+                os.remove(realpath)
+                removed.append(realpath)
+        except:
+            lg.exc()
+        return False
+
+    if os.path.isdir(dirpath):
+        bpio.traverse_dir_recursive(cb, dirpath)
+    if removed:
+        lg.info('removed %d temporary files in %r' % (len(removed), dirpath))
+    return removed
+
+
+def forget_dir(dirpath):
+    """
+    Must be called when a folder was removed from the disk.
+    """
+    prefix = dirpath.rstrip(os.sep) + os.sep
+    for known_dir in list(_KnownDirs):
+        if known_dir == dirpath or known_dir.startswith(prefix):
+            _KnownDirs.discard(known_dir)
+
+
+#------------------------------------------------------------------------------
+
+
+def _start_batch():
+    global _PendingWrites
+    global _CurrentBatch
+    if _CurrentBatch is not None or not _PendingWrites:
+        return
+    # same file must not be written twice in one batch
+    filenames = set()
+    count = 0
+    for filename, _, _, _ in _PendingWrites[:_MaxBatchSize]:
+        if filename in filenames:
+            break
+        filenames.add(filename)
+        count += 1
+    _CurrentBatch = _PendingWrites[:count]
+    _PendingWrites = _PendingWrites[count:]
+    d = threads.deferToThread(_write_batch, [(fn, data, on_written) for fn, data, on_written, _ in _CurrentBatch], settings.getSupplierFsyncEnabled())  # @UndefinedVariable
+    d.addCallback(_on_batch_written)
+    d.addErrback(_on_batch_failed)
+
+
+def _on_batch_written(results):
+    global _CurrentBatch
+    batch = _CurrentBatch
+    _CurrentBatch = None
+    with _DiscardedFilesLock:
+        discarded = set(_DiscardedFiles)
+        _DiscardedFiles.clear()
+    if _Debug:
+        lg.args(_DebugLevel, files=len(batch), pending=len(_PendingWrites), discarded=len(discarded))
+    for i in range(len(batch)):
+        success, previous_size = results[i]
+        if success and batch[i][0] in discarded:
+            # file was written, but discarded before the result was reported
+            success = None
+        batch[i][3].callback((success, previous_size))
+    _start_batch()
+
+
+def _on_batch_failed(err):
+    lg.err('failed writing %d files: %r' % (len(_CurrentBatch or []), err))
+    _on_batch_written([(False, 0)]*len(_CurrentBatch or []))
+    return None
+
+
+#------------------------------------------------------------------------------
+
+
+def _make_dir(dirpath):
+    if dirpath in _KnownDirs:
+        return True
+    if not os.path.isdir(dirpath):
+        try:
+            bpio._dirs_make(dirpath)
+        except:
+            if not os.path.isdir(dirpath):
+                lg.err('can not create sub dir %s' % dirpath)
+                return False
+    _KnownDirs.add(dirpath)
+    return True
+
+
+def _open_temp_file(filename):
+    if not _make_dir(os.path.dirname(filename)):
+        return None
+    try:
+        return open(filename + '.new', 'wb')
+    except (IOError, OSError):
+        # folder might be already removed, but was still known
+        _KnownDirs.discard(os.path.dirname(filename))
+    if not _make_dir(os.path.dirname(filename)):
+        return None
+    try:
+        return open(filename + '.new', 'wb')
+    except:
+        lg.exc('file write failed: %r' % filename)
+    return None
+
+
+def _write_batch(items, fsync):
+    """
+    Executed in a thread, returns list of tuples (success, previous_file_size) in the same order.
+    """
+    results = [(False, 0)]*len(items)
+    opened = []
+    for i in range(len(items)):
+        filename, data, _ = items[i]
+        f = _open_temp_file(filename)
+        if f is None:
+            continue
+        try:
+            f.write(data)
+            f.flush()
+        except:
+            lg.exc('file write failed: %r' % filename)
+            f.close()
+            _remove_temp_file(filename)
+            continue
+        opened.append((i, filename, f))
+    for i, filename, f in opened:
+        try:
+            if fsync:
+                os.fsync(f.fileno())
+            f.close()
+        except:
+            lg.exc('file write failed: %r' % filename)
+            try:
+                f.close()
+            except:
+                pass
+            _remove_temp_file(filename)
+            continue
+        # the file must not be renamed into place after it was discarded, see discard()
+        with _DiscardedFilesLock:
+            if filename in _DiscardedFiles:
+                _remove_temp_file(filename)
+                continue
+            try:
+                previous_size = 0
+                if os.path.isfile(filename):
+                    previous_size = os.path.getsize(filename)
+                    if platform.system() == 'Windows':
+                        # in Windows the rename fails if file already exists
+                        os.remove(filename)
+                os.rename(filename + '.new', filename)
+            except:
+                lg.exc('file write failed: %r' % filename)
+                _remove_temp_file(filename)
+                continue
+            results[i] = (True, previous_size)
+            on_written = items[i][2]
+            if on_written:
+                try:
+                    on_written(filename, previous_size)
+                except:
+                    lg.exc()
+    return results
+
+
+def _remove_temp_file(filename):
+    try:
+        os.remove(filename + '.new')
+    except:
+        if os.path.exists(filename + '.new'):
+            lg.exc()
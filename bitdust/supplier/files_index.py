@@ -0,0 +1,417 @@
+#!/usr/bin/python
+# files_index.py
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (files_index.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+#
+#
+#
+#
+"""
+..
+
+module:: files_index
+
+Persistent index of all files stored on that supplier for other customers.
+
+Every file written to or removed from the customers folder is also recorded here,
+so ListFiles(), space/time checks and validation of the stored packets
+do not need to walk the whole customers folder every time.
+
+The database is built from the files on disk only once: when it does not exist yet.
+"""
+
+#------------------------------------------------------------------------------
+
+from __future__ import absolute_import
+
+#------------------------------------------------------------------------------
+
+_Debug = False
+_DebugLevel = 10
+
+#------------------------------------------------------------------------------
+
+import os
+import time
+import sqlite3
+import threading
+
+#------------------------------------------------------------------------------
+
+from bitdust.logs import lg
+
+from bitdust.system import bpio
+
+from bitdust.lib import packetid
+
+from bitdust.main import settings
+
+from bitdust.supplier import data_writer
+
+#------------------------------------------------------------------------------
+
+_FilePath = None
+_Connections = {}
+_ConnectionsLock = threading.Lock()
+_WriteLock = threading.RLock()
+_RebuildLog = None
+
+#------------------------------------------------------------------------------
+
+
+def init(filepath=None):
+    global _FilePath
+    if not filepath:
+        filepath = settings.CustomersFilesIndexFile()
+    _FilePath = filepath
+    if _Debug:
+        lg.args(_DebugLevel, filepath=filepath)
+    if not os.path.isfile(filepath):
+        conn = sqlite3.connect(filepath, timeout=10)
+        conn.execute('PRAGMA journal_mode = WAL;')
+        conn.execute(
+            '''CREATE TABLE IF NOT EXISTS "files" (
+            "customer" TEXT,
+            "key_alias" TEXT,
+            "path" TEXT,
+            "path_id" TEXT,
+            "version" TEXT,
+            "block_num" INTEGER,
+            "supplier_num" INTEGER,
+            "data_parity" TEXT,
+            "size" INTEGER,
+            "ctime" REAL,
+            PRIMARY KEY (customer, key_alias, path))''',
+        )
+        conn.execute('CREATE INDEX "customer ctime" on files(customer, ctime)')
+        conn.execute('CREATE INDEX "customer version" on files(customer, key_alias, path_id, version)')
+        conn.execute('''CREATE TABLE IF NOT EXISTS "info" (
+            "key" TEXT PRIMARY KEY,
+            "value" TEXT)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS "validated" (
+            "customer" TEXT,
+            "key_alias" TEXT,
+            "path" TEXT,
+            "mtime" REAL,
+            "size" INTEGER,
+            PRIMARY KEY (customer, key_alias, path))''')
+        conn.commit()
+        conn.close()
+
+
+def shutdown():
+    global _FilePath
+    if _Debug:
+        lg.dbg(_DebugLevel, '')
+    with _ConnectionsLock:
+        for conn in _Connections.values():
+            try:
+                conn.commit()
+                conn.close()
+            except:
+                lg.exc()
+        _Connections.clear()
+        _FilePath = None
+
+
+#------------------------------------------------------------------------------
+
+
+def db():
+    """
+    SQLite connection can not be shared between threads, so every thread opens its own.
+    For example ``bptester`` is started by ``local_tester.run_in_thread()`` and uses its own connection.
+    All opened connections are registered here, so ``shutdown()`` can close them all.
+    """
+    thread_id = threading.get_ident()
+    with _ConnectionsLock:
+        conn = _Connections.get(thread_id)
+        if conn is None:
+            if not _FilePath:
+                init()
+            # connection is used only by the thread which opened it, but closed by shutdown() from another thread
+            conn = sqlite3.connect(_FilePath, timeout=10, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL;')
+            conn.execute('PRAGMA synchronous = NORMAL;')
+            _Connections[thread_id] = conn
+    return conn
+
+
+#------------------------------------------------------------------------------
+
+
+def is_ready():
+    """
+    Returns True when all existing files were already indexed and the index can be used instead of the disk.
+    """
+    try:
+        row = db().execute('SELECT value FROM info WHERE key=?', ('ready', )).fetchone()
+    except:
+        lg.exc()
+        return False
+    return bool(row and row[0] == '1')
+
+
+def split_filename(filename):
+    """
+    Returns tuple (customer, key_alias, path) for given full local path inside the customers folder.
+    Customer is a name of the customer folder: "alice@idhost.org", path items are separated with "/".
+    """
+    customers_dir = settings.getCustomersFilesDir()
+    relpath = os.path.relpath(os.path.abspath(filename), os.path.abspath(customers_dir))
+    if relpath == '.' or relpath.startswith('..'):
+        return None, None, None
+    parts = relpath.replace('\\', '/').split('/')
+    return parts[0], (parts[1] if len(parts) > 1 else None), ('/'.join(parts[2:]) if len(parts) > 2 else None)
+
+
+def make_row(customer, key_alias, path, size, ctime):
+    path_id = None
+    version = None
+    block_num = None
+    supplier_num = None
+    data_parity = None
+    if packetid.Valid(path):
+        _, _path_id, _version, _block_num, _supplier_num, _data_parity = packetid.SplitFull(path)
+        if _data_parity in ('Data', 'Parity'):
+            path_id, version, block_num, supplier_num, data_parity = _path_id, _version, _block_num, _supplier_num, _data_parity
+    return (customer, key_alias, path, path_id, version, block_num, supplier_num, data_parity, size, ctime)
+
+
+#------------------------------------------------------------------------------
+
+
+def add_file(filename, size=None, ctime=None):
+    """
+    Must be called right after a file was written into the customers folder.
+    """
+    customer, key_alias, path = split_filename(filename)
+    if not path:
+        lg.warn('file %r is not inside customers folder' % filename)
+        return False
+    if size is None or ctime is None:
+        try:
+            stats = os.stat(filename)
+        except:
+            lg.exc()
+            return False
+        if size is None:
+            size = stats.st_size
+        if ctime is None:
+            ctime = stats.st_ctime
+    row = make_row(customer, key_alias, path, size, ctime)
+    conn = db()
+    with _WriteLock:
+        conn.execute('INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?,?,?,?,?)', row)
+        conn.commit()
+        if _RebuildLog is not None:
+            _RebuildLog.append(('INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?,?,?,?,?)', row))
+    if _Debug:
+        lg.args(_DebugLevel, c=customer, k=key_alias, p=path, sz=size)
+    return True
+
+
+def _path_condition(filename):
+    customer, key_alias, path = split_filename(filename)
+    if not customer:
+        return None, None
+    if key_alias is None:
+        return 'customer=?', (customer, )
+    if path is None:
+        return 'customer=? AND key_alias=?', (customer, key_alias)
+    return 'customer=? AND key_alias=? AND (path=? OR substr(path, 1, ?)=?)', (customer, key_alias, path, len(path) + 1, path + '/')
+
+
+def path_size(filename):
+    """
+    Returns total size of a single file or all files inside of given folder.
+    """
+    condition, args = _path_condition(filename)
+    if not condition:
+        return 0
+    row = db().execute('SELECT SUM(size) FROM files WHERE ' + condition, args).fetchone()
+    return int(row[0] or 0)
+
+
+def remove_path(filename):
+    """
+    Forget a single file or all files inside of given folder, can be a key alias or customer folder as well.
+    """
+    condition, args = _path_condition(filename)
+    if not condition:
+        return 0
+    conn = db()
+    with _WriteLock:
+        cur = conn.execute('DELETE FROM files WHERE ' + condition, args)
+        conn.execute('DELETE FROM validated WHERE ' + condition, args)
+        conn.commit()
+        if _RebuildLog is not None:
+            _RebuildLog.append(('DELETE FROM files WHERE ' + condition, args))
+    if _Debug:
+        lg.args(_DebugLevel, f=filename, removed=cur.rowcount)
+    return cur.rowcount
+
+
+def rename_customer(old_customer, new_customer):
+    conn = db()
+    with _WriteLock:
+        conn.execute('UPDATE OR REPLACE files SET customer=? WHERE customer=?', (new_customer, old_customer))
+        conn.execute('UPDATE OR REPLACE validated SET customer=? WHERE customer=?', (new_customer, old_customer))
+        conn.commit()
+        if _RebuildLog is not None:
+            _RebuildLog.append(('UPDATE OR REPLACE files SET customer=? WHERE customer=?', (new_customer, old_customer)))
+
+
+def rebuild():
+    """
+    Walk the customers folder and populate the index from scratch, can be executed in a thread.
+    Found files are collected in a temporary table first, other writers are not blocked during the walk.
+    All changes made by them in the meantime are recorded and applied again after the collected files replaced the index,
+    this final step is short and done in a single transaction.
+    """
+    global _RebuildLog
+    customers_dir = settings.getCustomersFilesDir()
+    conn = db()
+    rows = []
+    t = time.time()
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS "files_rebuild" AS SELECT * FROM files WHERE 0')
+    conn.execute('DELETE FROM files_rebuild')
+    conn.commit()
+
+    def cb(realpath, subpath, name):
+        if not os.path.isfile(realpath):
+            return True
+        if data_writer.is_temp_file(name):
+            return False
+        parts = subpath.split('/')
+        if len(parts) < 3:
+            return False
+        try:
+            stats = os.stat(realpath)
+        except:
+            return False
+        rows.append(make_row(parts[0], parts[1], '/'.join(parts[2:]), stats.st_size, stats.st_ctime))
+        if len(rows) >= 1000:
+            conn.executemany('INSERT OR REPLACE INTO files_rebuild VALUES (?,?,?,?,?,?,?,?,?,?)', rows)
+            conn.commit()
+            del rows[:]
+        return False
+
+    with _WriteLock:
+        _RebuildLog = []
+    try:
+        if os.path.isdir(customers_dir):
+            bpio.traverse_dir_recursive(cb, customers_dir)
+        if rows:
+            conn.executemany('INSERT OR REPLACE INTO files_rebuild VALUES (?,?,?,?,?,?,?,?,?,?)', rows)
+            conn.commit()
+        with _WriteLock:
+            try:
+                conn.execute('DELETE FROM files')
+                conn.execute('INSERT INTO files SELECT * FROM files_rebuild')
+                for query, args in _RebuildLog:
+                    conn.execute(query, args)
+                conn.execute('INSERT OR REPLACE INTO info VALUES (?,?)', ('ready', '1'))
+                conn.commit()
+            except:
+                conn.rollback()
+                raise
+            replayed = len(_RebuildLog)
+    finally:
+        with _WriteLock:
+            _RebuildLog = None
+        conn.execute('DROP TABLE IF EXISTS files_rebuild')
+        conn.commit()
+    count = conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+    lg.info('indexed %d customer files in %r, %d changes replayed, %.3f seconds' % (count, customers_dir, replayed, time.time() - t))
+    return count
+
+
+#------------------------------------------------------------------------------
+
+
+def customer_files(customer, key_alias=None, oldest_first=False):
+    """
+    Returns list of tuples (key_alias, path, size, ctime) for all files stored for given customer.
+    """
+    order = 'ASC' if oldest_first else 'DESC'
+    if key_alias is None:
+        cur = db().execute('SELECT key_alias, path, size, ctime FROM files WHERE customer=? ORDER BY ctime ' + order, (customer, ))
+    else:
+        cur = db().execute('SELECT key_alias, path, size, ctime FROM files WHERE customer=? AND key_alias=? ORDER BY ctime ' + order, (customer, key_alias))
+    return cur.fetchall()
+
+
+def oldest_files(customer, limit=100):
+    """
+    Returns list of tuples (key_alias, path, size) for the oldest files of given customer, uses "customer ctime" index.
+    """
+    return db().execute('SELECT key_alias, path, size FROM files WHERE customer=? ORDER BY ctime ASC LIMIT ?', (customer, limit)).fetchall()
+
+
+def customer_used_space(customer):
+    row = db().execute('SELECT SUM(size) FROM files WHERE customer=?', (customer, )).fetchone()
+    return int(row[0] or 0)
+
+
+def local_filename(customer, key_alias, path):
+    return os.path.join(settings.getCustomersFilesDir(), customer, key_alias, *path.split('/'))
+
+
+#------------------------------------------------------------------------------
+
+
+def is_validated(filename, mtime, size):
+    """
+    Returns True if that file was already successfully validated and was not modified after that.
+    """
+    customer, key_alias, path = split_filename(filename)
+    if not path:
+        return False
+    row = db().execute('SELECT mtime, size FROM validated WHERE customer=? AND key_alias=? AND path=?', (customer, key_alias, path)).fetchone()
+    return bool(row and row[0] == mtime and row[1] == size)
+
+
+def set_validated(items):
+    """
+    Stores list of tuples (filename, mtime, size) for files which were successfully validated.
+    """
+    rows = []
+    for filename, mtime, size in items:
+        customer, key_alias, path = split_filename(filename)
+        if path:
+            rows.append((customer, key_alias, path, mtime, size))
+    conn = db()
+    with _WriteLock:
+        conn.executemany('INSERT OR REPLACE INTO validated VALUES (?,?,?,?,?)', rows)
+        conn.commit()
+    return len(rows)
+
+
+def get_info(key, default=None):
+    row = db().execute('SELECT value FROM info WHERE key=?', (key, )).fetchone()
+    return default if row is None else row[0]
+
+
+def set_info(key, value):
+    conn = db()
+    with _WriteLock:
+        conn.execute('INSERT OR REPLACE INTO info VALUES (?,?)', (key, value))
+        conn.commit()
@@ -36,6 +36,9 @@ _DebugLevel = 10
 
 import os
 import zlib
+import threading
+
+from collections import deque
 
 #------------------------------------------------------------------------------
 
@@ -57,13 +60,79 @@ from bitdust.p2p import commands
 from bitdust.p2p import p2p_service
 from bitdust.contacts import identitycache
 
+from bitdust.supplier import files_index
+from bitdust.supplier import data_writer
+
 from bitdust.userid import my_id
 from bitdust.userid import global_id
+from bitdust.userid import id_url
+
+#------------------------------------------------------------------------------
+
+_MaxJournalChanges = 10000
+_ChangesJournals = {}
+_ChangesJournalsLock = threading.RLock()
 
 #------------------------------------------------------------------------------
 
 
-def send(customer_idurl, packet_id, format_type, key_id, remote_idurl, query_items=[]):
+def journal(customer_idurl):
+    """
+    Every customer have a journal of changes in his files stored here.
+    Revision of the journal is increased on every change and customer can request only changes after
+    a known revision. Journal is kept in memory, so a new random "epoch" is started every time journal is created.
+    """
+    global _ChangesJournals
+    customer_idurl = id_url.field(customer_idurl)
+    with _ChangesJournalsLock:
+        if customer_idurl.to_bin() not in _ChangesJournals:
+            _ChangesJournals[customer_idurl.to_bin()] = {
+                'epoch': packetid.UniqueID(),
+                'revision': 0,
+                'changes': deque(maxlen=_MaxJournalChanges),
+            }
+        return _ChangesJournals[customer_idurl.to_bin()]
+
+
+def journal_record(customer_idurl, action, key_alias, path, size=-1):
+    """
+    Action is "+" when a file was stored and "-" when a file or folder was removed.
+    Can be called from a thread, for example when ``bptester`` removes customer files.
+    """
+    with _ChangesJournalsLock:
+        j = journal(customer_idurl)
+        j['revision'] += 1
+        j['changes'].append((j['revision'], action, key_alias or 'master', path, size))
+    if _Debug:
+        lg.args(_DebugLevel, c=customer_idurl, r=j['revision'], a=action, k=key_alias, p=path)
+
+
+def journal_erase(customer_idurl):
+    global _ChangesJournals
+    with _ChangesJournalsLock:
+        _ChangesJournals.pop(id_url.field(customer_idurl).to_bin(), None)
+
+
+def journal_changes(customer_idurl, epoch, since):
+    """
+    Returns list of changes after given revision or None if those are not known anymore.
+    """
+    with _ChangesJournalsLock:
+        j = journal(customer_idurl)
+        if epoch != j['epoch'] or since < 0 or since > j['revision']:
+            return None
+        if j['changes'] and j['changes'][0][0] > since + 1:
+            # journal was truncated
+            return None
+        if not j['changes'] and since != j['revision']:
+            return None
+        return [change for change in j['changes'] if change[0] > since]
+
+
+#------------------------------------------------------------------------------
+
+
+def send(customer_idurl, packet_id, format_type, key_id, remote_idurl, query_items=[], revision=None):
     if not query_items:
         query_items = ['*']
     key_id = my_keys.latest_key_id(key_id)
@@ -82,15 +151,33 @@ def send(customer_idurl, packet_id, format_type, key_id, remote_idurl, query_ite
         lg.out(_DebugLevel, 'list_files.send to %s, customer_idurl=%s, key_id=%s, query_items=%r' % (remote_idurl, customer_idurl, key_id, query_items))
     ownerdir = settings.getCustomerFilesDir(customer_idurl)
     plaintext = ''
-    if os.path.isdir(ownerdir):
+    changes = None
+    if revision is not None and query_items == ['*']:
+        # customer is able to process only changes made after the known revision
         try:
-            for query_path in query_items:
-                plaintext += process_query_item(query_path, parts['key_alias'], ownerdir)
+            since = int(revision.get('since', -1))
         except:
-            lg.exc()
-            return p2p_service.SendFailNoRequest(customer_idurl, packet_id, response='list files query processing error')
-    else:
-        lg.warn('did not found customer folder: %s' % ownerdir)
+            since = -1
+        with _ChangesJournalsLock:
+            # files can be removed by bptester in a thread, revision must match with the changes
+            j = journal(customer_idurl)
+            changes = journal_changes(customer_idurl, revision.get('epoch'), since)
+            current_revision = j['revision']
+        if changes is None:
+            plaintext += 'R%s %d\n' % (j['epoch'], current_revision)
+        else:
+            plaintext += 'R%s %d %d\n' % (j['epoch'], current_revision, since)
+            plaintext += ChangesSummary(changes, parts['key_alias'])
+    if changes is None:
+        if os.path.isdir(ownerdir):
+            try:
+                for query_path in query_items:
+                    plaintext += process_query_item(query_path, parts['key_alias'], ownerdir)
+            except:
+                lg.exc()
+                return p2p_service.SendFailNoRequest(customer_idurl, packet_id, response='list files query processing error')
+        else:
+            lg.warn('did not found customer folder: %s' % ownerdir)
     if _Debug:
         lg.out(_DebugLevel, '\n%s' % plaintext)
     raw_list_files = PackListFiles(plaintext, format_type)
@@ -120,9 +207,14 @@ def process_query_item(query_path, key_alias, ownerdir):
     ret = ''
     ret += 'Q%s\n' % query_path
     if query_path == '*':
+        indexed = files_index.is_ready()
+        customer = os.path.basename(ownerdir)
         if key_alias == 'master':
-            key_alias_dir = os.path.join(ownerdir, key_alias)
-            ret += TreeSummary(key_alias_dir, key_alias)
+            if indexed:
+                ret += IndexSummary(customer, key_alias)
+            else:
+                key_alias_dir = os.path.join(ownerdir, key_alias)
+                ret += TreeSummary(key_alias_dir, key_alias)
         for one_key_alias in os.listdir(ownerdir):
             if one_key_alias == 'master':
                 continue
@@ -130,8 +222,11 @@ def process_query_item(query_path, key_alias, ownerdir):
                 continue
             if not misc.ValidKeyAlias(strng.to_text(one_key_alias)):
                 continue
-            key_alias_dir = os.path.join(ownerdir, one_key_alias)
-            ret += TreeSummary(key_alias_dir, one_key_alias)
+            if indexed:
+                ret += IndexSummary(customer, one_key_alias)
+            else:
+                key_alias_dir = os.path.join(ownerdir, one_key_alias)
+                ret += TreeSummary(key_alias_dir, one_key_alias)
         if _Debug:
             lg.args(_DebugLevel, o=ownerdir, q=query_path, k=key_alias, result_bytes=len(ret))
         return ret
@@ -179,6 +274,31 @@ def PackListFiles(plaintext, method):
 #------------------------------------------------------------------------------
 
 
+def ChangesSummary(changes, key_alias):
+    """
+    Lines started with "+" are stored files, "-" are removed files or folders.
+    """
+    out = StringIO()
+    out.write('Q*\n')
+    current_key_alias = None
+    for _, action, one_key_alias, path, size in changes:
+        if key_alias and key_alias != 'master' and one_key_alias != key_alias:
+            continue
+        if one_key_alias != current_key_alias:
+            current_key_alias = one_key_alias
+            out.write('K%s\n' % current_key_alias)
+        if action == '+':
+            out.write('+%s %d\n' % (path, size))
+        else:
+            out.write('-%s\n' % path)
+    src = out.getvalue()
+    out.close()
+    return src
+
+
+#------------------------------------------------------------------------------
+
+
 def TreeSummary(ownerdir, key_alias):
     out = StringIO()
     out.write('K%s\n' % key_alias)
@@ -187,6 +307,8 @@ def TreeSummary(ownerdir, key_alias):
         if not os.access(realpath, os.R_OK):
             return False
         if os.path.isfile(realpath):
+            if data_writer.is_temp_file(name):
+                return False
             try:
                 filesz = os.path.getsize(realpath)
             except:
@@ -216,6 +338,8 @@ def TreeSummary(ownerdir, key_alias):
             if os.path.isdir(pth):
                 result.write('D%s\n' % packetID)
                 continue
+            if data_writer.is_temp_file(filename):
+                continue
             try:
                 filesz = os.path.getsize(pth)
             except:
@@ -275,3 +399,69 @@ def TreeSummary(ownerdir, key_alias):
 
 
 #------------------------------------------------------------------------------
+
+
+def IndexSummary(customer, key_alias):
+    """
+    Same as ``TreeSummary()`` but built from ``files_index`` without reading the customer folder.
+    Empty folders are not present in the index, so they are not listed.
+    """
+    out = StringIO()
+    out.write('K%s\n' % key_alias)
+    folders = {}
+    files = []
+    versions = {}
+    for _, path, filesz, _ in files_index.customer_files(customer, key_alias):
+        parts = path.split('/')
+        version_pos = None
+        for pos in range(len(parts) - 1):
+            if packetid.IsCanonicalVersion(parts[pos]):
+                version_pos = pos
+                break
+        last_folder_pos = (len(parts) - 1) if version_pos is None else version_pos
+        for pos in range(1, last_folder_pos + 1):
+            subpath = '/'.join(parts[:pos])
+            folders[subpath] = folders.get(subpath, False) or (pos == version_pos)
+        if version_pos is None:
+            files.append((path, filesz))
+            continue
+        versionpath = '/'.join(parts[:version_pos + 1])
+        if version_pos < len(parts) - 2:
+            folders[versionpath + '/' + parts[version_pos + 1]] = None
+            continue
+        _, _, _, blockNum, supplierNum, dataORparity = packetid.SplitFull(path)
+        if not packetid.Valid(path) or dataORparity not in ('Data', 'Parity'):
+            files.append((path, filesz))
+            continue
+        if versionpath not in versions:
+            versions[versionpath] = {}
+        if supplierNum not in versions[versionpath]:
+            versions[versionpath][supplierNum] = {'Data': {}, 'Parity': {}}
+        versions[versionpath][supplierNum][dataORparity][blockNum] = filesz
+    for subpath in sorted(folders.keys()):
+        if folders[subpath]:
+            out.write('F%s -1\n' % subpath)
+        else:
+            out.write('D%s\n' % subpath)
+    for subpath, filesz in sorted(files):
+        out.write('F%s %d\n' % (subpath, filesz))
+    for subpath in sorted(versions.keys()):
+        maxBlock = -1
+        for blocks in versions[subpath].values():
+            maxBlock = max([maxBlock] + list(blocks['Data'].keys()) + list(blocks['Parity'].keys()))
+        for supplierNum in sorted(versions[subpath].keys()):
+            blocks = versions[subpath][supplierNum]
+            versionSize = sum(blocks['Data'].values()) + sum(blocks['Parity'].values())
+            dataMissing = [b for b in range(maxBlock + 1) if b not in blocks['Data']]
+            parityMissing = [b for b in range(maxBlock + 1) if b not in blocks['Parity']]
+            versionString = '%s %d 0-%d %d' % (subpath, supplierNum, maxBlock, versionSize)
+            if dataMissing or parityMissing:
+                versionString += ' missing'
+                if dataMissing:
+                    versionString += ' Data:' + (','.join(map(str, dataMissing)))
+                if parityMissing:
+                    versionString += ' Parity:' + (','.join(map(str, parityMissing)))
+            out.write('V%s\n' % versionString)
+    src = out.getvalue()
+    out.close()
+    return src
@@ -110,6 +110,7 @@ from bitdust.main import config
 from bitdust.main import events
 
 from bitdust.crypt import signed
+from bitdust.crypt import signature_verifier
 
 from bitdust.contacts import identitycache
 
@@ -152,6 +153,7 @@ def init():
     else:
         _LocalListener = TransportGateLocalProxy()
     _PacketLogFileEnabled = config.conf().getBool('logs/packet-enabled')
+    signature_verifier.init()
 
 
 def shutdown():
@@ -172,6 +174,7 @@ def shutdown():
     if _Debug:
         close_transport_log()
     _PacketLogFileEnabled = False
+    signature_verifier.shutdown()
 
 
 #------------------------------------------------------------------------------
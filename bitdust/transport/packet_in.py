@@ -86,6 +86,8 @@ from bitdust.services import driver
 from bitdust.p2p import commands
 from bitdust.p2p import p2p_stats
 
+from bitdust.crypt import signature_verifier
+
 from bitdust.transport import callback
 
 #------------------------------------------------------------------------------
@@ -251,8 +253,12 @@ def handle(newpacket, info):
     """
     Actually process incoming packet. Here we can be sure that owner/creator of the packet is identified.
     """
-    from bitdust.transport import packet_out
-    handled = False
+    if signature_verifier.is_active():
+        # signature is verified in a child process when there are many incoming packets
+        d = signature_verifier.verify(newpacket)
+        d.addCallback(lambda is_signature_valid: handle_verified(newpacket, info, is_signature_valid))
+        d.addErrback(lg.errback, debug=_Debug, debug_level=_DebugLevel, method='packet_in.handle')
+        return d
     # check that signed by a contact of ours
     try:
         is_signature_valid = newpacket.Valid(raise_signature_invalid=False)
@@ -260,6 +266,12 @@ def handle(newpacket, info):
         is_signature_valid = False
         # lg.exc('new packet from %s://%s is NOT VALID:\n\n%r\n' % (
         #     info.proto, info.host, newpacket.Serialize()))
+    return handle_verified(newpacket, info, is_signature_valid)
+
+
+def handle_verified(newpacket, info, is_signature_valid):
+    from bitdust.transport import packet_out
+    handled = False
     if not is_signature_valid:
         if _Debug:
             lg.args(_DebugLevel, PacketID=newpacket.PacketID, OwnerID=newpacket.OwnerID, CreatorID=newpacket.CreatorID, RemoteID=newpacket.RemoteID)
@@ -89,8 +89,11 @@ from bitdust.system import tmpfile
 from bitdust.contacts import contactsdb
 from bitdust.contacts import identitycache
 
+from bitdust.crypt import signed
+
 from bitdust.main import settings
 from bitdust.main import config
+from bitdust.main import events
 
 from bitdust.transport import callback
 
@@ -103,17 +106,35 @@ from bitdust.userid import my_id
 _OutboxQueue = []
 _PacketsCounter = 0
 
+# secondary indexes on top of `_OutboxQueue` to avoid scanning the whole queue on every incoming packet
+_OutboxByPacketID = {}
+_OutboxByFilename = {}
+_OutboxByTransferID = {}
+_OutboxByRemoteIDURL = {}
+_OutboxByNormalizedPacketID = {}
+
+# all known global IDs of my own identity (including rotated) mapped to the current one, see `my_rotated_customers()`
+_MyRotatedCustomers = None
+
 #------------------------------------------------------------------------------
 
 
 def init():
     global _PacketLogFileEnabled
     _PacketLogFileEnabled = config.conf().getBool('logs/packet-enabled')
+    events.add_subscriber(on_my_identity_changed, 'my-identity-rotated')
+    events.add_subscriber(on_my_identity_changed, 'local-identity-modified')
+    events.add_subscriber(on_my_identity_changed, 'local-identity-set')
 
 
 def shutdown():
     global _PacketLogFileEnabled
+    global _MyRotatedCustomers
+    events.remove_subscriber(on_my_identity_changed, 'local-identity-set')
+    events.remove_subscriber(on_my_identity_changed, 'local-identity-modified')
+    events.remove_subscriber(on_my_identity_changed, 'my-identity-rotated')
     _PacketLogFileEnabled = False
+    _MyRotatedCustomers = None
 
 
 #------------------------------------------------------------------------------
@@ -137,6 +158,122 @@ def queue():
     return _OutboxQueue
 
 
+def index_add(pkt_out):
+    """
+    Registers `PacketOut` instance in the secondary indexes by PacketID and remote IDURL.
+    Filename and transfer ID are registered later when they are known, see `index_filename()` and `index_transfer_id()`.
+    """
+    global _OutboxByPacketID
+    global _OutboxByRemoteIDURL
+    _OutboxByPacketID.setdefault(pkt_out.outpacket.PacketID.lower(), []).append(pkt_out)
+    _OutboxByRemoteIDURL.setdefault(pkt_out.remote_idurl_bin, []).append(pkt_out)
+    pkt_out.normalized_packet_id = normalize_packet_id(pkt_out.outpacket.PacketID)
+    _OutboxByNormalizedPacketID.setdefault(pkt_out.normalized_packet_id, []).append(pkt_out)
+
+
+def index_filename(pkt_out):
+    global _OutboxByFilename
+    _OutboxByFilename[pkt_out.filename] = pkt_out
+
+
+def index_transfer_id(pkt_out, transfer_id):
+    global _OutboxByTransferID
+    pkts = _OutboxByTransferID.setdefault(transfer_id, [])
+    if pkt_out not in pkts:
+        pkts.append(pkt_out)
+
+
+def index_remove(pkt_out):
+    """
+    Removes `PacketOut` instance from all secondary indexes, must be called before the instance is destroyed.
+    """
+    global _OutboxByPacketID
+    global _OutboxByFilename
+    global _OutboxByTransferID
+    global _OutboxByRemoteIDURL
+    _index_discard(_OutboxByPacketID, pkt_out.outpacket.PacketID.lower(), pkt_out)
+    _index_discard(_OutboxByNormalizedPacketID, pkt_out.normalized_packet_id, pkt_out)
+    _index_discard(_OutboxByRemoteIDURL, pkt_out.remote_idurl_bin, pkt_out)
+    if pkt_out.filename and _OutboxByFilename.get(pkt_out.filename) is pkt_out:
+        _OutboxByFilename.pop(pkt_out.filename)
+    for transfer_id in pkt_out.transfer_ids:
+        _index_discard(_OutboxByTransferID, transfer_id, pkt_out)
+
+
+def _index_discard(index, key, pkt_out):
+    pkts = index.get(key)
+    if not pkts:
+        return
+    if pkt_out in pkts:
+        pkts.remove(pkt_out)
+    if not pkts:
+        index.pop(key)
+
+
+def _index_lookup(index, keys):
+    """
+    Returns all `PacketOut` instances registered in the index under any of given keys.
+    Result keeps the order in which the packets were added to the outbox queue.
+    """
+    if len(keys) == 1:
+        return list(index.get(keys[0], []))
+    result = {}
+    for k in keys:
+        for p in index.get(k, []):
+            result[p.number] = p
+    return [result[n] for n in sorted(result.keys())]
+
+
+def my_rotated_customers():
+    """
+    Returns a dictionary where all known global IDs of my identity (current and rotated) are mapped to my current global ID.
+    The result is cached and only re-calculated after my identity was rotated or modified.
+    """
+    global _MyRotatedCustomers
+    if _MyRotatedCustomers is None:
+        my_idurl = my_id.getIDURL()
+        if not my_idurl:
+            return {}
+        current_customer = my_idurl.to_id().lower()
+        _MyRotatedCustomers = {
+            current_customer: current_customer,
+        }
+        for another_idurl in id_url.list_known_idurls(my_idurl, num_revisions=10, include_revisions=False):
+            _MyRotatedCustomers[global_id.UrlToGlobalID(another_idurl).lower()] = current_customer
+    return _MyRotatedCustomers
+
+
+def normalize_packet_id(packet_id):
+    """
+    Returns lowercased packet ID where any of my rotated global IDs is replaced with my current global ID.
+    This way responses to my own packets are matched with single dictionary lookup, even if they were sent to my older IDURL.
+    """
+    packet_id = packet_id.lower()
+    head, sep, tail = packet_id.partition(':')
+    if not sep:
+        return packet_id
+    key_alias, _, customer = head.rpartition('$')
+    current_customer = my_rotated_customers().get(customer)
+    if current_customer is None:
+        return packet_id
+    return '%s$%s:%s' % (key_alias or 'master', current_customer, tail)
+
+
+def on_my_identity_changed(evt):
+    """
+    My identity got a new revision and probably new IDURL - need to rebuild the cache and re-index the outbox.
+    """
+    global _MyRotatedCustomers
+    global _OutboxByNormalizedPacketID
+    _MyRotatedCustomers = None
+    _OutboxByNormalizedPacketID = {}
+    for p in queue():
+        p.normalized_packet_id = normalize_packet_id(p.outpacket.PacketID)
+        _OutboxByNormalizedPacketID.setdefault(p.normalized_packet_id, []).append(p)
+    if _Debug:
+        lg.args(_DebugLevel, event=evt.event_id, my_rotated_customers=my_rotated_customers())
+
+
 def create(outpacket, wide, callbacks, target=None, route=None, response_timeout=None, keep_alive=True, skip_ack=False):
     if _Debug:
         lg.out(
@@ -153,6 +290,7 @@ def create(outpacket, wide, callbacks, target=None, route=None, response_timeout
         )
     p = PacketOut(outpacket, wide, callbacks, target, route, response_timeout, keep_alive, skip_ack=skip_ack)
     queue().append(p)
+    index_add(p)
     p.automat('run')
     return p
 
@@ -161,9 +299,8 @@ def create(outpacket, wide, callbacks, target=None, route=None, response_timeout
 
 
 def search(proto, host, filename, remote_idurl=None):
-    for p in queue():
-        if p.filename != filename:
-            continue
+    p = _OutboxByFilename.get(filename)
+    if p is not None:
         for i in p.items:
             if i.proto == proto:
                 if not remote_idurl:
@@ -185,10 +322,7 @@ def search(proto, host, filename, remote_idurl=None):
 
 
 def search_by_packet_id(packet_id):
-    result = []
-    for p in queue():
-        if p.outpacket.PacketID.count(packet_id):
-            result.append(p)
+    result = _index_lookup(_OutboxByPacketID, [packet_id.lower()])
     if _Debug:
         lg.out(_DebugLevel, 'packet_out.search_by_packet_id %s:' % packet_id)
         lg.out(_DebugLevel, '%s' % ('        \n'.join(map(str, result))))
@@ -204,7 +338,17 @@ def search_many(
     packet_id=None,
 ):
     results = []
-    for p in queue():
+    # first pick the most selective index to get a short list of candidates
+    if filename:
+        candidates = [_OutboxByFilename[filename]] if filename in _OutboxByFilename else []
+    elif packet_id:
+        candidates = _index_lookup(_OutboxByPacketID, [packet_id.lower()])
+    elif remote_idurl:
+        # outgoing packet could be indexed with one of the older IDURLs of the same user
+        candidates = _index_lookup(_OutboxByRemoteIDURL, id_url.list_known_idurls(remote_idurl, num_revisions=100))
+    else:
+        candidates = queue()
+    for p in candidates:
         if remote_idurl and id_url.field(p.remote_idurl).to_bin() != id_url.field(remote_idurl).to_bin():
             continue
         if filename and p.filename != filename:
@@ -226,7 +370,7 @@ def search_many(
 
 
 def search_by_transfer_id(transfer_id):
-    for p in queue():
+    for p in _OutboxByTransferID.get(transfer_id, []):
         for i in p.items:
             if i.transfer_id and i.transfer_id == transfer_id:
                 return p, i
@@ -258,23 +402,20 @@ def search_by_response_packet(newpacket=None, proto=None, host=None, outgoing_co
                 host,
             )
         )
-    matching_packet_ids = []
-    matching_packet_ids.append(incoming_packet_id.lower())
     if incoming_command and incoming_command in [commands.Data(), commands.Retrieve()] and id_url.is_cached(incoming_owner_idurl) and incoming_owner_idurl == my_id.getIDURL():
-        my_rotated_idurls = id_url.list_known_idurls(my_id.getIDURL(), num_revisions=10, include_revisions=False)
-        # TODO: my_rotated_idurls can be cached for optimization
-        for another_idurl in my_rotated_idurls:
-            another_packet_id = global_id.SubstitutePacketID(incoming_packet_id, idurl=another_idurl).lower()
-            if another_packet_id not in matching_packet_ids:
-                matching_packet_ids.append(another_packet_id)
-    # if len(matching_packet_ids) > 1:
-    #     lg.warn('multiple packet IDs expecting to match for %r: %r' % (newpacket, matching_packet_ids))
+        # the response can be addressed to one of my older IDURLs, all of them are matching
+        matching_packet_ids = [
+            normalize_packet_id(incoming_packet_id),
+        ]
+        candidates = _index_lookup(_OutboxByNormalizedPacketID, matching_packet_ids)
+    else:
+        matching_packet_ids = [
+            incoming_packet_id.lower(),
+        ]
+        candidates = _index_lookup(_OutboxByPacketID, matching_packet_ids)
     matching_packet_ids_count = 0
     matching_command_ack_count = 0
-    for p in queue():
-        if p.outpacket.PacketID.lower() not in matching_packet_ids:
-            # PacketID of incoming packet not matching with that outgoing packet
-            continue
+    for p in candidates:
         matching_packet_ids_count += 1
         if p.outpacket.PacketID != incoming_packet_id:
             lg.warn('packet ID in queue "almost" matching with incoming: %s ~ %s' % (p.outpacket.PacketID, incoming_packet_id))
@@ -416,6 +557,8 @@ class PacketOut(automat.Automat):
             self.remote_idurl = self.outpacket.RemoteID
         if not self.remote_idurl:
             raise ValueError('outgoing packet %r did not define remote idurl' % outpacket)
+        # remember how remote IDURL looked like when packet was added to the index, it can be rotated later
+        self.remote_idurl_bin = id_url.to_bin(self.remote_idurl)
         self.remote_name = nameurl.GetName(self.outpacket.RemoteID)
         if id_url.to_bin(self.remote_idurl) != self.outpacket.RemoteID.to_bin():
             self.label = 'out_%d_%s_%s_via_%s' % (
@@ -428,6 +571,9 @@ class PacketOut(automat.Automat):
             self.label = 'out_%d_%s_%s' % (get_packets_counter(), packet_label, self.remote_name)
         self.keep_alive = keep_alive
         self.skip_ack = skip_ack
+        self.number = get_packets_counter()
+        self.filename = None
+        self.transfer_ids = []
         automat.Automat.__init__(
             self,
             name=self.label,
@@ -723,10 +869,14 @@ class PacketOut(automat.Automat):
             a_packet = self.route.get('packet', a_packet)
         try:
             fileno, self.filename = tmpfile.make('outbox', extension='.out')
-            self.packetdata = a_packet.Serialize()
-            os.write(fileno, self.packetdata)
+            index_filename(self)
+            # binary format is only used when remote node announced support for it in the identity
+            # serialized copy is not kept in memory, transports are reading it from the file
+            packetdata = a_packet.Serialize(binary=signed.IsBinaryFormatSupported(self.remote_identity))
+            os.write(fileno, packetdata)
             os.close(fileno)
-            self.filesize = len(self.packetdata)
+            self.filesize = len(packetdata)
+            del packetdata
             if self.filesize < 1024*10:
                 if self.response_timeout:
                     self.timeout = self.response_timeout
@@ -768,6 +918,9 @@ class PacketOut(automat.Automat):
         for i in range(len(self.items)):
             if self.items[i].proto == proto:
                 self.items[i].transfer_id = transfer_id
+                if transfer_id not in self.transfer_ids:
+                    self.transfer_ids.append(transfer_id)
+                index_transfer_id(self, transfer_id)
                 if _Debug:
                     lg.out(_DebugLevel, 'packet_out.doSetTransferID  %r:%r = %r' % (proto, host, transfer_id))
                 ok = True
@@ -1063,6 +1216,7 @@ class PacketOut(automat.Automat):
         Remove all references to the state machine object to destroy it.
         """
         queue().remove(self)
+        index_remove(self)
         if self not in self.outpacket.Packets:
             lg.warn('packet_out not connected to the packet')
         else:
@@ -54,6 +54,8 @@ _DebugLevel = 24
 
 import os
 import sys
+import time
+import json
 import tempfile
 import traceback
 
@@ -81,6 +83,12 @@ _MergedIDURLs = {}
 _KnownSources = {}
 _KnownUniqueNames = {}
 _Ready = False
+_SnapshotVersion = 1
+_SnapshotFileName = 'snapshot'
+_SnapshotSaveDelay = 10
+_SnapshotSaveTask = None
+_SnapshotDirty = False
+_SnapshotSaveWhenRunning = False
 
 #------------------------------------------------------------------------------
 
@@ -96,6 +104,7 @@ def init():
     from bitdust.userid import identity
     if _Debug:
         lg.out(_DebugLevel, 'id_url.init')
+    started = time.time()
     if not _IdentityHistoryDir:
         _IdentityHistoryDir = settings.IdentityHistoryDir()
     if not os.path.exists(_IdentityHistoryDir):
@@ -103,6 +112,10 @@ def init():
         lg.info('created new folder %r' % _IdentityHistoryDir)
     else:
         lg.info('using existing folder %r' % _IdentityHistoryDir)
+    if load_snapshot():
+        _Ready = True
+        lg.info('loaded %d known users from identity history snapshot in %.3f seconds' % (len(_KnownUsers), time.time() - started))
+        return
     for_cleanup = []
     for one_user_dir in os.listdir(_IdentityHistoryDir):
         one_user_name = one_user_dir.split('@')[0]
@@ -193,7 +206,9 @@ def init():
                 os.remove(one_ident_path)
             except:
                 lg.exc()
+    save_snapshot()
     _Ready = True
+    lg.info('replayed identity history of %d known users in %.3f seconds' % (len(_KnownUsers), time.time() - started))
 
 
 def shutdown():
@@ -204,6 +219,10 @@ def shutdown():
     global _MergedIDURLs
     global _KnownSources
     global _KnownUniqueNames
+    global _SnapshotDirty
+    if _SnapshotDirty or _SnapshotSaveTask:
+        save_snapshot()
+    _SnapshotDirty = False
     _IdentityHistoryDir = None
     _KnownUsers.clear()
     _KnownIDURLs.clear()
@@ -216,6 +235,138 @@ def shutdown():
 #------------------------------------------------------------------------------
 
 
+def load_snapshot():
+    """
+    Populates all in-memory maps from the snapshot file stored in the identity history folder.
+    Returns False if the snapshot is missing, broken or not matching with the files in the history folder,
+    in that case all of the historical identities must be read and verified again.
+    """
+    snapshot_path = os.path.join(_IdentityHistoryDir, _SnapshotFileName)
+    if not os.path.isfile(snapshot_path):
+        return False
+    try:
+        raw_data = local_fs.ReadBinaryFile(snapshot_path)
+        header, _, body = raw_data.partition(b'\n')
+        version, checksum = strng.to_text(header).split(' ')
+        if int(version) != _SnapshotVersion:
+            lg.warn('identity history snapshot version %r is not supported' % version)
+            return False
+        if hashes.sha256(body, hexdigest=True) != strng.to_bin(checksum):
+            lg.warn('identity history snapshot is broken, checksum not matching')
+            return False
+        snapshot = json.loads(strng.to_text(body))
+        if snapshot['fingerprint'] != _history_fingerprint():
+            lg.warn('identity history snapshot is outdated')
+            return False
+        known_users = {}
+        for pub_key, user_dir in snapshot['users'].items():
+            known_users[strng.to_bin(pub_key)] = os.path.join(_IdentityHistoryDir, user_dir)
+        known_idurls = {}
+        for idurl, pub_key in snapshot['idurls'].items():
+            known_idurls[strng.to_bin(idurl)] = strng.to_bin(pub_key)
+        merged_idurls = {}
+        for pub_key, revisions in snapshot['merged'].items():
+            merged_idurls[strng.to_bin(pub_key)] = {int(rev): strng.to_bin(idurl) for rev, idurl in revisions}
+        known_sources = {}
+        for pub_key, idurls in snapshot['sources'].items():
+            known_sources[strng.to_bin(pub_key)] = [strng.to_bin(idurl) for idurl in idurls]
+        known_unique_names = {}
+        for unique_name, idurls in snapshot['unique_names'].items():
+            known_unique_names[unique_name] = [strng.to_bin(idurl) for idurl in idurls]
+    except:
+        lg.exc()
+        return False
+    _KnownUsers.update(known_users)
+    _KnownIDURLs.update(known_idurls)
+    _MergedIDURLs.update(merged_idurls)
+    _KnownSources.update(known_sources)
+    _KnownUniqueNames.update(known_unique_names)
+    return True
+
+
+def save_snapshot():
+    """
+    Writes all in-memory maps into the snapshot file, so next time they can be loaded much faster.
+    """
+    global _SnapshotSaveTask
+    global _SnapshotDirty
+    if _SnapshotSaveTask:
+        if _SnapshotSaveTask.active():
+            _SnapshotSaveTask.cancel()
+        _SnapshotSaveTask = None
+    _SnapshotDirty = False
+    if not _IdentityHistoryDir or not os.path.isdir(_IdentityHistoryDir):
+        return False
+    snapshot = {
+        'fingerprint': _history_fingerprint(),
+        'users': {strng.to_text(pub_key): os.path.basename(user_path) for pub_key, user_path in _KnownUsers.items()},
+        'idurls': {strng.to_text(idurl): strng.to_text(pub_key) for idurl, pub_key in _KnownIDURLs.items()},
+        'merged': {strng.to_text(pub_key): [[rev, strng.to_text(idurl)] for rev, idurl in revisions.items()] for pub_key, revisions in _MergedIDURLs.items()},
+        'sources': {strng.to_text(pub_key): [strng.to_text(idurl) for idurl in idurls] for pub_key, idurls in _KnownSources.items()},
+        'unique_names': {strng.to_text(unique_name): [strng.to_text(idurl) for idurl in idurls] for unique_name, idurls in _KnownUniqueNames.items()},
+    }
+    body = strng.to_bin(json.dumps(snapshot))
+    header = strng.to_bin('%d %s' % (_SnapshotVersion, strng.to_text(hashes.sha256(body, hexdigest=True))))
+    if not local_fs.WriteBinaryFile(os.path.join(_IdentityHistoryDir, _SnapshotFileName), header + b'\n' + body):
+        return False
+    if _Debug:
+        lg.args(_DebugLevel, users=len(_KnownUsers), idurls=len(_KnownIDURLs), size=len(body))
+    return True
+
+
+def _schedule_save_snapshot():
+    """
+    Must be called only when the in-memory maps or the files in the identity history folder were changed.
+    """
+    global _SnapshotSaveTask
+    global _SnapshotDirty
+    global _SnapshotSaveWhenRunning
+    from twisted.internet import reactor  # @UnresolvedImport
+    from twisted.python import threadable  # @UnresolvedImport
+    _SnapshotDirty = True
+    if not reactor.running:  # @UndefinedVariable
+        # all known identities are cached during the start up, write the snapshot only one time after that
+        if not _SnapshotSaveWhenRunning:
+            _SnapshotSaveWhenRunning = True
+            reactor.callWhenRunning(_on_reactor_started)  # @UndefinedVariable
+        return
+    if not threadable.isInIOThread():
+        # identity can also be cached outside of the main thread
+        reactor.callFromThread(_schedule_save_snapshot)  # @UndefinedVariable
+        return
+    if _SnapshotSaveTask and _SnapshotSaveTask.active():
+        return
+    # many identities can be cached at once, write the snapshot only one time after that
+    _SnapshotSaveTask = reactor.callLater(_SnapshotSaveDelay, save_snapshot)  # @UndefinedVariable
+
+
+def _on_reactor_started():
+    global _SnapshotSaveWhenRunning
+    _SnapshotSaveWhenRunning = False
+    if _SnapshotDirty and _IdentityHistoryDir:
+        _schedule_save_snapshot()
+
+
+def _history_fingerprint():
+    """
+    Calculates a hash of all files in the identity history folder: names, sizes and modification times.
+    This way the snapshot is not used when the files were changed after the snapshot was written.
+    """
+    parts = []
+    for one_user_dir in sorted(os.listdir(_IdentityHistoryDir)):
+        one_user_dir_path = os.path.join(_IdentityHistoryDir, one_user_dir)
+        if not os.path.isdir(one_user_dir_path):
+            continue
+        parts.append(one_user_dir)
+        for one_filename in sorted(os.listdir(one_user_dir_path)):
+            st = os.stat(os.path.join(one_user_dir_path, one_filename))
+            parts.append('%s:%d:%d' % (one_filename, st.st_size, st.st_mtime_ns))
+    return strng.to_text(hashes.sha1(strng.to_bin('\n'.join(parts)), hexdigest=True))
+
+
+#------------------------------------------------------------------------------
+
+
 def known():
     global _KnownIDURLs
     return _KnownIDURLs
@@ -279,9 +430,12 @@ def identity_cached(new_id_obj):
     latest_id_obj = None
     latest_sources = []
     for_cleanup = []
+    # the snapshot must be written again only if something was actually changed
+    changed = False
     if pub_key not in _KnownUsers:
         user_path = tempfile.mkdtemp(prefix=user_name + '@', dir=_IdentityHistoryDir)
         _KnownUsers[pub_key] = user_path
+        changed = True
         first_identity_file_path = os.path.join(user_path, '0')
         if os.path.exists(first_identity_file_path):
             try:
@@ -342,6 +496,7 @@ def identity_cached(new_id_obj):
                         except:
                             lg.exc()
                     local_fs.WriteBinaryFile(latest_identity_file_path, new_id_obj.serialize())
+                    changed = True
                     if _Debug:
                         lg.out(_DebugLevel, 'id_url.identity_cached latest identity sources for user %r did not changed, updated file %r' % (user_name, latest_identity_file_path))
                 else:
@@ -353,6 +508,7 @@ def identity_cached(new_id_obj):
                         except:
                             lg.exc()
                     local_fs.WriteBinaryFile(next_identity_file_path, new_id_obj.serialize())
+                    changed = True
                     is_identity_rotated = True
                     if _Debug:
                         lg.out(_DebugLevel, 'id_url.identity_cached identity sources for user %r changed, wrote new item in the history: %r' % (user_name, next_identity_file_path))
@@ -361,25 +517,30 @@ def identity_cached(new_id_obj):
     for new_idurl in reversed(new_sources):
         if new_idurl not in _KnownIDURLs:
             _KnownIDURLs[new_idurl] = new_id_obj.getPublicKey()
+            changed = True
             if _Debug:
                 lg.out(_DebugLevel, 'id_url.identity_cached new IDURL added: %r' % new_idurl)
         else:
             if _KnownIDURLs[new_idurl] != new_id_obj.getPublicKey():
                 lg.warn('another user had same identity source: %r' % new_idurl)
                 _KnownIDURLs[new_idurl] = new_id_obj.getPublicKey()
+                changed = True
         if pub_key not in _MergedIDURLs:
             _MergedIDURLs[pub_key] = {}
+            changed = True
             if _Debug:
                 lg.out(_DebugLevel, 'id_url.identity_cached new Public Key added: %s...' % pub_key[-10:])
         prev_idurl = _MergedIDURLs[pub_key].get(new_revision, None)
         if new_revision in _MergedIDURLs[pub_key]:
             if _MergedIDURLs[pub_key][new_revision] != new_idurl:
+                changed = True
                 if nameurl.GetName(_MergedIDURLs[pub_key][new_revision]) == nameurl.GetName(new_idurl):
                     if _MergedIDURLs[pub_key][new_revision] not in new_sources:
                         lg.warn('rewriting existing identity revision %d : %r -> %r' % (new_revision, _MergedIDURLs[pub_key][new_revision], new_idurl))
             _MergedIDURLs[pub_key][new_revision] = new_idurl
         else:
             _MergedIDURLs[pub_key][new_revision] = new_idurl
+            changed = True
             if _Debug:
                 lg.out(_DebugLevel, 'id_url.identity_cached added new revision %d for user %r, total revisions %d: %r -> %r' % (new_revision, user_name, len(_MergedIDURLs[pub_key]), prev_idurl, new_idurl))
     if pub_key not in _KnownSources:
@@ -387,6 +548,7 @@ def identity_cached(new_id_obj):
     for one_source in new_sources:
         if one_source not in _KnownSources[pub_key]:
             _KnownSources[pub_key].append(one_source)
+            changed = True
             if _Debug:
                 lg.out(_DebugLevel, 'id_url.identity_cached added new source %r for user %r' % (one_source, user_name))
     unique_name = '{}_{}'.format(
@@ -398,6 +560,7 @@ def identity_cached(new_id_obj):
     for one_source in new_sources:
         if one_source not in _KnownUniqueNames[unique_name]:
             _KnownUniqueNames[unique_name].append(one_source)
+            changed = True
             if _Debug:
                 lg.out(_DebugLevel, 'id_url.identity_cached added new source %r for unique name %r' % (one_source, unique_name))
     if _Debug:
@@ -454,8 +617,11 @@ def identity_cached(new_id_obj):
         if os.path.isfile(identity_file_path):
             try:
                 os.remove(identity_file_path)
+                changed = True
             except:
                 lg.exc()
+    if changed:
+        _schedule_save_snapshot()
     return True
 
 
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# id_verified.py
+#
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (id_verified.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+#
+#
+#
+#
+"""
+.. module:: id_verified.
+
+Remembers identities which signatures were already verified.
+
+Every record is a sha256 digest of the public key, identity hash and signature - exactly
+what is passed to ``key.VerifySignature()``. Any change in the identity content gives another digest,
+so modified identities are always verified again.
+
+Records are kept in memory and also appended to a local file, so same identity is verified
+only once even after restart.
+"""
+
+#------------------------------------------------------------------------------
+
+from __future__ import absolute_import
+
+#------------------------------------------------------------------------------
+
+_Debug = False
+_DebugLevel = 14
+
+#------------------------------------------------------------------------------
+
+import os
+import threading
+
+from collections import OrderedDict
+
+#------------------------------------------------------------------------------
+
+from bitdust.logs import lg
+
+from bitdust.system import bpio
+
+from bitdust.crypt import hashes
+
+from bitdust.lib import strng
+
+from bitdust.main import settings
+
+#------------------------------------------------------------------------------
+
+_MaxRecords = 20000
+_VerifiedDigests = OrderedDict()
+_VerifiedDigestsLock = threading.Lock()
+_FilePath = None
+_FileRecords = 0
+_Hits = 0
+_Misses = 0
+
+#------------------------------------------------------------------------------
+
+
+def init(filepath=None):
+    """
+    Loads all known records from the local file.
+    """
+    global _FilePath
+    global _FileRecords
+    if filepath is None:
+        filepath = settings.VerifiedIdentitiesFile()
+    _FilePath = filepath
+    _FileRecords = 0
+    if not os.path.isdir(os.path.dirname(_FilePath)):
+        bpio._dir_make(os.path.dirname(_FilePath))
+    if not os.path.isfile(_FilePath):
+        if _Debug:
+            lg.out(_DebugLevel, 'id_verified.init  no records found in %r' % _FilePath)
+        return
+    src = bpio.ReadTextFile(_FilePath) or ''
+    with _VerifiedDigestsLock:
+        for line in src.splitlines():
+            line = line.strip()
+            if len(line) != 64:
+                continue
+            _FileRecords += 1
+            _VerifiedDigests[line] = True
+            _VerifiedDigests.move_to_end(line)
+        while len(_VerifiedDigests) > _MaxRecords:
+            _VerifiedDigests.popitem(last=False)
+        if _FileRecords > len(_VerifiedDigests):
+            # file grows only by appending, time to remove duplicated and outdated records
+            _FileRecords = len(_VerifiedDigests)
+            if not bpio.WriteTextFile(_FilePath, ''.join('%s\n' % d for d in _VerifiedDigests.keys())):
+                lg.warn('failed to write %r' % _FilePath)
+    if _Debug:
+        lg.out(_DebugLevel, 'id_verified.init  loaded %d records from %r' % (len(_VerifiedDigests), _FilePath))
+
+
+def shutdown():
+    global _FilePath
+    global _FileRecords
+    global _Hits
+    global _Misses
+    with _VerifiedDigestsLock:
+        _VerifiedDigests.clear()
+        _FilePath = None
+        _FileRecords = 0
+        _Hits = 0
+        _Misses = 0
+
+
+def info():
+    return {
+        'records': len(_VerifiedDigests),
+        'hits': _Hits,
+        'misses': _Misses,
+        'file': _FilePath,
+    }
+
+
+#------------------------------------------------------------------------------
+
+
+def make_digest(publickey, hashcode, signature):
+    return strng.to_text(hashes.sha256(b'\n'.join([
+        strng.to_bin(publickey),
+        strng.to_bin(hashcode),
+        strng.to_bin(signature),
+    ]), hexdigest=True))
+
+
+def is_verified(digest):
+    global _Hits
+    global _Misses
+    with _VerifiedDigestsLock:
+        if digest in _VerifiedDigests:
+            _VerifiedDigests.move_to_end(digest)
+            _Hits += 1
+            return True
+        _Misses += 1
+    return False
+
+
+def remember(digest):
+    """
+    Must be called only after signature was actually verified and found correct.
+    """
+    global _FileRecords
+    with _VerifiedDigestsLock:
+        if digest in _VerifiedDigests:
+            return
+        _VerifiedDigests[digest] = True
+        while len(_VerifiedDigests) > _MaxRecords:
+            _VerifiedDigests.popitem(last=False)
+        if not _FilePath:
+            return
+        try:
+            with open(_FilePath, 'a') as f:
+                f.write('%s\n' % digest)
+            _FileRecords += 1
+        except:
+            lg.exc()
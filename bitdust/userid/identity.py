@@ -167,6 +167,7 @@ from bitdust.crypt import key
 
 from bitdust.userid import global_id
 from bitdust.userid import id_url
+from bitdust.userid import id_verified
 
 #------------------------------------------------------------------------------
 
@@ -373,11 +374,16 @@ class identity(object):
         """
         # print('Valid %r' % self.signature)
         hashcode = self.makehash()
+        verified_digest = id_verified.make_digest(self.publickey, hashcode, self.signature)
+        if id_verified.is_verified(verified_digest):
+            return True
         result = key.VerifySignature(
             self.publickey,
             hashcode,
             self.signature,
         )
+        if result:
+            id_verified.remember(verified_digest)
         return result
 
     #------------------------------------------------------------------------------
@@ -62,6 +62,7 @@ from bitdust.main import events
 from bitdust.lib import misc
 from bitdust.lib import nameurl
 from bitdust.lib import strng
+from bitdust.lib import serialization
 
 from bitdust.crypt import key
 
@@ -594,7 +595,8 @@ def rebuildLocalIdentity(identity_object=None, skip_transports=[], new_sources=N
     repo = 'sources'
     # lid.setVersion((vernum + b' ' + strng.to_bin(repo.strip()) + b' ' + strng.to_bin(bpio.osinfo().strip()).strip()))
     # TODO: add latest commit hash from the GIT repo to the version
-    lid.setVersion(vernum + b' ' + strng.to_bin(repo.strip()))
+    # also let other nodes know which features of the network protocol are supported by my software
+    lid.setVersion(vernum + b' ' + strng.to_bin(repo.strip()) + b' ' + strng.to_bin(serialization.BINARY_FORMAT_FEATURE))
     # generate signature with changed content
     lid.sign()
     new_xmlsrc = lid.serialize()
@@ -27,6 +27,7 @@ except ImportError:
 import sqlite3
 import os
 import json
+import threading
 
 from . import constants  # @UnresolvedImport
 from . import encoding  # @UnresolvedImport
@@ -106,6 +107,30 @@ class DataStore(DictMixin):
         Delete the specified key (and its value)
         """
 
+    def getAllItems(self):
+        """
+        Return a list of all stored records, every record is a dictionary just like in C{getItem}.
+        """
+        items = []
+        for key in self.keys():
+            item = self.getItem(key)
+            if item:
+                items.append(item)
+        return items
+
+    def getItemsToRepublish(self, now):
+        """
+        Return a list of records which are expired or must be replicated at the moment C{now}.
+        """
+        return [item for item in self.getAllItems() if _isTimeToRepublish(item, now)]
+
+    def removeItems(self, keys):
+        """
+        Delete many records at once.
+        """
+        for key in keys:
+            del self[key]
+
     def __iter__(self):
         """
         """
@@ -120,6 +145,12 @@ class DataStore(DictMixin):
         """
 
 
+def _isTimeToRepublish(item, now):
+    if now - item['originallyPublished'] >= constants.dataExpireTimeout:
+        return True
+    return now - item['lastPublished'] >= constants.replicateInterval
+
+
 class DictDataStore(DataStore):
     """
     A datastore using an in-memory Python dictionary.
@@ -185,11 +216,11 @@ class DictDataStore(DataStore):
         try:
             row = self._dict[key]
             result = dict(
-                key=row[0].encode(),
-                value=row[1],
-                lastPublished=row[2],
-                originallyPublished=row[3],
-                originalPublisherID=None if not row[4] else row[4].encode(),
+                key=key,
+                value=row[0],
+                lastPublished=row[1],
+                originallyPublished=row[2],
+                originalPublisherID=row[3] or None,
             )
         except:
             return None
@@ -199,7 +230,13 @@ class DictDataStore(DataStore):
 class SQLiteVersionedJsonDataStore(DataStore):
     """
     SQLite database-based datastore.
+
+    Records are indexed by key and by publish times, database runs in WAL mode.
+    Database files created by older versions are migrated to the current schema on open.
     """
+
+    SCHEMA_VERSION = 2
+
     def __init__(self, dbFile=':memory:'):
         """
         @param dbFile: The name of the file containing the SQLite database; if
@@ -213,54 +250,133 @@ class SQLiteVersionedJsonDataStore(DataStore):
                 dbFile,
                 createDB,
             ))
-        self._db = sqlite3.connect(dbFile)
+        # republishing is running in a thread, so all calls are serialized with the lock
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(dbFile, check_same_thread=False)
         self._db.isolation_level = None
         self._db.text_factory = encoding.to_text
-        if createDB:
+        if dbFile != ':memory:':
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+        self._cursor = self._db.cursor()
+        self._migrate()
+
+    def _migrate(self):
+        schema_version = self._db.execute('PRAGMA user_version').fetchone()[0]
+        table_exists = self._db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='data'").fetchone() is not None
+        if not table_exists:
             self.create_table()
+            self._db.execute('PRAGMA user_version=%d' % self.SCHEMA_VERSION)
             if _Debug:
                 print('[DHT DB]  Created empty table for DHT records')
-        self._cursor = self._db.cursor()
-
-    def _dbQuery(self, key, columnName):
+            return
+        if schema_version >= self.SCHEMA_VERSION:
+            return
+        self._db.execute('BEGIN')
         try:
+            self._db.execute('ALTER TABLE data RENAME TO data_old')
+            self.create_table()
+            # old table did not have unique keys, the latest revision wins
+            self._db.execute(
+                'INSERT OR REPLACE INTO data(key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision) '
+                'SELECT key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision FROM data_old '
+                'WHERE key IS NOT NULL ORDER BY revision, rowid'
+            )
+            self._db.execute('DROP TABLE data_old')
+            self._db.execute('PRAGMA user_version=%d' % self.SCHEMA_VERSION)
+        except:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
+        if _Debug:
+            print('[DHT DB] %r migrated from schema version %d to %d' % (self.dbFile, schema_version, self.SCHEMA_VERSION))
+
+    def _fetchRow(self, key):
+        with self._lock:
             self._cursor.execute(
-                'SELECT %s FROM data WHERE key=:reqKey' % columnName,
+                'SELECT key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision FROM data WHERE key=:reqKey',
                 {
-                    'reqKey': key,
+                    'reqKey': encoding.to_text(key),
                 },
             )
-            row = self._cursor.fetchone()
-            value = row[0]
-        except:
-            raise KeyError(key)
-        else:
-            return value
+            return self._cursor.fetchone()
+
+    def _rowToItem(self, row):
+        v = row[1]
+        if isinstance(v, buffer):
+            v = encoding.to_text(v)
+
+        v = json.loads(v)
+
+        # TODO: check / verify v['k'] against key_hex
+        # TODO: check / verify v['v'] against PROTOCOL_VERSION
+
+        return dict(
+            key=row[0],
+            value=v['d'],
+            lastPublished=row[2],
+            originallyPublished=row[3],
+            originalPublisherID=row[4] or None,
+            expireSeconds=row[5],
+            revision=row[6],
+        )
+
+    def _dbQuery(self, key, columnName):
+        with self._lock:
+            try:
+                self._cursor.execute(
+                    'SELECT %s FROM data WHERE key=:reqKey' % columnName,
+                    {
+                        'reqKey': encoding.to_text(key),
+                    },
+                )
+                row = self._cursor.fetchone()
+                value = row[0]
+            except:
+                raise KeyError(key)
+            else:
+                return value
 
     def __getitem__(self, key):
         v = self._dbQuery(key, 'value')
         v = json.loads(v)
         return v['d']
 
+    def __contains__(self, key):
+        with self._lock:
+            self._cursor.execute('SELECT 1 FROM data WHERE key=:reqKey', {
+                'reqKey': encoding.to_text(key),
+            })
+            return self._cursor.fetchone() is not None
+
     def __delitem__(self, key):
-        self._cursor.execute('DELETE FROM data WHERE key=:reqKey', {
-            'reqKey': key,
-        })
+        with self._lock:
+            self._cursor.execute('DELETE FROM data WHERE key=:reqKey', {
+                'reqKey': encoding.to_text(key),
+            })
+
+    def __len__(self):
+        with self._lock:
+            self._cursor.execute('SELECT COUNT(*) FROM data')
+            return self._cursor.fetchone()[0]
 
     def create_table(self):
-        self._db.execute('CREATE TABLE data(key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision)')
+        self._db.execute('CREATE TABLE data(key TEXT PRIMARY KEY, value, lastPublished INTEGER, originallyPublished INTEGER, originalPublisherID, expireSeconds INTEGER, revision INTEGER)')
+        self._db.execute('CREATE INDEX data_originally_published ON data(originallyPublished)')
+        self._db.execute('CREATE INDEX data_last_published ON data(lastPublished)')
 
     def keys(self):
         """
         Return a list of the keys in this data store.
         """
         keys = []
-        try:
-            self._cursor.execute('SELECT key FROM data')
-            for row in self._cursor:
-                keys.append(row[0])
-        finally:
-            return keys
+        with self._lock:
+            try:
+                self._cursor.execute('SELECT key FROM data')
+                for row in self._cursor:
+                    keys.append(row[0])
+            finally:
+                return keys
 
     def lastPublished(self, key):
         """
@@ -304,117 +420,92 @@ class SQLiteVersionedJsonDataStore(DataStore):
     def setItem(self, key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds=constants.dataExpireSecondsDefaut, **kwargs):
         key_hex = encoding.to_text(key)
         new_revision = kwargs.get('revision', None)
-        if new_revision is None:
-            new_revision = self.revision(key) + 1
-        self._cursor.execute('select key from data where key=:reqKey', {'reqKey': key_hex})
         opID = originalPublisherID or None
-        if self._cursor.fetchone() is None:
-            self._cursor.execute(
-                'INSERT INTO data(key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision) VALUES (?, ?, ?, ?, ?, ?, ?)', (
-                    key_hex,
-                    json.dumps({
-                        'k': key_hex,
-                        'd': value,
-                        'v': PROTOCOL_VERSION,
-                    }),
-                    lastPublished,
-                    originallyPublished,
-                    opID,
-                    expireSeconds,
-                    new_revision,
+        json_value = json.dumps({
+            'k': key_hex,
+            'd': value,
+            'v': PROTOCOL_VERSION,
+        })
+        with self._lock:
+            if new_revision is None:
+                # the next revision number is calculated in the same statement
+                self._cursor.execute(
+                    'INSERT OR REPLACE INTO data(key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision) '
+                    'VALUES (?, ?, ?, ?, ?, ?, COALESCE((SELECT revision FROM data WHERE key=?), 0) + 1)', (
+                        key_hex,
+                        json_value,
+                        lastPublished,
+                        originallyPublished,
+                        opID,
+                        expireSeconds,
+                        key_hex,
+                    )
                 )
-            )
-            if _Debug:
-                print('[DHT DB] %r setItem  stored new value for key [%s] with revision %d' % (self.dbFile, key, new_revision))
-        else:
-            self._cursor.execute(
-                'UPDATE data SET value=?, lastPublished=?, originallyPublished=?, originalPublisherID=?, expireSeconds=?, revision=? WHERE key=?', (
-                    json.dumps({
-                        'k': key_hex,
-                        'd': value,
-                        'v': PROTOCOL_VERSION,
-                    }),
-                    lastPublished,
-                    originallyPublished,
-                    opID,
-                    expireSeconds,
-                    new_revision,
-                    key_hex,
+            else:
+                self._cursor.execute(
+                    'INSERT OR REPLACE INTO data(key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', (
+                        key_hex,
+                        json_value,
+                        lastPublished,
+                        originallyPublished,
+                        opID,
+                        expireSeconds,
+                        new_revision,
+                    )
                 )
-            )
-            if _Debug:
-                print('[DHT DB] %r setItem  updated existing value for key [%s] with revision %d' % (self.dbFile, key, new_revision))
+        if _Debug:
+            print('[DHT DB] %r setItem  stored value for key [%s] with revision %r' % (self.dbFile, key, new_revision))
 
     def getItem(self, key):
-        key_hex = key
-        key_hex = encoding.to_text(key)
-        self._cursor.execute('SELECT * FROM data WHERE key=:reqKey', {
-            'reqKey': key_hex,
-        })
-
-        row = self._cursor.fetchone()
+        row = self._fetchRow(key)
         if not row:
             if _Debug:
-                print('[DHT DB] %r getItem [%s]  return None : did not found key in dataStore' % (self.dbfile, key))
+                print('[DHT DB] %r getItem [%s]  return None : did not found key in dataStore' % (self.dbFile, key))
             return None
 
-        v = row[1]
-        if isinstance(v, buffer):
-            v = encoding.to_text(v)
-
-        v = json.loads(v)
-
-        # TODO: check / verify v['k'] against key_hex
-        # TODO: check / verify v['v'] against PROTOCOL_VERSION
-
-        value = v['d']
-
-        key_orig = row[0]
-
         # TODO: check / verify key_orig against key
 
-        opID = row[4] or None
-
-        result = dict(
-            key=key_orig,
-            value=value,
-            lastPublished=row[2],
-            originallyPublished=row[3],
-            originalPublisherID=opID,
-            expireSeconds=row[5],
-            revision=row[6],
-        )
+        result = self._rowToItem(row)
 
         if _Debug:
             print('[DHT DB] %r getItem   found one record for key [%s], revision is %d' % (self.dbFile, key, row[6]))
         return result
 
     def getAllItems(self):
-        self._cursor.execute('SELECT * FROM data')
-        rows = self._cursor.fetchall()
-        items = []
-        for row in rows:
+        with self._lock:
+            self._cursor.execute('SELECT key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision FROM data')
+            rows = self._cursor.fetchall()
+        return [self._rowToItem(row) for row in rows]
 
-            v = row[1]
-            if isinstance(v, buffer):
-                v = encoding.to_text(v)
-
-            v = json.loads(v)
-
-            # TODO: check / verify v['k'] against key_hex
-            # TODO: check / verify v['v'] against PROTOCOL_VERSION
-
-            value = v['d']
-
-            _k = row[0]
-            _opID = row[4] or None
-
-            items.append(dict(
-                value=value,
-                lastPublished=row[2],
-                originallyPublished=row[3],
-                originalPublisherID=_opID,
-                expireSeconds=row[5],
-                revision=row[6],
-            ))
-        return items
+    def getItemsToRepublish(self, now):
+        with self._lock:
+            self._cursor.execute(
+                'SELECT key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision FROM data '
+                'WHERE originallyPublished<=:expireBefore OR lastPublished<=:replicateBefore',
+                {
+                    'expireBefore': now - constants.dataExpireTimeout,
+                    'replicateBefore': now - constants.replicateInterval,
+                },
+            )
+            rows = self._cursor.fetchall()
+        return [self._rowToItem(row) for row in rows]
+
+    def removeItems(self, keys):
+        """
+        Delete many records at once in a single transaction.
+        """
+        if not keys:
+            return
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                self._cursor.executemany('DELETE FROM data WHERE key=?', [(encoding.to_text(key), ) for key in keys])
+            except:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -660,21 +660,15 @@ class Node(object):
         #     self._counter('rpc_node_findValue')
         if _Debug:
             print('[DHT NODE] SINGLE rpcmethod.findValue %r' % key)
-        if key in self._dataStore:
-            exp = None
-            expireSecondsCall = getattr(self._dataStore, 'expireSeconds')
-            if expireSecondsCall:
-                exp = expireSecondsCall(key)
-            originalPublishTimeCall = getattr(self._dataStore, 'originalPublishTime')
-            published = None
-            if originalPublishTimeCall:
-                published = originalPublishTimeCall(key)
+        # value and all metadata are fetched at once
+        item = self._dataStore.getItem(key)
+        if item:
             if _Debug:
-                print('[DHT NODE]  SINGLE    found key in local dataStore %r' % self._dataStore[key])
+                print('[DHT NODE]  SINGLE    found key in local dataStore %r' % item['value'])
             return {
-                key: self._dataStore[key],
-                'expireSeconds': exp,
-                'originallyPublished': published,
+                key: item['value'],
+                'expireSeconds': item.get('expireSeconds'),
+                'originallyPublished': item['originallyPublished'],
             }
         if _Debug:
             print('[DHT NODE] SINGLE     NOT found key in local dataStore')
@@ -1006,7 +1000,9 @@ class Node(object):
         if _Debug:
             print('[DHT NODE]  SINGLE republishData called, node: %r' % self.id)
         expiredKeys = []
-        for key in self._dataStore.keys():
+        # only records to be expired or replicated are read, in one query
+        for itemData in self._dataStore.getItemsToRepublish(int(time.time())):
+            key = itemData['key']
             if _Debug:
                 print('[DHT NODE]  SINGLE    %r' % key)
             # Filter internal variables stored in the datastore
@@ -1014,7 +1010,6 @@ class Node(object):
                 continue
 
             now = int(time.time())
-            itemData = self._dataStore.getItem(key)
             originallyPublished = itemData['originallyPublished']
             originalPublisherID = itemData['originalPublisherID']
             lastPublished = itemData['lastPublished']
@@ -1043,13 +1038,13 @@ class Node(object):
                     twisted.internet.reactor.callFromThread(  # @UndefinedVariable
                         self.iterativeStore,
                         key=key,
-                        value=self._dataStore[key],
+                        value=itemData['value'],
                         originalPublisherID=originalPublisherID,
                         age=age,
                         expireSeconds=expireSeconds,
                     )
-        for key in expiredKeys:
-            del self._dataStore[key]
+        # expired records are removed in a single transaction
+        self._dataStore.removeItems(expiredKeys)
 
 
 class MultiLayerNode(Node):
@@ -1577,21 +1572,15 @@ class MultiLayerNode(Node):
             return []
         if _Debug:
             print('[DHT NODE]    rpcmethod.findValue %r layerID=%r : %r' % (key, layerID, kwargs))
-        if key in self._dataStores[layerID]:
-            exp = None
-            expireSecondsCall = getattr(self._dataStores[layerID], 'expireSeconds')
-            if expireSecondsCall:
-                exp = expireSecondsCall(key)
-            originalPublishTimeCall = getattr(self._dataStores[layerID], 'originalPublishTime')
-            published = None
-            if originalPublishTimeCall:
-                published = originalPublishTimeCall(key)
+        # value and all metadata are fetched at once
+        item = self._dataStores[layerID].getItem(key)
+        if item:
             if _Debug:
-                print('[DHT NODE]        found key in local dataStore %r' % self._dataStores[layerID][key])
+                print('[DHT NODE]        found key in local dataStore %r' % item['value'])
             return {
-                key: self._dataStores[layerID][key],
-                'expireSeconds': exp,
-                'originallyPublished': published,
+                key: item['value'],
+                'expireSeconds': item.get('expireSeconds'),
+                'originallyPublished': item['originallyPublished'],
             }
         if _Debug:
             print('[DHT NODE]        NOT found key in local dataStore')
@@ -1902,7 +1891,9 @@ class MultiLayerNode(Node):
         if _Debug:
             print('[DHT NODE]    republishData called, node: %r' % self.layers[layerID])
         expiredKeys = []
-        for key in self._dataStores[layerID].keys():
+        # only records to be expired or replicated are read, in one query
+        for itemData in self._dataStores[layerID].getItemsToRepublish(int(time.time())):
+            key = itemData['key']
             if _Debug:
                 print('[DHT NODE]        %r' % key)
             # Filter internal variables stored in the datastore
@@ -1910,7 +1901,6 @@ class MultiLayerNode(Node):
                 continue
 
             now = int(time.time())
-            itemData = self._dataStores[layerID].getItem(key)
             originallyPublished = itemData['originallyPublished']
             originalPublisherID = itemData['originalPublisherID']
             lastPublished = itemData['lastPublished']
@@ -1940,14 +1930,14 @@ class MultiLayerNode(Node):
                     twisted.internet.reactor.callFromThread(  # @UndefinedVariable
                         self.iterativeStore,
                         key=key,
-                        value=self._dataStore[key],
+                        value=itemData['value'],
                         originalPublisherID=originalPublisherID,
                         age=age,
                         expireSeconds=expireSeconds,
                         layerID=layerID,
                     )
-        for key in expiredKeys:
-            del self._dataStores[layerID][key]
+        # expired records are removed in a single transaction
+        self._dataStores[layerID].removeItems(expiredKeys)
 
 if __name__ == '__main__':
     import sys
@@ -0,0 +1,68 @@
+import os
+
+from unittest import TestCase
+
+from bitdust.logs import lg
+
+from bitdust.main import settings
+
+from bitdust.system import bpio
+
+from bitdust.storage import accounting
+
+
+class TestAccounting(TestCase):
+
+    def setUp(self):
+        try:
+            bpio.rmdir_recursive('/tmp/.bitdust_test_accounting')
+        except Exception:
+            pass
+        lg.set_debug_level(30)
+        settings.init(base_dir='/tmp/.bitdust_test_accounting')
+        try:
+            os.makedirs('/tmp/.bitdust_test_accounting/default/metadata')
+        except:
+            pass
+        accounting.reset_customers_info()
+
+    def tearDown(self):
+        accounting.reset_customers_info()
+        settings.shutdown()
+        bpio.rmdir_recursive('/tmp/.bitdust_test_accounting')
+
+    def test_customer_usage(self):
+        alice = 'http://127.0.0.1:8084/alice.xml'
+        self.assertTrue(accounting.check_create_customers_quotas(1000))
+        accounting.write_customers_quotas({alice: 300}, 700)
+        self.assertEqual(accounting.get_customer_quota(alice), 300)
+        self.assertIsNone(accounting.get_customer_usage(alice))
+        accounting.increase_customer_usage(alice, 120)
+        accounting.increase_customer_usage(alice, -20)
+        self.assertEqual(accounting.get_customer_usage(alice), 100)
+        self.assertFalse(os.path.isfile(settings.CustomersUsedSpaceFile()))
+        self.assertTrue(accounting.save_customers_usage())
+        self.assertFalse(accounting.save_customers_usage())
+        accounting.reset_customers_info()
+        self.assertEqual(accounting.read_customers_usage(), {b'http://127.0.0.1:8084/alice.xml': '100'})
+        self.assertEqual(accounting.read_customers_quotas(), ({b'http://127.0.0.1:8084/alice.xml': '300'}, 700))
+
+    def test_update_usage_keeps_changes_made_during_scan(self):
+        alice = 'http://127.0.0.1:8084/alice.xml'
+        bob = 'http://127.0.0.1:8084/bob.xml'
+        accounting.increase_customer_usage(alice, 100)
+        accounting.increase_customer_usage(bob, 50)
+        used_space = accounting.start_customers_usage_scan()
+        self.assertEqual(used_space, {b'http://127.0.0.1:8084/alice.xml': '100', b'http://127.0.0.1:8084/bob.xml': '50'})
+        # new file stored and another removed while files on disk were counted
+        accounting.increase_customer_usage(alice, 30)
+        accounting.increase_customer_usage(alice, -10)
+        accounting.increase_customer_usage(bob, 5)
+        self.assertTrue(accounting.update_customers_usage({alice: '90'}))
+        self.assertEqual(accounting.get_customer_usage(alice), 110)
+        self.assertEqual(accounting.get_customer_usage(bob), 55)
+        accounting.increase_customer_usage(alice, 1)
+        self.assertTrue(accounting.update_customers_usage({alice: '90'}))
+        self.assertEqual(accounting.get_customer_usage(alice), 90)
+        accounting.reset_customers_info()
+        self.assertEqual(accounting.read_customers_usage(), {b'http://127.0.0.1:8084/alice.xml': '90', b'http://127.0.0.1:8084/bob.xml': '55'})
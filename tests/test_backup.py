@@ -0,0 +1,154 @@
+from twisted.trial.unittest import TestCase
+from twisted.internet import reactor  # @UnresolvedImport
+from twisted.internet.defer import Deferred, succeed
+
+from bitdust.logs import lg
+
+from bitdust.automats import automat
+
+from bitdust.main import settings
+
+from bitdust.system import bpio
+from bitdust.system import nonblocking
+
+from bitdust.raid import eccmap
+
+from bitdust.storage import backup
+
+
+class _FakePipe(object):
+
+    def __init__(self, data):
+        self.data = data
+        self.killed = False
+
+    def state(self):
+        if self.data and not self.killed:
+            return nonblocking.PIPE_READY2READ
+        return nonblocking.PIPE_CLOSED
+
+    def read_defer(self, size):
+        chunk, self.data = self.data[:size], self.data[size:]
+        return succeed(chunk)
+
+    def kill(self):
+        self.killed = True
+
+
+class _FakeBlock(object):
+
+    def __init__(self, **kwargs):
+        self.BlockNumber = kwargs['BlockNumber']
+        self.Data = kwargs['Data']
+
+    def Serialize(self, binary=False):
+        return self.Data
+
+
+class TestBackupPipeline(TestCase):
+
+    def setUp(self):
+        try:
+            bpio.rmdir_recursive('/tmp/.bitdust_test_backup')
+        except Exception:
+            pass
+        lg.set_debug_level(0)
+        settings.init(base_dir='/tmp/.bitdust_test_backup')
+        self.tasks = []
+        self.cancelled = []
+        self._orig_block = backup.encrypted.Block
+        self._orig_add_task = backup.raid_worker.add_task
+        self._orig_cancel_task = backup.raid_worker.cancel_task
+        backup.encrypted.Block = _FakeBlock
+        backup.raid_worker.add_task = lambda cmd, params, callback: self.tasks.append((cmd, params, callback))
+        backup.raid_worker.cancel_task = lambda cmd, label: self.cancelled.append(label)
+
+    def tearDown(self):
+        backup.encrypted.Block = self._orig_block
+        backup.raid_worker.add_task = self._orig_add_task
+        backup.raid_worker.cancel_task = self._orig_cancel_task
+        settings.shutdown()
+        bpio.rmdir_recursive('/tmp/.bitdust_test_backup')
+
+    def _start_backup(self, data, finished):
+        self.reported = []
+        job = backup.backup(
+            backupID='master$alice@127.0.0.1_8084/1/F1234',
+            pipe=_FakePipe(data),
+            # the machine is destroyed right after the report, so check it in the next reactor iteration
+            finishCallback=lambda backupID, result: reactor.callLater(0, finished.callback, result),  # @UndefinedVariable
+            blockResultCallback=lambda backupID, blockNumber, result: self.reported.append(blockNumber),
+            blockSize=10,
+            keyID='master$alice@127.0.0.1_8084',
+            ecc_map=eccmap.eccmap('ecc/2x2'),
+            creatorIDURL='http://127.0.0.1:8084/alice.xml',
+            maxBlocksInFlight=3,
+        )
+        job.automat('start')
+        return job
+
+    def _deliver(self, tasks):
+        for cmd, params, callback in tasks:
+            callback(cmd, params, ('fake', params[4]))
+
+    def test_blocks_reported_in_order(self):
+        self.assertGreater(settings.getBackupMaxBlocksInFlight(), 1)
+        finished = Deferred()
+        delivered = []
+        job = self._start_backup(b'x' * 75, finished)
+
+        def _deliver_reversed():
+            # RAID results for the blocks in flight are delivered in reverse order
+            if len(self.tasks) >= 2 or (self.tasks and job.isEOF()):
+                pending = list(reversed(self.tasks))
+                del self.tasks[:]
+                delivered.extend(params[4] for _, params, _ in pending)
+                self._deliver(pending)
+            if job.state not in ('DONE', 'ABORTED'):
+                reactor.callLater(0.05, _deliver_reversed)  # @UndefinedVariable
+
+        def _check(result):
+            self.assertEqual(result, 'done')
+            self.assertEqual(job.state, 'DONE')
+            self.assertEqual(self.reported, list(range(8)))
+            self.assertEqual(sorted(delivered), list(range(8)))
+            self.assertNotEqual(delivered, sorted(delivered))
+            self.assertIsNone(job.blocksInFlight)
+            self.assertNotIn(job.index, automat.objects())
+
+        reactor.callLater(0.05, _deliver_reversed)  # @UndefinedVariable
+        finished.addCallback(_check)
+        return finished
+
+    def test_abort_with_blocks_in_flight(self):
+        finished = Deferred()
+        job = self._start_backup(b'x' * 200, finished)
+        late_tasks = []
+
+        def _abort_when_busy():
+            if len(self.tasks) < 2:
+                reactor.callLater(0.05, _abort_when_busy)  # @UndefinedVariable
+                return
+            self.assertEqual(job.state, 'RAID')
+            late_tasks.extend(self.tasks)
+            labels = sorted(job.workBlocks.values())
+            job.abort()
+            self.assertEqual(sorted(self.cancelled), labels)
+
+        def _check(result):
+            self.assertEqual(result, 'abort')
+            self.assertEqual(job.state, 'ABORTED')
+            self.assertIsNone(job.blocksInFlight)
+            self.assertIsNone(job.workBlocks)
+            self.assertNotIn(job.index, automat.objects())
+            self.assertEqual(self.reported, [])
+            # RAID results arriving after the abort must be ignored
+            self._deliver(late_tasks)
+            d = Deferred()
+            reactor.callLater(0.1, d.callback, None)  # @UndefinedVariable
+            d.addCallback(lambda _: self.assertEqual(self.reported, []))
+            return d
+
+        reactor.callLater(0.05, _abort_when_busy)  # @UndefinedVariable
+        finished.addCallback(_check)
+        return finished
@@ -0,0 +1,215 @@
+import tempfile
+
+from unittest import TestCase
+
+from bitdust.logs import lg
+
+from bitdust.main import settings
+
+from bitdust.system import bpio
+
+from bitdust.userid import id_url
+from bitdust.userid import identity
+
+from bitdust.contacts import contactsdb
+
+from bitdust.stream import io_throttle
+
+from bitdust.storage import backup_matrix
+
+_BackupID = 'master$alice@127.0.0.1_8084:1/F1'
+_Customer = 'http://127.0.0.1:8084/alice.xml'
+_Suppliers = ['http://127.0.0.1/bob.xml', 'http://127.0.0.1/carl.xml', 'http://127.0.0.1/dave.xml']
+
+_alice_identity_xml = """<?xml version="1.0" encoding="utf-8"?>
+<identity>
+  <sources>
+    <source>http://127.0.0.1:8084/alice.xml</source>
+  </sources>
+  <contacts>
+    <contact>tcp://127.0.0.1:7103</contact>
+  </contacts>
+  <certificates/>
+  <scrubbers/>
+  <postage>0</postage>
+  <date>Oct 06, 2018</date>
+  <version></version>
+  <revision>0</revision>
+  <publickey>ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQD9mwkrIJqSoDy87avQJM4bSoTaX7jLV0iqHtULShpWRfLQKKazc34023q8nrXsfkV4wAtqxF/j7mceSV5MH4EpMoHG3h8ub0zPeaTDxT6my0l9jNIWOMbdmOzpcLgfIyM4JORgJ29BBN6oH0AsAnXRilXCUmVc5oWixzC/cuRQPhcHZDiuHqKph1Cjs1ra9jRoDD63/BOctPOv+vFC6FueDuS0+/xlTHr14fMbTuAtGmrNgfvOS+6KO16zE8gUUtpKWBA9zesgurAs//Ajp8OO09aWcbVwkn17s8GrUuRDwUmgLFpLH3/OtlxW4oWcI8atzWGOoIhT0eHfBM/FX88h</publickey>
+  <signature>906441963064925827454594808955119786427327091644004203121255573673324339896720684156436969809331302081059171001468697744607176215971850395448358447221987030255681283469602485017439100048818715591137645334649289784704347547476744833593959051239987455656492991690929110057776187651745011046495572223232179906271885029639566994962961751420295596050170876718201976232073313442092469148257068924122205928495395843354406033087633663157320015417942886925426409641297819144861516715728591303834175552581452070473350075769438068777969720417764064190628218036180170101856467748070658740635441921977032005183554438715223073852</signature>
+</identity>"""
+
+
+class TestBackupMatrix(TestCase):
+
+    def test_blocks_matrix_rows(self):
+        m = backup_matrix.BlocksMatrix()
+        m[0] = {'D': [1, 0, -1], 'P': [1, 1, 0]}
+        m[2] = {'D': [0, 1, 1], 'P': [-1, 1, 1]}
+        self.assertEqual(m.keys(), [0, 2])
+        self.assertEqual(len(m), 2)
+        self.assertTrue(0 in m)
+        self.assertFalse(1 in m)
+        self.assertFalse(3 in m)
+        self.assertEqual(m[0], {'D': [1, 0, -1], 'P': [1, 1, 0]})
+        self.assertEqual(m[2]['P'], [-1, 1, 1])
+        m.set(2, 'D', 0, 1)
+        self.assertEqual(m.row(2, 'D'), [1, 1, 1])
+        del m[0]
+        self.assertEqual(m.keys(), [2])
+        self.assertEqual(m.column('D', 0), b'\x00\x00\x01')
+
+    def test_blocks_matrix_expand(self):
+        m = backup_matrix.BlocksMatrix(2)
+        m.add_blocks(2, 2)
+        m.set(1, 'P', 1, -1)
+        m.set(2, 'D', 0, 1)
+        m.set(1, 'D', 3, 1)
+        self.assertEqual(m.suppliers, 4)
+        self.assertEqual(m[1], {'D': [0, 0, 0, 1], 'P': [0, -1, 0, 0]})
+        self.assertEqual(m[2], {'D': [1, 0, 0, 0], 'P': [0, 0, 0, 0]})
+        self.assertEqual(m.unknown(5), b'\x00\x00\x00\x01\x01')
+        self.assertEqual(m.count('D', 0), 1)
+        self.assertEqual(m.count('D', 0, 2), 0)
+
+    def test_clear_supplier(self):
+        m = backup_matrix.BlocksMatrix()
+        m[0] = {'D': [1, 1], 'P': [-1, 1]}
+        m[1] = {'D': [1, 0], 'P': [1, 1]}
+        self.assertEqual(m.clear_supplier(0), 3)
+        self.assertEqual(m[0], {'D': [0, 1], 'P': [-1, 1]})
+        self.assertEqual(m[1], {'D': [0, 0], 'P': [0, 1]})
+        self.assertEqual(m.clear_supplier(5), 0)
+
+    def test_backups_matrix_converts_dicts(self):
+        files = backup_matrix.BackupsMatrix()
+        files['alice@host.com:0/F1'] = {}
+        files['alice@host.com:0/F1'][3] = {'D': [1, 1], 'P': [0, 1]}
+        files['alice@host.com:0/F2'] = {1: {'D': [1], 'P': [1]}}
+        self.assertIsInstance(files['alice@host.com:0/F1'], backup_matrix.BlocksMatrix)
+        self.assertEqual(files['alice@host.com:0/F1'].keys(), [3])
+        self.assertEqual(files['alice@host.com:0/F2'][1], {'D': [1], 'P': [1]})
+
+    def test_split_list_files_revision(self):
+        revision, body = backup_matrix.SplitListFilesRevision('R123 7 5\nQ*\nKmaster\n')
+        self.assertEqual(revision, {'epoch': '123', 'revision': 7, 'since': 5})
+        self.assertEqual(body, 'Q*\nKmaster\n')
+        revision, body = backup_matrix.SplitListFilesRevision('R123 7\nQ*\n')
+        self.assertEqual(revision, {'epoch': '123', 'revision': 7, 'since': None})
+        revision, body = backup_matrix.SplitListFilesRevision('Q*\nKmaster\n')
+        self.assertIsNone(revision)
+        self.assertEqual(body, 'Q*\nKmaster\n')
+
+
+class TestBackupMatrixScan(TestCase):
+
+    def setUp(self):
+        try:
+            bpio.rmdir_recursive('/tmp/.bitdust_test_backup_matrix')
+        except Exception:
+            pass
+        lg.set_debug_level(0)
+        settings.init(base_dir='/tmp/.bitdust_test_backup_matrix')
+        self.history_dir = tempfile.mkdtemp()
+        id_url._IdentityHistoryDir = self.history_dir
+        id_url.init()
+        id_url.identity_cached(identity.identity(xmlsrc=_alice_identity_xml))
+        self.active_array = [1, 1, 1]
+        self.sending = set()
+        self._orig_get_active_array = backup_matrix.GetActiveArray
+        self._orig_has_packet_in_send_queue = io_throttle.HasPacketInSendQueue
+        backup_matrix.GetActiveArray = lambda customer_idurl=None: list(self.active_array)
+        io_throttle.HasPacketInSendQueue = lambda supplier_idurl, packet_id: packet_id in self.sending
+        contactsdb.set_suppliers(_Suppliers, customer_idurl=_Customer)
+        # block 0 was delivered to all suppliers
+        # block 1: Data piece is missing on supplier 1 and no info about Parity piece on supplier 2
+        # block 2: delivered, but some local pieces were already removed
+        # block 3: no remote info yet
+        local = backup_matrix.BlocksMatrix()
+        local[0] = {'D': [1, 1, 1], 'P': [1, 1, 1]}
+        local[1] = {'D': [1, 1, 1], 'P': [1, 1, 1]}
+        local[2] = {'D': [1, 0, 1], 'P': [1, 1, 0]}
+        local[3] = {'D': [1, 1, 1], 'P': [1, 1, 1]}
+        remote = backup_matrix.BlocksMatrix()
+        remote[0] = {'D': [1, 1, 1], 'P': [1, 1, 1]}
+        remote[1] = {'D': [1, -1, 1], 'P': [1, 1, 0]}
+        remote[2] = {'D': [1, 1, 1], 'P': [1, 1, 1]}
+        backup_matrix.local_files()[_BackupID] = local
+        backup_matrix.local_max_block_numbers()[_BackupID] = 3
+        backup_matrix.remote_files()[_BackupID] = remote
+        backup_matrix.remote_max_block_numbers()[_BackupID] = 2
+
+    def tearDown(self):
+        backup_matrix.GetActiveArray = self._orig_get_active_array
+        io_throttle.HasPacketInSendQueue = self._orig_has_packet_in_send_queue
+        backup_matrix.ClearLocalInfo()
+        backup_matrix.ClearRemoteInfo()
+        contactsdb.clear_suppliers(customer_idurl=_Customer)
+        id_url.shutdown()
+        settings.shutdown()
+        bpio.rmdir_recursive('/tmp/.bitdust_test_backup_matrix')
+        bpio.rmdir_recursive(self.history_dir)
+
+    def _packets(self, *items):
+        return [backup_matrix.packetid.MakePacketID(_BackupID, blockNum, supplierNum, dataORparity) for blockNum, supplierNum, dataORparity in items]
+
+    def test_scan_missing_blocks(self):
+        self.assertEqual(backup_matrix.ScanMissingBlocks(_BackupID), [1, 3])
+        # offline suppliers are not taken into account
+        self.active_array = [1, 0, 0]
+        self.assertEqual(backup_matrix.ScanMissingBlocks(_BackupID), [3])
+        # no remote info at all: every block which has at least one local piece for online supplier
+        backup_matrix.EraseBackupRemoteInfo(_BackupID)
+        self.active_array = [0, 1, 0]
+        backup_matrix.local_files()[_BackupID].set(1, 'D', 1, 0)
+        backup_matrix.local_files()[_BackupID].set(1, 'P', 1, 0)
+        self.assertEqual(backup_matrix.ScanMissingBlocks(_BackupID), [0, 2, 3])
+        self.assertEqual(backup_matrix.ScanMissingBlocks('master$alice@127.0.0.1_8084:1/F2'), [])
+
+    def test_scan_blocks_to_send(self):
+        self.assertEqual(backup_matrix.ScanBlocksToSend(_BackupID), {
+            0: set(self._packets((3, 0, 'Data'), (3, 0, 'Parity'))),
+            1: set(self._packets((1, 1, 'Data'), (3, 1, 'Data'), (3, 1, 'Parity'))),
+            2: set(self._packets((1, 2, 'Parity'), (3, 2, 'Data'), (3, 2, 'Parity'))),
+        })
+        self.active_array = [1, 0, 1]
+        self.assertEqual(backup_matrix.ScanBlocksToSend(_BackupID)[1], set())
+
+    def test_scan_blocks_to_send_limit(self):
+        backup_matrix.EraseBackupRemoteInfo(_BackupID)
+        self.active_array = [1, 1, 0]
+        # limit is checked for every supplier on its own: after the block which exceeded the limit scanning stops,
+        # but other suppliers are still getting their pieces from the same blocks
+        self.assertEqual(backup_matrix.ScanBlocksToSend(_BackupID, limit_per_supplier=2), {
+            0: set(self._packets((0, 0, 'Data'), (0, 0, 'Parity'), (1, 0, 'Data'), (1, 0, 'Parity'))),
+            1: set(self._packets((0, 1, 'Data'), (0, 1, 'Parity'), (1, 1, 'Data'), (1, 1, 'Parity'))),
+            2: set(),
+        })
+        self.assertEqual(backup_matrix.ScanBlocksToSend(_BackupID, limit_per_supplier=4)[1], set(self._packets(
+            (0, 1, 'Data'), (0, 1, 'Parity'), (1, 1, 'Data'), (1, 1, 'Parity'), (2, 1, 'Parity'),
+        )))
+        self.assertEqual(len(backup_matrix.ScanBlocksToSend(_BackupID)[0]), 8)
+
+    def test_scan_blocks_to_remove(self):
+        self.assertEqual(backup_matrix.ScanBlocksToRemove(_BackupID), self._packets(
+            (0, 0, 'Data'), (0, 0, 'Parity'), (0, 1, 'Data'), (0, 1, 'Parity'), (0, 2, 'Data'), (0, 2, 'Parity'),
+            (2, 0, 'Data'), (2, 0, 'Parity'), (2, 1, 'Parity'), (2, 2, 'Data'),
+        ))
+        # pieces which are being sent right now must be kept
+        self.sending.update(self._packets((0, 1, 'Parity'), (2, 2, 'Data')))
+        self.assertEqual(backup_matrix.ScanBlocksToRemove(_BackupID), self._packets(
+            (0, 0, 'Data'), (0, 0, 'Parity'), (0, 1, 'Data'), (0, 2, 'Data'), (0, 2, 'Parity'),
+            (2, 0, 'Data'), (2, 0, 'Parity'), (2, 1, 'Parity'),
+        ))
+        backup_matrix.EraseBackupLocalInfo(_BackupID)
+        self.assertEqual(backup_matrix.ScanBlocksToRemove(_BackupID), [])
+
+    def test_get_backup_stats(self):
+        totalNumberOfFiles, maxBlockNum, statsArray = backup_matrix.GetBackupStats(_BackupID)
+        self.assertEqual(totalNumberOfFiles, 16)
+        self.assertEqual(maxBlockNum, 3)
+        self.assertEqual([files for _, files in statsArray], [6, 5, 5])
+        self.assertAlmostEqual(statsArray[0][0], 25.0)
+        self.assertAlmostEqual(statsArray[1][0], 100.0/3*0.5*5/4)
+        self.assertAlmostEqual(statsArray[2][0], 100.0/3*0.5*5/4)
+        self.assertEqual(backup_matrix.GetBackupStats('master$alice@127.0.0.1_8084:1/F2'), (0, 0, [(0, 0), (0, 0), (0, 0)]))
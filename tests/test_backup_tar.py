@@ -0,0 +1,144 @@
+import os
+import io
+import tarfile
+
+from twisted.trial.unittest import TestCase
+from twisted.internet import reactor  # @UnresolvedImport
+from twisted.internet import threads
+from twisted.internet.task import deferLater
+from twisted.internet.defer import DeferredList
+
+from bitdust.system import bpio
+
+from bitdust.storage import backup_tar
+
+
+class TestExtractStream(TestCase):
+
+    def setUp(self):
+        try:
+            bpio.rmdir_recursive('/tmp/.bitdust_test_backup_tar')
+        except Exception:
+            pass
+        os.makedirs('/tmp/.bitdust_test_backup_tar/source/sub')
+        bpio.WriteBinaryFile('/tmp/.bitdust_test_backup_tar/source/a.txt', b'a'*1000)
+        bpio.WriteBinaryFile('/tmp/.bitdust_test_backup_tar/source/sub/b.bin', os.urandom(300000))
+        buf = io.BytesIO()
+        tar = tarfile.open(fileobj=buf, mode='w|bz2')
+        tar.add('/tmp/.bitdust_test_backup_tar/source', arcname='source')
+        tar.close()
+        self.tar_data = buf.getvalue()
+
+    def tearDown(self):
+        bpio.rmdir_recursive('/tmp/.bitdust_test_backup_tar')
+
+    def test_extract_while_writing(self):
+        stream = backup_tar.ExtractLoop(max_buffer_size=10000)
+        d = backup_tar.extracttar_stream_thread(stream, '/tmp/.bitdust_test_backup_tar/output')
+        chunks = [self.tar_data[i:i + 4096] for i in range(0, len(self.tar_data), 4096)]
+
+        def _write_next(_=None):
+            if not chunks:
+                stream.mark_finished()
+                return
+            stream.write(chunks.pop(0))
+            stream.when_writable().addCallback(_write_next)
+
+        def _check(result):
+            self.assertTrue(result)
+            self.assertEqual(stream._bytes_read, len(self.tar_data))
+            for name in ('a.txt', 'sub/b.bin'):
+                self.assertEqual(
+                    bpio.ReadBinaryFile(os.path.join('/tmp/.bitdust_test_backup_tar/output/source', name)),
+                    bpio.ReadBinaryFile(os.path.join('/tmp/.bitdust_test_backup_tar/source', name)),
+                )
+
+        _write_next()
+        return d.addCallback(_check)
+
+    def test_closed_stream(self):
+        stream = backup_tar.ExtractLoop()
+        d = backup_tar.extracttar_stream_thread(stream, '/tmp/.bitdust_test_backup_tar/output')
+        stream.write(self.tar_data[:100])
+        stream.close()
+        return self.assertFailure(d, Exception)
+
+    def test_not_writable_after_close(self):
+        stream = backup_tar.ExtractLoop(max_buffer_size=10)
+        stream.write(b'x'*20)
+        results = []
+        stream.when_writable().addCallback(results.append)
+        self.assertEqual(results, [])
+        stream.close()
+        stream.when_writable().addCallback(results.append)
+        self.assertEqual(results, [False, False])
+
+
+class TestBytesLoop(TestCase):
+
+    def test_partial_reads(self):
+        loop = backup_tar.BytesLoop()
+        for chunk in (b'abc', b'defg', b'hi'):
+            loop.write(chunk)
+
+        def _check(_):
+            self.assertEqual(loop.state(), backup_tar.BYTES_LOOP_READY2READ)
+            self.assertEqual(loop.read(2), b'ab')
+            self.assertEqual(loop.read(4), b'cdef')
+            self.assertEqual(loop.read(1), b'g')
+            self.assertEqual(loop.read(-1), b'hi')
+            self.assertEqual(loop.read(5), b'')
+            self.assertEqual(loop._bytes_read, 9)
+
+        return deferLater(reactor, 0.01, lambda: None).addCallback(_check)
+
+    def test_writer_blocked_at_limit(self):
+        loop = backup_tar.BytesLoop(max_buffer_size=15)
+
+        def _writer():
+            for _ in range(3):
+                loop.write(b'x'*10)
+
+        d = threads.deferToThread(_writer)
+
+        def _check_blocked(_):
+            self.assertFalse(d.called)
+            self.assertEqual(loop._bytes_wrote, 20)
+            self.assertEqual(loop.read(10), b'x'*10)
+            return d
+
+        def _check_done(_):
+            return deferLater(reactor, 0.01, lambda: None).addCallback(lambda _: self.assertEqual(loop.read(), b'x'*20))
+
+        return deferLater(reactor, 0.2, lambda: None).addCallback(_check_blocked).addCallback(_check_done)
+
+    def test_eof_and_close(self):
+        loop = backup_tar.BytesLoop()
+        d1 = loop.read_defer(10)
+
+        def _writer():
+            loop.write(b'abc')
+            loop.mark_finished()
+
+        threads.deferToThread(_writer)
+
+        def _check_data(chunk):
+            self.assertEqual(chunk, b'abc')
+            return loop.read_defer(10)
+
+        def _check_eof(chunk):
+            self.assertEqual(chunk, b'')
+            self.assertTrue(loop._finished)
+            closed = backup_tar.BytesLoop(max_buffer_size=5)
+            d2 = closed.read_defer(10)
+            writer = threads.deferToThread(lambda: [closed.write(b'y'*5) for _ in range(3)])
+            reactor.callLater(0.1, closed.close)  # @UndefinedVariable
+
+            def _check_closed(results):
+                self.assertEqual(results[0][1], b'y'*5)
+                self.assertEqual(closed.state(), backup_tar.BYTES_LOOP_CLOSED)
+                self.assertEqual(closed.read(), b'')
+
+            return DeferredList([d2, writer]).addCallback(_check_closed)
+
+        return d1.addCallback(_check_data).addCallback(_check_eof)
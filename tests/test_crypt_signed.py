@@ -162,3 +162,20 @@ class Test(TestCase):
             raw1 = p1.Serialize()
             p2 = signed.Unserialize(raw1)
             self.assertTrue(p2.Valid())
+
+    def test_hash_parts(self):
+        key.InitMyKey()
+        data1 = os.urandom(1024)
+        p1 = signed.Packet(
+            'Data',
+            my_id.getIDURL(),
+            my_id.getIDURL(),
+            'SomeID',
+            data1,
+            self.bob_ident.getIDURL(),
+        )
+        self.assertEqual(p1.GenerateHash(), key.Hash(p1.GenerateHashBase()))
+        self.assertEqual(len(p1), len(p1.Serialize()))
+        p2 = signed.Unserialize(p1.Serialize())
+        self.assertEqual(p1.GenerateHash(), p2.GenerateHash())
+        self.assertTrue(p2.Valid())
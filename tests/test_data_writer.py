@@ -0,0 +1,157 @@
+import os
+import threading
+
+from twisted.trial.unittest import TestCase
+from twisted.internet import reactor  # @UnresolvedImport
+from twisted.internet import task
+from twisted.internet.defer import DeferredList
+
+from bitdust.logs import lg
+
+from bitdust.main import settings
+
+from bitdust.system import bpio
+
+from bitdust.supplier import data_writer
+
+
+class TestDataWriter(TestCase):
+
+    def setUp(self):
+        try:
+            bpio.rmdir_recursive('/tmp/.bitdust_test_data_writer')
+        except Exception:
+            pass
+        lg.set_debug_level(30)
+        settings.init(base_dir='/tmp/.bitdust_test_data_writer')
+        self.customer_dir = os.path.join(settings.getCustomersFilesDir(), 'alice@host.com', 'master')
+
+    def tearDown(self):
+        data_writer.shutdown()
+        settings.shutdown()
+        bpio.rmdir_recursive('/tmp/.bitdust_test_data_writer')
+
+    def test_write_batches(self):
+        filename1 = os.path.join(self.customer_dir, '0', 'F1', '0-0-Data')
+        filename2 = os.path.join(self.customer_dir, '0', 'F1', '0-0-Parity')
+        filename3 = os.path.join(self.customer_dir, '0', 'F2', '0-0-Data')
+        d1 = data_writer.write(filename1, b'abc')
+        d2 = data_writer.write(filename2, b'12345')
+        d3 = data_writer.write(filename1, b'abcdef')
+        d4 = data_writer.write(filename3, b'000')
+        self.assertEqual(data_writer.discard(os.path.dirname(filename3)), 1)
+
+        def _check(results):
+            self.assertEqual([r[1] for r in results], [(True, 0), (True, 0), (True, 3), (False, 0)])
+            self.assertEqual(bpio.ReadBinaryFile(filename1), b'abcdef')
+            self.assertEqual(bpio.ReadBinaryFile(filename2), b'12345')
+            self.assertFalse(os.path.exists(filename1 + '.new'))
+            self.assertFalse(os.path.exists(filename3))
+
+        return DeferredList([d1, d2, d3, d4]).addCallback(_check)
+
+    def test_remove_temp_files(self):
+        filename1 = os.path.join(self.customer_dir, '0', 'F1', '0-0-Data')
+        filename2 = os.path.join(self.customer_dir, '0', 'F1', '0-1-Data')
+        os.makedirs(os.path.dirname(filename1))
+        bpio.WriteBinaryFile(filename1, b'abc')
+        bpio.WriteBinaryFile(filename1 + '.new', b'ab')
+        bpio.WriteBinaryFile(filename2 + '.new', b'abcd')
+        os.utime(filename1 + '.new', (0, 0))
+        # only temporary files left from the previous session are removed, the most recent are still being written
+        removed = data_writer.remove_temp_files(settings.getCustomersFilesDir(), 1)
+        self.assertEqual(removed, [filename1 + '.new'])
+        self.assertTrue(os.path.isfile(filename1))
+        self.assertTrue(os.path.isfile(filename2 + '.new'))
+
+    def test_on_written_executed_in_thread(self):
+        filename = os.path.join(self.customer_dir, '0', 'F1', '0-0-Data')
+        written = []
+
+        def _on_written(fn, previous_size):
+            written.append((fn, previous_size, bpio.ReadBinaryFile(fn), threading.current_thread() is threading.main_thread()))
+
+        def _fail(fn, previous_size):
+            raise Exception('failed')
+
+        d1 = data_writer.write(filename, b'abc', on_written=_on_written)
+        d2 = data_writer.write(filename, b'abcdef', on_written=_on_written)
+        d3 = data_writer.write(filename + '2', b'xyz', on_written=_fail)
+        d4 = data_writer.write(filename + '3', b'000', on_written=_on_written)
+        data_writer.discard(filename + '3')
+
+        def _check(results):
+            self.assertEqual([r[1] for r in results], [(True, 0), (True, 3), (True, 0), (False, 0)])
+            self.assertEqual(written, [(filename, 0, b'abc', False), (filename, 3, b'abcdef', False)])
+
+        return DeferredList([d1, d2, d3, d4]).addCallback(_check)
+
+    def test_discard_while_written(self):
+        filename1 = os.path.join(self.customer_dir, '0', 'F1', '0-0-Data')
+        filename2 = os.path.join(self.customer_dir, '1', 'F1', '0-0-Data')
+        opening = threading.Event()
+        release = threading.Event()
+        written = []
+        _open_temp_file = data_writer._open_temp_file
+
+        def _slow_open_temp_file(filename):
+            if filename == filename1:
+                opening.set()
+                release.wait(5)
+            return _open_temp_file(filename)
+
+        os.makedirs(os.path.dirname(filename1))
+        data_writer._open_temp_file = _slow_open_temp_file
+        self.addCleanup(setattr, data_writer, '_open_temp_file', _open_temp_file)
+        d1 = data_writer.write(filename1, b'abc', on_written=lambda fn, previous_size: written.append(fn))
+        d2 = data_writer.write(filename2, b'xyz', on_written=lambda fn, previous_size: written.append(fn))
+
+        def _delete():
+            if not opening.is_set():
+                return task.deferLater(reactor, 0.05, _delete)
+            # same as customer_space.on_delete_file() does, while the batch is still being written
+            self.assertEqual(data_writer.discard(os.path.dirname(os.path.dirname(filename1))), 1)
+            bpio._dir_remove(os.path.dirname(os.path.dirname(filename1)))
+            data_writer.forget_dir(os.path.dirname(os.path.dirname(filename1)))
+            release.set()
+            return DeferredList([d1, d2])
+
+        def _check(results):
+            self.assertEqual([r[1] for r in results], [(False, 0), (True, 0)])
+            self.assertFalse(os.path.exists(filename1))
+            self.assertFalse(os.path.exists(filename1 + '.new'))
+            self.assertEqual(written, [filename2])
+            self.assertEqual(data_writer._DiscardedFiles, set())
+
+        return task.deferLater(reactor, 0, _delete).addCallback(_check)
+
+    def test_discard_after_written(self):
+        filename = os.path.join(self.customer_dir, '0', 'F1', '0-0-Data')
+        finished = threading.Event()
+        release = threading.Event()
+        _write_batch = data_writer._write_batch
+
+        def _slow_write_batch(items, fsync):
+            results = _write_batch(items, fsync)
+            finished.set()
+            release.wait(5)
+            return results
+
+        data_writer._write_batch = _slow_write_batch
+        self.addCleanup(setattr, data_writer, '_write_batch', _write_batch)
+        d = data_writer.write(filename, b'abc')
+
+        def _delete():
+            if not finished.is_set():
+                return task.deferLater(reactor, 0.05, _delete)
+            # file is already on disk, but the result was not reported yet
+            self.assertEqual(data_writer.discard(filename), 1)
+            os.remove(filename)
+            release.set()
+            return d
+
+        def _check(result):
+            self.assertEqual(result, (None, 0))
+            self.assertFalse(os.path.exists(filename))
+
+        return task.deferLater(reactor, 0, _delete).addCallback(_check)
@@ -0,0 +1,76 @@
+import os
+import json
+import time
+import sqlite3
+
+from unittest import TestCase
+
+from bitdust_forks.entangled.kademlia import constants
+from bitdust_forks.entangled.kademlia import datastore
+
+
+class TestSQLiteDataStore(TestCase):
+
+    def setUp(self):
+        self.db_path = '/tmp/.bitdust_test_dht_datastore.db'
+        self._cleanup()
+
+    def tearDown(self):
+        self._cleanup()
+
+    def _cleanup(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+
+    def test_set_get_revisions(self):
+        store = datastore.SQLiteVersionedJsonDataStore(dbFile=self.db_path)
+        store.setItem(b'abc', {'a': 1}, 100, 90, b'node1', expireSeconds=60)
+        store.setItem('abc', {'a': 2}, 110, 90, b'node1', expireSeconds=60)
+        store.setItem('def', 'xyz', 120, 120, None, revision=7)
+        self.assertEqual(len(store), 2)
+        self.assertIn(b'abc', store)
+        self.assertNotIn('zzz', store)
+        self.assertEqual(store['abc'], {'a': 2})
+        item = store.getItem('abc')
+        self.assertEqual(item['revision'], 2)
+        self.assertEqual(item['lastPublished'], 110)
+        self.assertEqual(item['expireSeconds'], 60)
+        self.assertEqual(store.getItem('def')['revision'], 7)
+        self.assertIsNone(store.getItem('zzz'))
+        store.close()
+        store = datastore.SQLiteVersionedJsonDataStore(dbFile=self.db_path)
+        self.assertEqual(sorted(store.keys()), ['abc', 'def'])
+        self.assertEqual(store._db.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        store.close()
+
+    def test_republish_and_remove(self):
+        store = datastore.SQLiteVersionedJsonDataStore()
+        now = int(time.time())
+        store.setItem('fresh', 1, now, now, b'node1')
+        store.setItem('replicate', 2, now - constants.replicateInterval, now - 10, b'node1')
+        store.setItem('expired', 3, now, now - constants.dataExpireTimeout, b'node1')
+        self.assertEqual(sorted(i['key'] for i in store.getItemsToRepublish(now)), ['expired', 'replicate'])
+        self.assertEqual(sorted(i['key'] for i in store.getAllItems()), ['expired', 'fresh', 'replicate'])
+        store.removeItems(['expired', 'replicate'])
+        self.assertEqual(store.keys(), ['fresh'])
+
+    def test_migrate_old_schema(self):
+        db = sqlite3.connect(self.db_path)
+        db.execute('CREATE TABLE data(key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision)')
+        for key, value, revision in (('k1', 'a', 1), ('k2', 'b', 1), ('k1', 'c', 3), ('k1', 'd', 2)):
+            db.execute(
+                'INSERT INTO data VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, json.dumps({'k': key, 'd': value, 'v': 1}), 100, 100, 'node1', 60, revision),
+            )
+        db.commit()
+        db.close()
+        store = datastore.SQLiteVersionedJsonDataStore(dbFile=self.db_path)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store['k1'], 'c')
+        self.assertEqual(store.getItem('k1')['revision'], 3)
+        self.assertEqual(store['k2'], 'b')
+        self.assertEqual(store._db.execute('PRAGMA user_version').fetchone()[0], store.SCHEMA_VERSION)
+        store.setItem('k2', 'e', 200, 100, 'node1')
+        self.assertEqual(store.getItem('k2')['revision'], 2)
+        store.close()
@@ -0,0 +1,198 @@
+import os
+import sqlite3
+import threading
+
+from unittest import TestCase
+
+from bitdust.logs import lg
+
+from bitdust.main import bptester
+from bitdust.main import settings
+
+from bitdust.system import bpio
+
+from bitdust.storage import accounting
+
+from bitdust.supplier import files_index
+from bitdust.supplier import list_files
+
+
+class TestFilesIndex(TestCase):
+
+    def setUp(self):
+        try:
+            bpio.rmdir_recursive('/tmp/.bitdust_test_files_index')
+        except Exception:
+            pass
+        lg.set_debug_level(30)
+        settings.init(base_dir='/tmp/.bitdust_test_files_index')
+        try:
+            os.makedirs('/tmp/.bitdust_test_files_index/default/metadata')
+        except:
+            pass
+        self.customer_dir = os.path.join(settings.getCustomersFilesDir(), 'alice@host.com')
+        self.write('master/0/0/F20230101010101AM/0-0-Data', 10)
+        self.write('master/0/0/F20230101010101AM/0-0-Parity', 20)
+        self.write('master/0/0/F20230101010101AM/2-0-Data', 30)
+        self.write('master/0/0/F20230101010101AM/2-1-Parity', 40)
+        self.write('master/.index', 5)
+        self.write('share_abc/1/F20230101010101AM/0-3-Data', 7)
+        files_index.init()
+
+    def tearDown(self):
+        list_files.journal_erase('http://host.com/alice.xml')
+        files_index.shutdown()
+        settings.shutdown()
+        bpio.rmdir_recursive('/tmp/.bitdust_test_files_index')
+
+    def write(self, path, size):
+        filename = os.path.join(self.customer_dir, *path.split('/'))
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        bpio.WriteBinaryFile(filename, b'x'*size)
+        return filename
+
+    def test_rebuild_and_summary(self):
+        self.assertFalse(files_index.is_ready())
+        self.assertEqual(files_index.rebuild(), 6)
+        self.assertTrue(files_index.is_ready())
+        self.assertEqual(files_index.customer_used_space('alice@host.com'), 112)
+        for key_alias in ('master', 'share_abc'):
+            tree = list_files.TreeSummary(os.path.join(self.customer_dir, key_alias), key_alias)
+            index = list_files.IndexSummary('alice@host.com', key_alias)
+            self.assertEqual(index.split('\n')[0], 'K%s' % key_alias)
+            self.assertEqual(sorted(index.split('\n')), sorted(tree.split('\n')))
+
+    def test_temp_files_ignored(self):
+        # temporary file of a write which was interrupted or is still in progress
+        self.write('master/0/0/F20230101010101AM/0-1-Data.new', 50)
+        self.assertEqual(files_index.rebuild(), 6)
+        self.assertEqual(files_index.customer_used_space('alice@host.com'), 112)
+        tree = list_files.TreeSummary(os.path.join(self.customer_dir, 'master'), 'master')
+        self.assertNotIn('.new', tree)
+        self.assertEqual(sorted(list_files.IndexSummary('alice@host.com', 'master').split('\n')), sorted(tree.split('\n')))
+
+    def test_add_and_remove(self):
+        files_index.rebuild()
+        filename = self.write('master/0/1/F20230101010101AM/0-0-Data', 3)
+        self.assertTrue(files_index.add_file(filename))
+        self.assertEqual(files_index.oldest_files('alice@host.com', limit=7)[-1], ('master', '0/1/F20230101010101AM/0-0-Data', 3))
+        self.assertEqual(files_index.customer_used_space('alice@host.com'), 115)
+        self.assertEqual(files_index.remove_path(os.path.join(self.customer_dir, 'master', '0', '0')), 4)
+        self.assertEqual(files_index.remove_path(os.path.join(self.customer_dir, 'master', '0', '1', 'F20230101010101AM', '0-0-Data')), 1)
+        self.assertEqual(files_index.customer_used_space('alice@host.com'), 12)
+        files_index.rename_customer('alice@host.com', 'alice@otherhost.com')
+        self.assertEqual(files_index.customer_used_space('alice@host.com'), 0)
+        self.assertEqual(len(files_index.customer_files('alice@otherhost.com', 'share_abc')), 1)
+        self.assertEqual(files_index.remove_path(os.path.join(settings.getCustomersFilesDir(), 'alice@otherhost.com')), 2)
+
+    def test_validated(self):
+        filename = os.path.join(self.customer_dir, 'master', '.index')
+        self.assertFalse(files_index.is_validated(filename, 100.0, 5))
+        self.assertEqual(files_index.set_validated([(filename, 100.0, 5)]), 1)
+        self.assertTrue(files_index.is_validated(filename, 100.0, 5))
+        self.assertFalse(files_index.is_validated(filename, 101.0, 5))
+        files_index.remove_path(os.path.join(self.customer_dir, 'master'))
+        self.assertFalse(files_index.is_validated(filename, 100.0, 5))
+
+    def _removed_since(self, epoch, since):
+        changes = list_files.journal_changes('http://host.com/alice.xml', epoch, since)
+        self.assertIsNotNone(changes)
+        self.assertTrue(all(c[1] == '-' for c in changes))
+        return sorted('%s/%s' % (c[2], c[3]) for c in changes)
+
+    def test_bptester_validate_removals_journal(self):
+        files_index.rebuild()
+        j = list_files.journal('http://host.com/alice.xml')
+        epoch, since = j['epoch'], j['revision']
+        self.assertTrue(bptester.Validate())
+        self.assertFalse(os.path.exists(os.path.join(self.customer_dir, 'master', '0', '0', 'F20230101010101AM', '0-0-Data')))
+        self.assertEqual(self._removed_since(epoch, since), [
+            'master/.index',
+            'master/0/0/F20230101010101AM/0-0-Data',
+            'master/0/0/F20230101010101AM/0-0-Parity',
+            'master/0/0/F20230101010101AM/2-0-Data',
+            'master/0/0/F20230101010101AM/2-1-Parity',
+            'share_abc/1/F20230101010101AM/0-3-Data',
+        ])
+        summary = list_files.ChangesSummary(list_files.journal_changes('http://host.com/alice.xml', epoch, since), 'master')
+        self.assertIn('-0/0/F20230101010101AM/0-0-Data', summary.split('\n'))
+        self.assertIn('-1/F20230101010101AM/0-3-Data', summary.split('\n'))
+
+    def test_bptester_space_time_removals_journal(self):
+        files_index.rebuild()
+        accounting.write_customers_quotas({'http://host.com/alice.xml': '50'}, 0)
+        j = list_files.journal('http://host.com/alice.xml')
+        epoch, since = j['epoch'], j['revision']
+        try:
+            self.assertTrue(bptester.SpaceTime())
+        finally:
+            accounting.shutdown()
+        removed = self._removed_since(epoch, since)
+        self.assertTrue(removed)
+        for key_alias_path in removed:
+            self.assertFalse(os.path.exists(os.path.join(self.customer_dir, *key_alias_path.split('/'))))
+        self.assertLess(files_index.customer_used_space('alice@host.com'), 50)
+
+    def test_shutdown_closes_all_connections(self):
+        opened = threading.Event()
+        closed = threading.Event()
+        errors = []
+
+        def _thread():
+            conn = files_index.db()
+            opened.set()
+            closed.wait(5)
+            try:
+                conn.execute('SELECT 1')
+            except sqlite3.ProgrammingError as exc:
+                errors.append(exc)
+
+        t = threading.Thread(target=_thread)
+        t.start()
+        opened.wait(5)
+        conn = files_index.db()
+        files_index.shutdown()
+        closed.set()
+        t.join()
+        self.assertRaises(sqlite3.ProgrammingError, conn.execute, 'SELECT 1')
+        self.assertEqual(len(errors), 1)
+        files_index.init()
+
+    def test_rebuild_does_not_lose_concurrent_changes(self):
+        files_index.rebuild()
+        walked = threading.Event()
+        release = threading.Event()
+        depth = []
+        traverse_dir_recursive = bpio.traverse_dir_recursive
+
+        def _slow_traverse(*args, **kwargs):
+            # also called recursively for every sub folder
+            top = not walked.is_set() and not depth
+            depth.append(1)
+            ret = traverse_dir_recursive(*args, **kwargs)
+            if top:
+                walked.set()
+                release.wait(5)
+            return ret
+
+        bpio.traverse_dir_recursive = _slow_traverse
+        try:
+            t = threading.Thread(target=files_index.rebuild)
+            t.start()
+            walked.wait(5)
+            # file was already found on disk by rebuild() and now it is removed, another file is added after the walk
+            filename = os.path.join(self.customer_dir, 'master', '.index')
+            os.remove(filename)
+            self.assertEqual(files_index.remove_path(filename), 1)
+            self.assertTrue(files_index.add_file(self.write('master/0/1/F20230101010101AM/0-0-Data', 3)))
+            # writers are not blocked while the customers folder is being walked
+            self.assertTrue(t.is_alive())
+            release.set()
+            t.join()
+        finally:
+            release.set()
+            bpio.traverse_dir_recursive = traverse_dir_recursive
+        self.assertTrue(files_index.is_ready())
+        self.assertEqual(files_index.customer_used_space('alice@host.com'), 110)
+        self.assertNotIn(('master', '.index', 5), files_index.oldest_files('alice@host.com', limit=10))
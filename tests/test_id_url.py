@@ -1,4 +1,5 @@
 import os
+import copy
 import tempfile
 import unittest
 from unittest import TestCase
@@ -673,6 +674,72 @@ class TestIDURL(TestCase):
         self.assertEqual(id_url.field(hans2).original(), strng.to_bin(hans2))
         self.assertEqual(id_url.field(hans3).original(), strng.to_bin(hans3))
 
+    def test_snapshot(self):
+        self._cache_identity('alice')
+        self._cache_identity('bob')
+        self._cache_identity('hans1')
+        self._cache_identity('hans2')
+        self._cache_identity('hans3')
+        history_dir = id_url._IdentityHistoryDir
+        maps = copy.deepcopy((id_url.users(), id_url.known(), id_url.merged(), id_url.sources(), id_url.unique_names()))
+        id_url.shutdown()
+        id_url._IdentityHistoryDir = history_dir
+        self.assertTrue(id_url.load_snapshot())
+        self.assertEqual((id_url.users(), id_url.known(), id_url.merged(), id_url.sources(), id_url.unique_names()), maps)
+        id_url.shutdown()
+        id_url._IdentityHistoryDir = history_dir
+        id_url.init()
+        self.assertEqual((id_url.users(), id_url.known(), id_url.merged(), id_url.sources(), id_url.unique_names()), maps)
+        self.assertEqual(id_url.field(hans1).to_text(), hans3)
+        id_url.shutdown()
+        # any change in the history folder makes the snapshot outdated
+        alice_dir = [d for d in os.listdir(history_dir) if d.startswith('alice@')][0]
+        with open(os.path.join(history_dir, alice_dir, '0'), 'a') as f:
+            f.write('\n')
+        id_url._IdentityHistoryDir = history_dir
+        self.assertFalse(id_url.load_snapshot())
+        id_url.init()
+        self.assertEqual((id_url.users(), id_url.known(), id_url.merged(), id_url.sources(), id_url.unique_names()), maps)
+        id_url.shutdown()
+        id_url._IdentityHistoryDir = history_dir
+        self.assertTrue(id_url.load_snapshot())
+
+    def test_snapshot_saved_once(self):
+        saved = []
+        scheduled = []
+        original_save_snapshot = id_url.save_snapshot
+        original_schedule_save_snapshot = id_url._schedule_save_snapshot
+
+        def _save_snapshot():
+            saved.append(1)
+            return original_save_snapshot()
+
+        def _schedule_save_snapshot():
+            scheduled.append(1)
+            return original_schedule_save_snapshot()
+
+        id_url.save_snapshot = _save_snapshot
+        id_url._schedule_save_snapshot = _schedule_save_snapshot
+        try:
+            alice = self._cache_identity('alice')
+            self._cache_identity('bob')
+            self.assertEqual(len(scheduled), 2)
+            # same identity cached again does not change anything
+            id_url.identity_cached(alice)
+            self.assertEqual(len(scheduled), 2)
+            # reactor is not running, the snapshot is only marked as outdated
+            self.assertEqual(saved, [])
+            self.assertTrue(id_url._SnapshotDirty)
+            history_dir = id_url._IdentityHistoryDir
+            id_url.shutdown()
+            self.assertEqual(saved, [1])
+            self.assertFalse(id_url._SnapshotDirty)
+            id_url._IdentityHistoryDir = history_dir
+            self.assertTrue(id_url.load_snapshot())
+        finally:
+            id_url.save_snapshot = original_save_snapshot
+            id_url._schedule_save_snapshot = original_schedule_save_snapshot
+
 
 if __name__ == '__main__':
     unittest.main()
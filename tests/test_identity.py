@@ -101,3 +101,23 @@ class Test(TestCase):
         broken_identity = identity.identity(xmlsrc=_broken_identity_xml)
         self.assertTrue(broken_identity.isCorrect())
         self.assertFalse(broken_identity.Valid())
+
+    def test_identity_verified_memo(self):
+        from bitdust.userid import identity
+        from bitdust.userid import id_verified
+        id_verified.shutdown()
+        id_verified.init()
+        try:
+            self.assertTrue(identity.identity(xmlsrc=_some_identity_xml).Valid())
+            self.assertFalse(identity.identity(xmlsrc=_some_identity_xml.replace('alice', 'bob')).Valid())
+            self.assertEqual(id_verified.info()['records'], 1)
+            self.assertEqual(id_verified.info()['hits'], 0)
+            id_verified.shutdown()
+            id_verified.init()
+            self.assertEqual(id_verified.info()['records'], 1)
+            self.assertTrue(identity.identity(xmlsrc=_some_identity_xml).Valid())
+            self.assertEqual(id_verified.info()['hits'], 1)
+            self.assertFalse(identity.identity(xmlsrc=_some_identity_xml.replace('<revision>0', '<revision>1')).Valid())
+            self.assertEqual(id_verified.info()['records'], 1)
+        finally:
+            id_verified.shutdown()
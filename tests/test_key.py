@@ -0,0 +1,28 @@
+from unittest import TestCase
+
+from bitdust.crypt import rsa_key
+from bitdust.crypt import key
+
+
+class TestPublicKeysCache(TestCase):
+
+    def setUp(self):
+        key.ClearPublicKeysCache()
+
+    def tearDown(self):
+        key.ClearPublicKeysCache()
+
+    def test_verify_signature_cached(self):
+        msg = b'1234567890ABCDEFGH'
+        k1 = rsa_key.RSAKey()
+        k1.generate(1024)
+        sig = k1.sign(msg)
+        pubkey = k1.toPublicString()
+        self.assertTrue(key.VerifySignature(pubkey, msg, sig))
+        self.assertTrue(key.VerifySignature(pubkey, msg, sig))
+        self.assertFalse(key.VerifySignature(pubkey, msg + b'X', sig))
+        info = key.PublicKeysCacheInfo()
+        self.assertEqual(info['size'], 1)
+        self.assertEqual(info['misses'], 1)
+        self.assertEqual(info['hits'], 2)
+        self.assertIs(key.PublicKeyObject(pubkey), key.PublicKeyObject(pubkey.encode()))
@@ -0,0 +1,310 @@
+import tempfile
+
+from unittest import TestCase
+
+from bitdust.logs import lg
+
+from bitdust.main import settings
+from bitdust.main import events
+
+from bitdust.system import bpio
+
+from bitdust.userid import id_url
+from bitdust.userid import identity
+from bitdust.userid import my_id
+
+from bitdust.transport import packet_out
+
+alice = 'http://127.0.0.1:8084/alice.xml'
+bob = 'http://127.0.0.1/bob.xml'
+carl = 'http://127.0.0.1/carl.xml'
+hans1 = 'http://first.com/hans.xml'
+hans2 = 'http://second.net/hans.xml'
+hans3 = 'http://third.org/hans.xml'
+
+_bob_identity_xml = """<?xml version="1.0" encoding="utf-8"?>
+<identity>
+  <sources>
+    <source>http://127.0.0.1/bob.xml</source>
+  </sources>
+  <contacts>
+    <contact>tcp://:7592</contact>
+  </contacts>
+  <certificates/>
+  <scrubbers/>
+  <postage>1</postage>
+  <date>May 29, 2019</date>
+  <version></version>
+  <revision>0</revision>
+  <publickey>ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQCewFs0xQAgdUXI0tzgWco6I4m47UCwvQTXs0fwF3gH+x+iAgx2RgTvjFpURyZPK45IrfF1kWvAE66ztzy2j+6hhHBXw58M3mj8zquDEKa+4mZFZdUtYRm6mNR7CfC9Nbot6wV52bHxsiLUxQvbBnc57lY/eMErXZSbUJjTjryCfVn7t5RS5aALQBfIVMfNMaVCJ3e5Rye0dhR6T9ZFjrLkReuo0okpCvoZZOkDIP1jLCjcOTv8uLUv+drqf8NIrZIj4pEF8rdRNujaocfiNThgkCBdmIhVrgkfIdK3vWM6QhJ3kZtulth1tDV5BK8/lfFZaPxfFGweR1/Gg9QDpOD9</publickey>
+  <signature>2555721207758289999127178087506098515147593088396681387272515731590789858885100168022894000811640385932332602114921724686816736386919493342116388342389202634533573440585853004416336080009871348355034060900570108740776929249059366125313043773781172121438059275318503578278037211137723742166236250810224379701898784507989109650122280574248889624793623753363750956166337580150155645791129345184984075393339236370769934887288067282063889985832781680930818596333533250385870238328128795908788457961092966872255919485411937392364346156912286424098295431775553440859616188700512071957957128388244692261317739667793487752010</signature>
+</identity>"""
+
+_hans1_identity_xml = """<?xml version="1.0" encoding="utf-8"?>
+<identity>
+  <sources>
+    <source>http://first.com/hans.xml</source>
+    <source>http://second.net/hans.xml</source>
+  </sources>
+  <contacts>
+    <contact>tcp://127.0.0.1:7457</contact>
+  </contacts>
+  <certificates/>
+  <scrubbers/>
+  <postage>1</postage>
+  <date>Jul 01, 2019</date>
+  <version></version>
+  <revision>0</revision>
+  <publickey>ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQCiMX5AjFoK+B8bEts97OEKkJmONy8wDVSTe4Sx356p1fd48UQHq0g3xphfEWqZNVEvvXyVT3ToJZpsn6ZXALR6awp1EosV0Y3eCRn3HJ7VFifsObEBaJlbIpPWO3a44yQuNmB18dpAZsOYF0fuv9O9JZF/r2aS3DwJKKvrb1raPtuOkmLvMFOyFzQ4CzbpzOhxfLyk4VyyqWtxgRWa3cLJRC1s8pZP+Eeujz9lUXJOBJkz458myjcNogZ60HqMWPmNEQxKQKxKz5s1KhTzEa13AbK3mfBz6GYRSUE4PgzPNGt3ggKjm109MCECVLJ20i41l1x0LQogH4io0zN1KGFJ</publickey>
+  <signature>13068553383637753085388545974152093609980484012770452572120600195304903547295645115743544723314736720580808645983593697230309177682054712275065288665744892926477896400614384619512508972942866186572904043048207845632626832350683561290105271937200406689170558357079802162498698787054408426873656285478048378799191423141745937328344899208835186975874729426520455853791306586430419171014111851754881354985456443997095404651969419163775186405638979606072817375092764901667492456855939205354792829575562245938026302306124652445463109637611383925691836897970969979043999831425972117577943735372131767450971245110225874441582</signature>
+</identity>"""
+
+_hans2_identity_xml = """<?xml version="1.0" encoding="utf-8"?>
+<identity>
+  <sources>
+    <source>http://second.net/hans.xml</source>
+    <source>http://third.org/hans.xml</source>
+  </sources>
+  <contacts>
+    <contact>tcp://127.0.0.1:7457</contact>
+  </contacts>
+  <certificates/>
+  <scrubbers/>
+  <postage>1</postage>
+  <date>Jul 01, 2019</date>
+  <version></version>
+  <revision>1</revision>
+  <publickey>ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQCiMX5AjFoK+B8bEts97OEKkJmONy8wDVSTe4Sx356p1fd48UQHq0g3xphfEWqZNVEvvXyVT3ToJZpsn6ZXALR6awp1EosV0Y3eCRn3HJ7VFifsObEBaJlbIpPWO3a44yQuNmB18dpAZsOYF0fuv9O9JZF/r2aS3DwJKKvrb1raPtuOkmLvMFOyFzQ4CzbpzOhxfLyk4VyyqWtxgRWa3cLJRC1s8pZP+Eeujz9lUXJOBJkz458myjcNogZ60HqMWPmNEQxKQKxKz5s1KhTzEa13AbK3mfBz6GYRSUE4PgzPNGt3ggKjm109MCECVLJ20i41l1x0LQogH4io0zN1KGFJ</publickey>
+  <signature>9964338615595898119523219160985389694716834455244251121310208348749311239026480163448985744966067564091031002898262983039746088711129723160991957466541609144298294968214985017280673670405176798626865604720543551314153138295619813468551357860935622955238006750497782286078815952649485259190562480676412057686853832517927221963473242813486514373660489478033158129265672776156687967394550999847921296632829991543789469343181140623972591265599094214576144469741220772769413300453153162888368211327094417654762184709016011327148922218562411856167502006839171679742071717903072564535777785105712764567873880374805969385183</signature>
+</identity>"""
+
+_hans3_identity_xml = """<?xml version="1.0" encoding="utf-8"?>
+<identity>
+  <sources>
+    <source>http://third.org/hans.xml</source>
+  </sources>
+  <contacts>
+    <contact>tcp://127.0.0.1:7457</contact>
+  </contacts>
+  <certificates/>
+  <scrubbers/>
+  <postage>1</postage>
+  <date>Jul 01, 2019</date>
+  <version></version>
+  <revision>2</revision>
+  <publickey>ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQCiMX5AjFoK+B8bEts97OEKkJmONy8wDVSTe4Sx356p1fd48UQHq0g3xphfEWqZNVEvvXyVT3ToJZpsn6ZXALR6awp1EosV0Y3eCRn3HJ7VFifsObEBaJlbIpPWO3a44yQuNmB18dpAZsOYF0fuv9O9JZF/r2aS3DwJKKvrb1raPtuOkmLvMFOyFzQ4CzbpzOhxfLyk4VyyqWtxgRWa3cLJRC1s8pZP+Eeujz9lUXJOBJkz458myjcNogZ60HqMWPmNEQxKQKxKz5s1KhTzEa13AbK3mfBz6GYRSUE4PgzPNGt3ggKjm109MCECVLJ20i41l1x0LQogH4io0zN1KGFJ</publickey>
+  <signature>11958004301656338144383334445736600827209441963611815598420603918822211142526966075720891212808194909550288382243052852622156637099050410373511336910133303791008042473718309984723895304895629463705900053550743363551114431658248065643054664707971189331530190824121429353343469077985523096241437248019113197103461636847516945163199302563987603148811708018950051799390582546914509552932256650563055856190431745640579914653327517317125317899208768049182599520431852111466415308484761163553541804212696743391960660588998008501810208556514930557535867983962893715967502497080388797303899102334976976072133672653305360264021</signature>
+</identity>"""
+
+
+class _FakePacket(object):
+
+    def __init__(self, Command, PacketID, OwnerID, CreatorID, RemoteID):
+        self.Command = Command
+        self.PacketID = PacketID
+        self.OwnerID = id_url.field(OwnerID)
+        self.CreatorID = id_url.field(CreatorID)
+        self.RemoteID = id_url.field(RemoteID)
+        self.Payload = b''
+        self.Packets = []
+
+
+class TestOutboxIndexes(TestCase):
+
+    def setUp(self):
+        try:
+            bpio.rmdir_recursive('/tmp/.bitdust_test_packet_out')
+        except Exception:
+            pass
+        lg.set_debug_level(0)
+        settings.init(base_dir='/tmp/.bitdust_test_packet_out')
+        self._orig_get_idurl = my_id.getIDURL
+        my_id.getIDURL = lambda: id_url.field(alice)
+
+    def tearDown(self):
+        for p in list(packet_out.queue()):
+            p.doDestroyMe()
+        # also drops cached global IDs of my own identity
+        packet_out.shutdown()
+        my_id.getIDURL = self._orig_get_idurl
+        settings.shutdown()
+        bpio.rmdir_recursive('/tmp/.bitdust_test_packet_out')
+
+    def _queue_packet(self, packet_id, remote_idurl, command='Data'):
+        # same as packet_out.create(), but the state machine is not started
+        outpacket = _FakePacket(command, packet_id, alice, alice, remote_idurl)
+        p = packet_out.PacketOut(outpacket, wide=False, callbacks={})
+        packet_out.queue().append(p)
+        packet_out.index_add(p)
+        p.doInit()
+        return p
+
+    def _register_item(self, p, filename, transfer_id):
+        p.filename = filename
+        packet_out.index_filename(p)
+        p.items.append(packet_out.WorkItem('tcp', '127.0.0.1:7000'))
+        p.state = 'IN_QUEUE'
+        p.event('register-item', ('tcp', '127.0.0.1:7000', None, transfer_id))
+        self.assertEqual(p.state, 'SENDING')
+
+    def _check_indexes(self):
+        # every index must always match with what can be found by scanning the whole queue
+        by_packet_id = {}
+        by_normalized_packet_id = {}
+        by_remote_idurl = {}
+        by_filename = {}
+        by_transfer_id = {}
+        for p in packet_out.queue():
+            by_packet_id.setdefault(p.outpacket.PacketID.lower(), []).append(p)
+            by_normalized_packet_id.setdefault(packet_out.normalize_packet_id(p.outpacket.PacketID), []).append(p)
+            by_remote_idurl.setdefault(p.remote_idurl_bin, []).append(p)
+            if p.filename:
+                by_filename[p.filename] = p
+            for transfer_id in p.transfer_ids:
+                by_transfer_id.setdefault(transfer_id, []).append(p)
+        self.assertEqual(packet_out._OutboxByPacketID, by_packet_id)
+        self.assertEqual(packet_out._OutboxByNormalizedPacketID, by_normalized_packet_id)
+        self.assertEqual(packet_out._OutboxByRemoteIDURL, by_remote_idurl)
+        self.assertEqual(packet_out._OutboxByFilename, by_filename)
+        self.assertEqual(packet_out._OutboxByTransferID, by_transfer_id)
+
+    def test_queue_destroy_cancel(self):
+        p1 = self._queue_packet('master$alice@127.0.0.1_8084:1/F1/0-Data', bob)
+        p2 = self._queue_packet('master$alice@127.0.0.1_8084:1/F1/0-Parity', bob)
+        p3 = self._queue_packet('master$alice@127.0.0.1_8084:1/F1/0-Data', carl)
+        self._check_indexes()
+        self._register_item(p1, '/tmp/out_1.out', 101)
+        self._register_item(p2, '/tmp/out_2.out', 102)
+        self._register_item(p3, '/tmp/out_3.out', 103)
+        self._check_indexes()
+        self.assertEqual(packet_out.search('tcp', '127.0.0.1:7000', '/tmp/out_2.out')[0], p2)
+        self.assertEqual(packet_out.search_by_transfer_id(103)[0], p3)
+        self.assertEqual([p for p, _ in packet_out.search_many(remote_idurl=bob)], [p1, p2])
+        self.assertEqual([p for p, _ in packet_out.search_many(packet_id='master$alice@127.0.0.1_8084:1/F1/0-Data')], [p1, p3])
+
+        p1.automat('cancel', fast=True)
+        self.assertEqual(p1.state, 'CANCEL')
+        self.assertNotIn(p1, packet_out.queue())
+        self._check_indexes()
+        self.assertEqual(packet_out.search('tcp', '127.0.0.1:7000', '/tmp/out_1.out'), (None, None))
+        self.assertEqual(packet_out.search_by_transfer_id(101), (None, None))
+        self.assertEqual([p for p, _ in packet_out.search_many(remote_idurl=bob)], [p2])
+        self.assertEqual(packet_out.search_by_packet_id('master$alice@127.0.0.1_8084:1/F1/0-Data'), [p3])
+
+        p2.doDestroyMe()
+        self._check_indexes()
+        self.assertEqual(packet_out.search_many(remote_idurl=bob), [])
+        self.assertEqual(packet_out.search_by_transfer_id(102), (None, None))
+
+        p3.doDestroyMe()
+        self._check_indexes()
+        self.assertEqual(packet_out.queue(), [])
+        self.assertEqual(packet_out._OutboxByPacketID, {})
+        self.assertEqual(packet_out._OutboxByFilename, {})
+        self.assertEqual(packet_out._OutboxByTransferID, {})
+        self.assertEqual(packet_out._OutboxByRemoteIDURL, {})
+        self.assertEqual(packet_out._OutboxByNormalizedPacketID, {})
+
+    def test_search_by_packet_id_exact_match(self):
+        p1 = self._queue_packet('master$alice@127.0.0.1_8084:1/F1/0-Data', bob)
+        p2 = self._queue_packet('master$alice@127.0.0.1_8084:1/F1/10-Data', bob)
+        self.assertEqual(packet_out.search_by_packet_id('master$alice@127.0.0.1_8084:1/F1/0-Data'), [p1])
+        self.assertEqual(packet_out.search_by_packet_id('MASTER$alice@127.0.0.1_8084:1/F1/10-Data'), [p2])
+        # only whole packet ID is matching, a part of it is not enough anymore
+        self.assertEqual(packet_out.search_by_packet_id('1/F1/0-Data'), [])
+        self.assertEqual(packet_out.search_by_packet_id('master$alice@127.0.0.1_8084:1/F1'), [])
+        self.assertEqual(packet_out.search_by_packet_id('master$alice@127.0.0.1_8084:1/F1/0-Data/'), [])
+
+
+class TestRotatedCustomers(TestCase):
+
+    def setUp(self):
+        try:
+            bpio.rmdir_recursive('/tmp/.bitdust_test_packet_out')
+        except Exception:
+            pass
+        lg.set_debug_level(0)
+        settings.init(base_dir='/tmp/.bitdust_test_packet_out')
+        self.history_dir = tempfile.mkdtemp()
+        id_url._IdentityHistoryDir = self.history_dir
+        id_url.init()
+        for xmlsrc in (_bob_identity_xml, _hans1_identity_xml, _hans2_identity_xml):
+            self._cache_identity(xmlsrc)
+        self._orig_get_idurl = my_id.getIDURL
+        # my own identity was already rotated once: from first.com to second.net
+        my_id.getIDURL = lambda: id_url.field(hans2)
+        packet_out.init()
+
+    def tearDown(self):
+        for p in list(packet_out.queue()):
+            p.doDestroyMe()
+        packet_out.shutdown()
+        my_id.getIDURL = self._orig_get_idurl
+        id_url.shutdown()
+        settings.shutdown()
+        bpio.rmdir_recursive('/tmp/.bitdust_test_packet_out')
+        bpio.rmdir_recursive(self.history_dir)
+
+    def _cache_identity(self, xmlsrc):
+        some_identity = identity.identity(xmlsrc=xmlsrc)
+        self.assertTrue(some_identity.isCorrect())
+        self.assertTrue(some_identity.Valid())
+        id_url.identity_cached(some_identity)
+
+    def _queue_packet(self, packet_id, command='Retrieve'):
+        outpacket = _FakePacket(command, packet_id, hans2, hans2, bob)
+        p = packet_out.PacketOut(outpacket, wide=False, callbacks={})
+        packet_out.queue().append(p)
+        packet_out.index_add(p)
+        p.doInit()
+        return p
+
+    def _search_response(self, packet_id, my_old_idurl):
+        # Data() packet returned by supplier who still knows me by one of my older IDURLs
+        return packet_out.search_by_response_packet(
+            incoming_command='Data',
+            incoming_packet_id=packet_id,
+            incoming_owner_idurl=id_url.field(my_old_idurl),
+            incoming_creator_idurl=id_url.field(bob),
+            incoming_remote_idurl=id_url.field(my_old_idurl),
+        )
+
+    def test_rotated_idurl_response(self):
+        p = self._queue_packet('master$hans@second.net:0/0/1/0/F20/0-1-Data')
+        self.assertEqual(self._search_response('master$hans@first.com:0/0/1/0/F20/0-1-Data', hans1), [p])
+        self.assertEqual(self._search_response('master$hans@second.net:0/0/1/0/F20/0-1-Data', hans1), [p])
+        self.assertEqual(self._search_response('master$hans@first.com:0/0/1/0/F20/1-1-Data', hans1), [])
+        self.assertEqual(self._search_response('master$hans@another.com:0/0/1/0/F20/0-1-Data', hans1), [])
+
+    def test_default_key_alias(self):
+        self.assertEqual(packet_out.normalize_packet_id('hans@first.com:0/0/1/0/F20/0-1-Data'), 'master$hans@second.net:0/0/1/0/f20/0-1-data')
+        self.assertEqual(packet_out.normalize_packet_id('master$hans@second.net:0/0/1/0/F20/0-1-Data'), 'master$hans@second.net:0/0/1/0/f20/0-1-data')
+        self.assertEqual(packet_out.normalize_packet_id('share_abc$hans@first.com:0/0/1/0/F20/0-1-Data'), 'share_abc$hans@second.net:0/0/1/0/f20/0-1-data')
+        # packet IDs of other customers are only lowercased
+        self.assertEqual(packet_out.normalize_packet_id('bob@127.0.0.1:0/0/1/0/F20/0-1-Data'), 'bob@127.0.0.1:0/0/1/0/f20/0-1-data')
+        self.assertEqual(packet_out.normalize_packet_id('Identity'), 'identity')
+        p1 = self._queue_packet('hans@second.net:0/0/1/0/F20/0-1-Data')
+        p2 = self._queue_packet('master$hans@second.net:0/0/1/0/F20/1-1-Data')
+        self.assertEqual(self._search_response('master$hans@first.com:0/0/1/0/F20/0-1-Data', hans1), [p1])
+        self.assertEqual(self._search_response('hans@first.com:0/0/1/0/F20/1-1-Data', hans1), [p2])
+
+    def test_cache_cleared_on_my_identity_rotated(self):
+        self.assertEqual(packet_out.my_rotated_customers(), {
+            'hans@first.com': 'hans@second.net',
+            'hans@second.net': 'hans@second.net',
+        })
+        p = self._queue_packet('master$hans@second.net:0/0/1/0/F20/0-1-Data')
+        # my identity is rotated again: from second.net to third.org
+        self._cache_identity(_hans3_identity_xml)
+        my_id.getIDURL = lambda: id_url.field(hans3)
+        self.assertNotIn('hans@third.org', packet_out.my_rotated_customers())
+        events.send('my-identity-rotated', fast=True)
+        self.assertEqual(packet_out.my_rotated_customers(), {
+            'hans@first.com': 'hans@third.org',
+            'hans@second.net': 'hans@third.org',
+            'hans@third.org': 'hans@third.org',
+        })
+        self.assertEqual(p.normalized_packet_id, 'master$hans@third.org:0/0/1/0/f20/0-1-data')
+        self.assertEqual(list(packet_out._OutboxByNormalizedPacketID.keys()), [p.normalized_packet_id])
+        self.assertEqual(self._search_response('master$hans@first.com:0/0/1/0/F20/0-1-Data', hans1), [p])
+        self.assertEqual(self._search_response('master$hans@third.org:0/0/1/0/F20/0-1-Data', hans3), [p])
@@ -1,8 +1,16 @@
 from unittest import TestCase
+import os
 import time
+import array
+import shutil
+import tempfile
 
 import subprocess
 
+from bitdust.raid import eccmap
+from bitdust.raid import raidutils
+from bitdust.raid import make
+
 
 class TestMakeRead(TestCase):
 
@@ -62,3 +70,63 @@ class TestMakeRead(TestCase):
 
     def test_small_file(self):
         self._test_file('bitdust.png')
+
+
+class TestBuildParity(TestCase):
+
+    def _test_parity(self, ecc_map_name, seglength):
+        myeccmap = eccmap.eccmap(ecc_map_name)
+        segments = [os.urandom(seglength) for _ in range(myeccmap.datasegments)]
+        sds = {}
+        for seg_num, seg in enumerate(segments):
+            values = array.array('i', seg)
+            values.byteswap()
+            sds[seg_num] = iter(values)
+        expected = raidutils.build_parity(sds, int(seglength/4), myeccmap.datasegments, myeccmap, myeccmap.paritysegments)
+        result = raidutils.build_parity_bulk([memoryview(seg) for seg in segments], seglength, myeccmap, chunk_size=1024)
+        self.assertEqual(sorted(expected.keys()), sorted(result.keys()))
+        for PSegNum in expected.keys():
+            self.assertEqual(expected[PSegNum].tobytes(), bytes(result[PSegNum]))
+
+    def test_parity_4x4(self):
+        self._test_parity('ecc/4x4', 4*1000)
+
+    def test_parity_18x18(self):
+        self._test_parity('ecc/18x18', 4*3333)
+
+
+class TestMakeFromBuffer(TestCase):
+
+    def setUp(self):
+        self.dir_to_test = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_to_test)
+
+    def _test_make(self, ecc_map_name, size):
+        data = os.urandom(size)
+        source_file = os.path.join(self.dir_to_test, 'source')
+        with open(source_file, 'wb') as f:
+            f.write(data)
+        dir_from_file = os.path.join(self.dir_to_test, 'from_file')
+        dir_from_buffer = os.path.join(self.dir_to_test, 'from_buffer')
+        expected = make.do_in_memory(source_file, ecc_map_name, 'myID_ABC', 100, dir_from_file)
+        result = make.do_from_buffer('source', data, ecc_map_name, 'myID_ABC', 100, dir_from_buffer)
+        self.assertNotEqual(expected, (-1, -1))
+        self.assertEqual(expected, result)
+        self.assertEqual(sorted(os.listdir(dir_from_file)), sorted(os.listdir(dir_from_buffer)))
+        for filename in os.listdir(dir_from_file):
+            with open(os.path.join(dir_from_file, filename), 'rb') as f1:
+                with open(os.path.join(dir_from_buffer, filename), 'rb') as f2:
+                    self.assertEqual(f1.read(), f2.read(), filename)
+
+    def test_unaligned_4x4(self):
+        for size in (1, 15, 16*100 + 3, 16*1000 - 1):
+            self._test_make('ecc/4x4', size)
+
+    def test_unaligned_18x18(self):
+        for size in (5, 72*50 + 71, 72*333 + 1):
+            self._test_make('ecc/18x18', size)
+
+    def test_aligned(self):
+        self._test_make('ecc/4x4', 16*100)
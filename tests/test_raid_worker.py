@@ -15,6 +15,7 @@ from bitdust.logs import lg
 from bitdust.system import bpio
 
 from bitdust.main import settings
+from bitdust.main import config
 
 
 class TestRaidWorker(TestCase):
@@ -342,13 +343,36 @@ class TestRaidWorker(TestCase):
             try_rebuild=True,
         )
 
-    def test_task_cancel(self):
+    def test_ecc18x18_with_5_dead_suppliers_success_child_processes(self):
+        enabled = config.conf().getBool('services/rebuilding/child-processes-enabled', False)
+        ncpus = config.conf().getInt('services/rebuilding/child-processes-ncpus', 0)
+        config.conf().setBool('services/rebuilding/child-processes-enabled', True)
+        config.conf().setInt('services/rebuilding/child-processes-ncpus', 2)
+
+        def _restore(result):
+            config.conf().setBool('services/rebuilding/child-processes-enabled', enabled)
+            config.conf().setInt('services/rebuilding/child-processes-ncpus', ncpus)
+            return result
+
+        d = self._test_make_rebuild_read(
+            target_ecc_map='ecc/18x18',
+            num_suppliers=18,
+            dead_suppliers=5,
+            rebuild_one_success=True,
+            read_success=True,
+            filesize=50000,
+            try_rebuild=True,
+        )
+        d.addBoth(_restore)
+        return d
+
+    def _test_task_cancel(self, source_size, cancel_delay, expect_running):
         test_result = Deferred()
         os.system('rm -rf /tmp/source.txt')
         os.system('rm -rf /tmp/destination.txt')
         os.system('rm -rf /tmp/raidtest')
         os.system("mkdir -p '/tmp/raidtest/master$alice@somehost.com/0/F12345678'")
-        open('/tmp/source1.txt', 'w').write(base64.b64encode(os.urandom(1000000)).decode())
+        open('/tmp/source1.txt', 'w').write(base64.b64encode(os.urandom(source_size)).decode())
         reactor.callWhenRunning(raid_worker.A, 'init')  # @UndefinedVariable
 
         def _task_failed(c, t, r):
@@ -361,6 +385,13 @@ class TestRaidWorker(TestCase):
             else:
                 reactor.callLater(0.1, test_result.errback, Exception('task expected to fail, but positive result was returned'))  # @UndefinedVariable
 
+        def _cancel():
+            is_running = bool(raid_worker.A().activetasks) and not raid_worker.A().processor.tasks
+            if is_running != expect_running:
+                test_result.errback(Exception('task running=%r at the moment of cancel, expected %r' % (is_running, expect_running)))
+                return
+            raid_worker.cancel_task('make', '/tmp/source1.txt')
+
         reactor.callLater(  # @UndefinedVariable
             0.5,
             raid_worker.add_task,
@@ -374,6 +405,13 @@ class TestRaidWorker(TestCase):
             ),
             _task_failed,
         )
-        reactor.callLater(0.55, raid_worker.cancel_task, 'make', '/tmp/source1.txt')  # @UndefinedVariable
+        reactor.callLater(cancel_delay, _cancel)  # @UndefinedVariable
 
         return test_result
+
+    def test_task_cancel(self):
+        # source file must be big enough to be still processed at the moment of cancel
+        return self._test_task_cancel(source_size=20000000, cancel_delay=0.55, expect_running=True)
+
+    def test_task_cancel_queued(self):
+        return self._test_task_cancel(source_size=1000000, cancel_delay=0.5, expect_running=False)
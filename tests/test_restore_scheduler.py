@@ -0,0 +1,80 @@
+import time
+
+from unittest import TestCase
+
+from bitdust.raid import eccmap
+
+from bitdust.storage import restore_scheduler
+from bitdust.storage import restore_worker
+
+
+class _FakePacket(object):
+
+    def __init__(self, packet_id, payload):
+        self.PacketID = packet_id
+        self.Payload = payload
+
+
+class TestRestoreScheduler(TestCase):
+
+    def setUp(self):
+        restore_scheduler.shutdown()
+        self.ecc_map = eccmap.eccmap('ecc/4x4')
+        self.all_fragments = [(i, d) for i in range(4) for d in ('Data', 'Parity')]
+
+    def tearDown(self):
+        restore_scheduler.shutdown()
+
+    def test_select_all_data_when_speed_is_equal(self):
+        selected = restore_scheduler.select_fragments(self.ecc_map, [0]*4, [0]*4, self.all_fragments, [1.0]*4)
+        self.assertEqual(sorted(selected), [(0, 'Data'), (1, 'Data'), (2, 'Data'), (3, 'Data')])
+
+    def test_slow_supplier_replaced_with_parity(self):
+        selected = restore_scheduler.select_fragments(self.ecc_map, [0]*4, [0]*4, self.all_fragments, [100.0, 100.0, 100.0, 1.0])
+        self.assertNotIn((3, 'Data'), selected)
+        self.assertNotIn((3, 'Parity'), selected)
+        self.assertEqual(len(selected), 4)
+        data = [1 if (i, 'Data') in selected else 0 for i in range(4)]
+        parity = [1 if (i, 'Parity') in selected else 0 for i in range(4)]
+        self.assertTrue(self.ecc_map.Fixable(data, parity))
+
+    def test_pending_and_not_fixable(self):
+        self.assertEqual(restore_scheduler.select_fragments(self.ecc_map, [1]*4, [0]*4, self.all_fragments, [1.0]*4), [])
+        selected = restore_scheduler.select_fragments(self.ecc_map, [1, 1, 1, 0], [0]*4, [(0, 'Parity'), (3, 'Parity')], [1.0]*4)
+        self.assertEqual(len(selected), 1)
+        self.assertEqual(restore_scheduler.select_fragments(self.ecc_map, [0]*4, [0]*4, [(0, 'Data')], [1.0]*4), [(0, 'Data')])
+
+    def test_suppliers_stats(self):
+        alice = 'http://127.0.0.1:8084/alice.xml'
+        bob = 'http://127.0.0.1:8084/bob.xml'
+        self.assertIsNone(restore_scheduler.latency_percentile(90))
+        self.assertEqual(restore_scheduler.hedge_delay(90), restore_scheduler._DefaultHedgeDelay)
+        for i in range(10):
+            restore_scheduler.on_request_finished(alice, 1000, 1.0)
+        restore_scheduler.on_request_finished(bob, 1000, 10.0)
+        self.assertEqual(restore_scheduler.supplier_throughput(alice), 1000.0)
+        self.assertEqual(restore_scheduler.suppliers_speed([alice, bob, None]), [1000.0, 100.0, 1000.0])
+        self.assertEqual(restore_scheduler.latency_percentile(50), 1.0)
+        self.assertEqual(restore_scheduler.latency_percentile(95), 10.0)
+        self.assertEqual(restore_scheduler.hedge_delay(50), restore_scheduler._MinHedgeDelay)
+        restore_scheduler.on_request_failed(bob)
+        self.assertEqual(restore_scheduler.supplier_throughput(bob), 70.0)
+
+    def test_result_for_already_restored_block(self):
+        alice = 'http://127.0.0.1:8084/alice.xml'
+        bob = 'http://127.0.0.1:8084/bob.xml'
+        worker = restore_worker.RestoreWorker('master$alice@127.0.0.1_8084:1/F1234', None, ecc_map=self.ecc_map)
+        try:
+            worker.block_number = 3
+            packet_id1 = 'master$alice@127.0.0.1_8084:1/F1234/1-0-Data'
+            packet_id2 = 'master$alice@127.0.0.1_8084:1/F1234/1-1-Data'
+            worker.requests_started[packet_id1] = (time.time() - 1.0, alice)
+            worker.requests_started[packet_id2] = (time.time() - 1.0, bob)
+            worker._on_packet_request_result(_FakePacket(packet_id1, b'x'*1000), 'received')
+            worker._on_packet_request_result(packet_id2, 'failed')
+            self.assertEqual(worker.requests_started, {})
+            self.assertGreater(restore_scheduler.supplier_throughput(alice), 0)
+            self.assertEqual(restore_scheduler._supplier_stats(alice)['received'], 1)
+            self.assertEqual(restore_scheduler._supplier_stats(bob)['failed'], 1)
+        finally:
+            worker.destroy()
@@ -162,3 +162,69 @@ class Test(TestCase):
         data2 = b2.Data()
         self.assertEqual(data1, data2)
         self.assertEqual(raw1, raw2)
+
+    def test_signed_packet_binary(self):
+        key.InitMyKey()
+        data1 = os.urandom(1024)
+        p1 = signed.Packet(
+            'Data',
+            my_id.getIDURL(),
+            my_id.getIDURL(),
+            'SomeID',
+            data1,
+            'RemoteID:abc',
+        )
+        raw1 = p1.Serialize(binary=True)
+        self.assertLess(len(raw1), len(p1.Serialize()))
+
+        p2 = signed.Unserialize(raw1)
+        self.assertTrue(p2.Valid())
+        self.assertEqual(data1, p2.Payload)
+        self.assertEqual(raw1, p2.Serialize(binary=True))
+        self.assertEqual(p1.Serialize(), p2.Serialize())
+
+    def test_encrypted_block_binary(self):
+        key.InitMyKey()
+        data1 = os.urandom(1024)
+        b1 = encrypted.Block(
+            CreatorID=my_id.getIDURL(),
+            BackupID='BackupABC',
+            BlockNumber=123,
+            SessionKey=key.NewSessionKey(session_key_type=key.SessionKeyType()),
+            SessionKeyType=key.SessionKeyType(),
+            LastBlock=False,
+            Data=data1,
+        )
+        raw1 = b1.Serialize(binary=True)
+        self.assertLess(len(raw1), len(b1.Serialize()))
+
+        b2 = encrypted.Unserialize(raw1)
+        self.assertTrue(b2.Valid())
+        self.assertEqual(data1, b2.Data())
+        self.assertEqual(b2.BlockNumber, 123)
+        self.assertFalse(b2.LastBlock)
+        self.assertEqual(raw1, b2.Serialize(binary=True))
+        self.assertEqual(b1.Serialize(), b2.Serialize())
+
+    def test_serialized_source_json_fallback(self):
+        key.InitMyKey()
+        self.assertFalse(settings.getBackupBinaryBlocksEnabled())
+        data1 = os.urandom(1024)
+        p1 = signed.Packet(
+            'Data',
+            my_id.getIDURL(),
+            my_id.getIDURL(),
+            'SomeID',
+            data1,
+            'RemoteID:abc',
+        )
+        raw1 = p1.Serialize(binary=True)
+        p2 = signed.Unserialize(raw1)
+        self.assertEqual(p2.SerializedSource(), raw1)
+        self.assertEqual(p2.SerializedSource(binary=False), p1.Serialize())
+        p3 = signed.Unserialize(p2.SerializedSource(binary=False))
+        self.assertTrue(p3.Valid())
+        self.assertEqual(p3.SerializedSource(binary=False), p1.Serialize())
+        self.assertEqual(p2.SerializedSource(release=True), raw1)
+        self.assertIsNone(p2._raw)
+        self.assertEqual(p2.SerializedSource(binary=True), p2.Serialize())
@@ -0,0 +1,54 @@
+from twisted.trial.unittest import TestCase
+from twisted.internet.defer import DeferredList
+
+from bitdust.crypt import rsa_key
+from bitdust.crypt import signature_verifier
+
+
+class TestSignatureVerifier(TestCase):
+
+    def setUp(self):
+        self.key_object = rsa_key.RSAKey()
+        self.key_object.generate(1024)
+        self.pubkey = self.key_object.toPublicString()
+        self.inline_rate_limit = signature_verifier._InlineRateLimit
+
+    def tearDown(self):
+        signature_verifier._InlineRateLimit = self.inline_rate_limit
+        signature_verifier.shutdown()
+
+    def _make_items(self, count):
+        items = []
+        for i in range(count):
+            msg = b'message %d' % i
+            sig = self.key_object.sign(msg)
+            if i % 3 == 0:
+                msg += b'X'
+            items.append((self.pubkey, msg, sig))
+        return items
+
+    def test_inline(self):
+        results = []
+        for params in self._make_items(4):
+            signature_verifier.verify_signature(b'alice', params).addCallback(results.append)
+        signature_verifier.verify_signature(b'alice', None).addCallback(results.append)
+        self.assertEqual(results, [False, True, True, False, False])
+
+    def test_child_processes_keep_order(self):
+        self.assertTrue(signature_verifier.init(ncpus=2))
+        signature_verifier._InlineRateLimit = 0
+        results = {b'alice': [], b'bob': []}
+        dl = []
+        items = self._make_items(60)
+        for i in range(len(items)):
+            peer = b'alice' if i % 2 else b'bob'
+            d = signature_verifier.verify_signature(peer, items[i])
+            d.addCallback(lambda result, peer=peer, i=i: results[peer].append((i, result)))
+            dl.append(d)
+
+        def _check(_):
+            self.assertEqual(results[b'alice'], [(i, bool(i % 3)) for i in range(1, 60, 2)])
+            self.assertEqual(results[b'bob'], [(i, bool(i % 3)) for i in range(0, 60, 2)])
+            self.assertGreater(signature_verifier.counters()['batches'], 0)
+
+        return DeferredList(dl).addCallback(_check)